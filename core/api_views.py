@@ -1,268 +1,420 @@
-"""统一API视图模块 - 用于处理产品数据的API请求"""
+"""统一API视图模块 - 用于处理产品数据的API请求
 
-from django.http import JsonResponse
+图表接口（chart-data、moving-range、capability-analysis、subgroup、spc）按 Accept 头返回 JSON 或 MessagePack；
+capability-matrix 返回 JSON 或 xlsx 文件。
+"""
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
-from django.db.models import Q
-from products.models import DryFilmProduct, AdhesiveProduct
+from core.schema import get_family
 from core.utils import (
-    calculate_statistics, get_product_field_value, calculate_moving_range_data,
-    calculate_capability_analysis, get_batch_date
+    calculate_statistics, calculate_moving_range_data, calculate_capability_analysis,
+    as_float_array, fetch_series
+)
+from core.capability import (
+    MATRIX_FIELDS, XLSX_TYPE, cached_capability_intervals, capability_matrix, intervals_complete, matrix_workbook,
+    parse_interval_options, sort_matrix
 )
+from core.cache import cache_stats, cached_value, cached_api, mark_uncacheable, param_keys, whole_scope
+from core.conditional import conditional_api
+from core import rollup
+from core.rejudge import rejudge_status
+from core.downsample import parse_max_points
+from core.encoding import api_response
+from core.subgroup import build_subgroup_payload, parse_subgroup_options
+from core.search import parse_fields, parse_limit, search_page, search_queryset
+from core.spc import SPC_PRODUCT_TYPES, build_filters, build_spc_payload, parse_parts, sample_series, sampled
+from core.ingest import INGEST_FAMILIES, Ingestor, parse_body, summarize
+
+def _series_request(request, product_type):
+    """解析图表接口的筛选参数，返回按日期排序的查询集、日期字段和检测项目
+
+    product_type 或 test_item 无效时抛出 ValueError。
+    """
+    spec = SPC_PRODUCT_TYPES.get(product_type)
+    if spec is None:
+        raise ValueError('Invalid product type')
+    
+    test_item = request.GET.get('test_item')
+    item = get_family(product_type).numeric(test_item)
+    if item is None:
+        raise ValueError(f'无效的检测项目: {test_item}')
+    
+    date_field = spec['date_field']
+    filters = build_filters(
+        date_field,
+        product_code=request.GET.get('product_code'),
+        production_line=request.GET.get('production_line'),
+        start_date=request.GET.get('start_date'),
+        end_date=request.GET.get('end_date'),
+    )
+    queryset = spec['model'].objects.filter(**filters).order_by(date_field, 'batch_number')
+    return queryset, date_field, item
+
+def _series_source(request, product_type):
+    """图表接口依赖的记录，用于生成 ETag"""
+    spec = SPC_PRODUCT_TYPES.get(product_type)
+    if spec is None:
+        return None
+    return spec['model'].objects.filter(**build_filters(
+        spec['date_field'],
+        product_code=request.GET.get('product_code'),
+        production_line=request.GET.get('production_line'),
+        batch_number=request.GET.get('batch_number'),
+        start_date=request.GET.get('start_date'),
+        end_date=request.GET.get('end_date'),
+    ))
 
+def _search_params(request):
+    return dict(
+        match=request.GET.get('match') or 'contains',
+        product_code=request.GET.get('product_code'),
+        batch_number=request.GET.get('batch_number'),
+        production_line=request.GET.get('production_line'),
+        start_date=request.GET.get('start_date'),
+        end_date=request.GET.get('end_date'),
+    )
+
+def _search_source(request, product_type):
+    return search_queryset(product_type, **_search_params(request))
+
+def _trend_source(request, family):
+    """趋势接口依赖的原始记录：汇总表与记录在同一事务中更新"""
+    spec = rollup.ROLLUP_FAMILIES.get(family)
+    if spec is None:
+        return None
+    filters = {}
+    for param, lookup in (('code', spec['code']), ('line', spec['line']),
+                          ('start_date', f"{spec['date']}__gte"), ('end_date', f"{spec['date']}__lte")):
+        if request.GET.get(param):
+            filters[lookup] = request.GET.get(param)
+    return spec['model'].objects.filter(**filters)
+
+def _trend_scope(request, family):
+    spec = rollup.ROLLUP_FAMILIES.get(family)
+    return spec['scope'] if spec else None
+
+@conditional_api(_series_source, 'product', param_keys('product_code'))
+@cached_api('product', param_keys('product_code'))
 def get_product_data(request, product_type):
-    """获取产品图表数据的统一API"""
+    """获取产品图表数据的统一API
+
+    可选参数 max_points 指定返回的最大点数，超过时按 LTTB 降采样，统计量仍使用全部数据。
+    """
     if request.method != 'GET':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
     try:
-        # 获取筛选参数
-        product_code = request.GET.get('product_code')
-        production_line = request.GET.get('production_line')
-        test_item = request.GET.get('test_item')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
+        queryset, date_field, item = _series_request(request, product_type)
+        max_points = parse_max_points(request.GET.get('max_points'))
         
-        # 确定产品模型和字段映射
-        if product_type == 'dryfilm':
-            model = DryFilmProduct
-            date_field = 'test_date'
-        elif product_type == 'adhesive':
-            model = AdhesiveProduct
-            date_field = 'physical_test_date'
-        else:
-            return JsonResponse({'error': 'Invalid product type'}, status=400)
+        # 只查询批号、日期和检测值三列
+        labels, values = fetch_series(queryset, date_field, item.column)
+        statistics = calculate_statistics(values)
+        indices = sample_series(values, max_points, request.GET.get('product_code'), item.name, statistics)
         
-        # 构建查询条件
-        filters = {}
-        if product_code:
-            filters['product_code'] = product_code
-        if production_line:
-            filters['production_line'] = production_line
-        if start_date:
-            filters[f'{date_field}__gte'] = start_date
-        if end_date:
-            filters[f'{date_field}__lte'] = end_date
-        
-        # 查询数据
-        queryset = model.objects.filter(**filters).order_by(date_field, 'batch_number')
-        
-        # 准备图表数据
-        labels = []
-        data = []
-        
-        for product in queryset:
-            labels.append(get_batch_date(product, date_field))
-            value = get_product_field_value(product, test_item, product_type)
-            data.append(value)
-        
-        # 计算统计信息
-        statistics = calculate_statistics(data)
-        
-        response_data = {
+        response_data = sampled({
             'labels': labels,
-            'data': data,
+            'data': values,
             'statistics': statistics
-        }
+        }, indices, len(labels), ['labels', 'data'])
         
-        return JsonResponse(response_data)
+        return api_response(request, response_data)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+@conditional_api(_search_source, 'product')
+@cached_api('product', whole_scope)
 def search_products(request, product_type):
-    """产品查询功能的统一API"""
+    """产品查询功能的统一API，按 (日期倒序, 批号) 游标分页
+
+    可选参数：fields 返回的字段（逗号分隔）、limit 每页数量、cursor 上一页返回的 next_cursor、
+    match 牌号和批号的匹配方式（contains 模糊匹配，prefix 前缀匹配，可以使用索引）。
+    """
     if request.method != 'GET':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
+    if product_type not in SPC_PRODUCT_TYPES:
+        return JsonResponse({'error': 'Invalid product type'}, status=400)
+    
     try:
-        # 获取查询参数
-        product_code = request.GET.get('product_code')
-        batch_number = request.GET.get('batch_number')
-        production_line = request.GET.get('production_line')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        
-        # 确定产品模型和字段映射
-        if product_type == 'dryfilm':
-            model = DryFilmProduct
-            date_field = 'test_date'
-            judgment_fields = ['external_final_judgment', 'internal_final_judgment']
-        elif product_type == 'adhesive':
-            model = AdhesiveProduct
-            date_field = 'physical_test_date'
-            judgment_fields = ['physical_judgment', 'tape_judgment', 'final_judgment']
-        else:
-            return JsonResponse({'error': 'Invalid product type'}, status=400)
-        
-        # 构建查询条件
-        filters = {}
-        if product_code:
-            filters['product_code__icontains'] = product_code
-        if batch_number:
-            filters['batch_number__icontains'] = batch_number
-        if production_line:
-            filters['production_line'] = production_line
-        if start_date:
-            filters[f'{date_field}__gte'] = start_date
-        if end_date:
-            filters[f'{date_field}__lte'] = end_date
-        
-        # 查询数据
-        products = model.objects.filter(**filters).order_by(f'-{date_field}', 'batch_number')
-        
-        # 转换为JSON格式
-        product_list = []
-        for product in products:
-            product_data = {
-                'id': product.id,
-                'product_code': product.product_code,
-                'batch_number': product.batch_number,
-                'production_line': product.production_line,
-                'test_date': getattr(product, date_field).strftime('%Y-%m-%d'),
-                'judgment_status': product.judgment_status,
-            }
-            
-            # 添加判定字段
-            for field in judgment_fields:
-                if hasattr(product, field):
-                    product_data[field] = getattr(product, field)
-            
-            # 添加检测数据字段
-            if product_type == 'dryfilm':
-                product_data.update({
-                    'inspector': product.inspector,
-                    'solid_content': product.solid_content,
-                    'viscosity': product.viscosity,
-                    'acid_value': product.acid_value,
-                })
-            elif product_type == 'adhesive':
-                product_data.update({
-                    'physical_inspector': product.physical_inspector,
-                    'tape_inspector': product.tape_inspector,
-                    'solid_content': product.solid_content,
-                    'viscosity': product.viscosity,
-                    'acid_value': product.acid_value,
-                })
-            
-            product_list.append(product_data)
-        
-        return JsonResponse({'products': product_list})
+        page = search_page(
+            product_type,
+            fields=parse_fields(product_type, request.GET.get('fields')),
+            cursor=request.GET.get('cursor'),
+            limit=parse_limit(request.GET.get('limit')),
+            **_search_params(request),
+        )
+        return JsonResponse(page)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+@conditional_api(_series_source, 'product', param_keys('product_code'))
+@cached_api('product', param_keys('product_code'))
 def get_moving_range_data(request, product_type):
-    """获取移动极差图数据的统一API"""
+    """获取移动极差图数据的统一API
+
+    可选参数 max_points 指定返回的最大点数，超过时按 LTTB 降采样，统计量仍使用全部数据。
+    """
     if request.method != 'GET':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
     try:
-        # 获取筛选参数
-        product_code = request.GET.get('product_code')
-        production_line = request.GET.get('production_line')
-        test_item = request.GET.get('test_item')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-        
-        # 确定产品模型和字段映射
-        if product_type == 'dryfilm':
-            model = DryFilmProduct
-            date_field = 'test_date'
-        elif product_type == 'adhesive':
-            model = AdhesiveProduct
-            date_field = 'physical_test_date'
-        else:
-            return JsonResponse({'error': 'Invalid product type'}, status=400)
-        
-        # 构建查询条件
-        filters = {}
-        if product_code:
-            filters['product_code'] = product_code
-        if production_line:
-            filters['production_line'] = production_line
-        if start_date:
-            filters[f'{date_field}__gte'] = start_date
-        if end_date:
-            filters[f'{date_field}__lte'] = end_date
-        
-        # 查询数据并按测试日期排序
-        queryset = model.objects.filter(**filters).order_by(date_field, 'batch_number')
-        
-        # 准备移动极差数据
-        labels = []
-        data_values = []
-        
-        for product in queryset:
-            labels.append(get_batch_date(product, date_field))
-            value = get_product_field_value(product, test_item, product_type)
-            data_values.append(value)
+        queryset, date_field, item = _series_request(request, product_type)
+        max_points = parse_max_points(request.GET.get('max_points'))
+        labels, values = fetch_series(queryset, date_field, item.column)
         
         # 计算移动极差
-        moving_range_result = calculate_moving_range_data(data_values)
+        moving_range_result = calculate_moving_range_data(values)
+        indices = sample_series(
+            values, max_points, request.GET.get('product_code'), item.name,
+            moving_range_statistics=moving_range_result['statistics']
+        )
         
-        response_data = {
+        response_data = sampled({
             'labels': labels,
-            'data_values': data_values,
+            'data_values': values,
             'moving_ranges': moving_range_result['moving_ranges'],
             'statistics': moving_range_result['statistics']
-        }
+        }, indices, len(labels), ['labels', 'data_values', 'moving_ranges'])
         
-        return JsonResponse(response_data)
+        return api_response(request, response_data)
         
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+@conditional_api(_series_source, 'product', param_keys('product_code'))
+@cached_api('product', param_keys('product_code'))
 def get_capability_analysis_data(request, product_type):
-    """获取能力分析正态分布图数据的统一API"""
+    """获取能力分析正态分布图数据的统一API
+
+    可选参数 interval（analytic/bootstrap）返回 Cp/Cpk 的置信区间 confidence_intervals，
+    confidence 为置信水平，resamples 为 bootstrap 重抽样次数，见 core.capability。
+    """
     if request.method != 'GET':
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
     try:
-        # 获取筛选参数
+        queryset, date_field, item = _series_request(request, product_type)
+        interval_options = parse_interval_options(request.GET)
+        
+        # 只取不为空的检测值
+        values = as_float_array(
+            queryset.exclude(**{f'{item.column}__isnull': True}).values_list(item.column, flat=True)
+        )
+        
+        # 计算能力分析
         product_code = request.GET.get('product_code')
-        production_line = request.GET.get('production_line')
-        test_item = request.GET.get('test_item')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
+        capability_data = calculate_capability_analysis(values, product_code, item.name)
         
-        # 确定产品模型和字段映射
-        if product_type == 'dryfilm':
-            model = DryFilmProduct
-            date_field = 'test_date'
-        elif product_type == 'adhesive':
-            model = AdhesiveProduct
-            date_field = 'physical_test_date'
-        else:
-            return JsonResponse({'error': 'Invalid product type'}, status=400)
+        if interval_options:
+            statistics = capability_data['statistics']
+            cache_name = '|'.join([product_type, item.name] + [
+                request.GET.get(name, '') for name in ('product_code', 'production_line', 'start_date', 'end_date')
+            ])
+            intervals = cached_capability_intervals(
+                cache_name, [product_code] if product_code else [], values,
+                statistics['usl'], statistics['lsl'], statistics['cp'], statistics['cpk'], **interval_options
+            )
+            capability_data['confidence_intervals'] = intervals
+            if not intervals_complete(intervals, interval_options['resamples']):
+                # 受时间预算截断的 bootstrap 结果不缓存，下次请求重新计算
+                return mark_uncacheable(api_response(request, capability_data))
         
-        # 构建查询条件
-        filters = {}
-        if product_code:
-            filters['product_code'] = product_code
-        if production_line:
-            filters['production_line'] = production_line
-        if start_date:
-            filters[f'{date_field}__gte'] = start_date
-        if end_date:
-            filters[f'{date_field}__lte'] = end_date
+        return api_response(request, capability_data)
+        
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@conditional_api(_series_source, 'product', param_keys('product_code'))
+def get_capability_matrix(request, product_type):
+    """全部 (牌号, 检测项目) 的过程能力矩阵：样本数、均值、标准差、Cp/Cpk 和超规格率
+
+    筛选参数与图表接口相同（product_code、production_line、start_date、end_date），
+    sort 指定排序字段、order=desc 时降序，format=xlsx 时导出为 Excel 文件。
+    矩阵按数据版本缓存，排序和导出使用缓存的结果。
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if product_type not in SPC_PRODUCT_TYPES:
+        return JsonResponse({'error': 'Invalid product type'}, status=400)
+
+    filters = {
+        name: request.GET.get(name) or None
+        for name in ('product_code', 'production_line', 'start_date', 'end_date')
+    }
+    sort = request.GET.get('sort')
+    descending = request.GET.get('order') == 'desc'
+    try:
+        rows = cached_value(
+            'product',
+            'capability_matrix:' + '|'.join([product_type] + [value or '' for value in filters.values()]),
+            lambda: capability_matrix(product_type, **filters),
+            keys=[filters['product_code']] if filters['product_code'] else [],
+        )
+        rows = sort_matrix(rows, sort, descending)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if request.GET.get('format') == 'xlsx':
+        response = HttpResponse(matrix_workbook(rows, f'{product_type}能力矩阵'), content_type=XLSX_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="{product_type}_capability_matrix.xlsx"'
+        return response
+
+    return JsonResponse({
+        'product_type': product_type,
+        'fields': MATRIX_FIELDS,
+        'rows': rows,
+        'sort': sort,
+        'order': 'desc' if descending else 'asc',
+    })
+
+@conditional_api(_series_source, 'product', param_keys('product_code'))
+@cached_api('product', param_keys('product_code'))
+def get_subgroup_data(request, product_type):
+    """X̄-R / X̄-S 控制图数据的统一API
+
+    子组划分参数：subgroup_by（count/time/batch）、subgroup_size、window、prefix_length、chart，
+    见 core.subgroup.parse_subgroup_options。
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        queryset, date_field, item = _series_request(request, product_type)
+        options = parse_subgroup_options(request.GET)
+        rows = list(queryset.values_list(date_field, 'batch_number', item.column))
+        payload = build_subgroup_payload(
+            as_float_array([row[2] for row in rows]),
+            [row[0] for row in rows], [row[1] for row in rows], **options
+        )
+        return api_response(request, payload)
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@conditional_api(_series_source, 'product', param_keys('product_code'))
+@cached_api('product', param_keys('product_code'))
+def get_spc_data(request, product_type):
+    """SPC 组合数据的统一API：一次查询返回单值图、移动极差、能力分析和查询结果
+
+    可选参数 parts 指定需要的部分（series, moving_range, capability, search，逗号分隔），默认全部返回；
+    max_points 指定单值图和移动极差图的最大点数，超过时按 LTTB 降采样。
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    if product_type not in SPC_PRODUCT_TYPES:
+        return JsonResponse({'error': 'Invalid product type'}, status=400)
+    
+    try:
+        payload = build_spc_payload(
+            product_type,
+            test_item=request.GET.get('test_item'),
+            parts=parse_parts(request.GET.get('parts')),
+            max_points=parse_max_points(request.GET.get('max_points')),
+            product_code=request.GET.get('product_code'),
+            production_line=request.GET.get('production_line'),
+            batch_number=request.GET.get('batch_number'),
+            start_date=request.GET.get('start_date'),
+            end_date=request.GET.get('end_date'),
+        )
+        return api_response(request, payload)
         
-        # 查询数据
-        queryset = model.objects.filter(**filters).order_by(date_field, 'batch_number')
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+@conditional_api(_trend_source, _trend_scope)
+def get_trend_data(request, family):
+    """按日/月/年的趋势数据，从每日汇总表读取，适合长时间范围的查询
+
+    参数：test_item（'*' 表示只统计记录数和判定结果）、code、line、start_date、end_date、
+    bucket（day/month/year，默认 month）。
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    if family not in rollup.ROLLUP_FAMILIES:
+        return JsonResponse({'error': 'Invalid product type'}, status=400)
+
+    test_item = request.GET.get('test_item', rollup.RECORD_ITEM)
+    if test_item != rollup.RECORD_ITEM and get_family(family).numeric(test_item) is None:
+        return JsonResponse({'error': f'无效的检测项目: {test_item}'}, status=400)
+
+    try:
+        series = rollup.trend_series(
+            family, test_item,
+            bucket=request.GET.get('bucket', 'month'),
+            code=request.GET.get('code'),
+            line=request.GET.get('line'),
+            start_date=request.GET.get('start_date'),
+            end_date=request.GET.get('end_date'),
+        )
+        return JsonResponse({'series': series})
+
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+def get_cache_stats(request):
+    """获取SPC接口结果缓存的命中统计"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    return JsonResponse(cache_stats())
+
+@login_required
+def get_rejudge_status(request):
+    """获取标准变更后重新判定任务的进度"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    return JsonResponse({'tasks': rejudge_status()})
+
+
+def _ingest_permissions(product_type):
+    """导入需要对应模型的新增和修改权限"""
+    opts = INGEST_FAMILIES[product_type]['model']._meta
+    return [f'{opts.app_label}.{action}_{opts.model_name}' for action in ('add', 'change')]
+
+def ingest_measurements(request, product_type):
+    """批量导入检测数据（NDJSON或CSV），按批号新增或更新并返回每行的处理结果
+
+    需要登录（会话认证，POST 需要 CSRF 令牌），并具有该类型模型的新增和修改权限，
+    未登录返回401，权限不足返回403。
+    可选参数：chunk_size 每个事务处理的行数，dry_run=1 只校验和判定不写入。
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    if product_type not in INGEST_FAMILIES:
+        return JsonResponse({'error': 'Invalid product type'}, status=400)
+    
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': '需要登录'}, status=401)
+    if not request.user.has_perms(_ingest_permissions(product_type)):
+        return JsonResponse({'error': '没有导入该类型数据的权限'}, status=403)
+    
+    try:
+        chunk_size = int(request.GET.get('chunk_size', 500))
+        if chunk_size < 1:
+            raise ValueError('chunk_size 必须大于0')
         
-        # 获取数据值
-        data_values = []
-        for product in queryset:
-            value = get_product_field_value(product, test_item, product_type)
-            if value is not None:
-                data_values.append(float(value))
+        ingestor = Ingestor(product_type, modified_by=request.user.username, dry_run=request.GET.get('dry_run') == '1')
         
-        # 计算能力分析
-        capability_data = calculate_capability_analysis(data_values, product_code, test_item)
+        rows = parse_body(request.body, request.content_type or '')
+        results = []
+        for outcomes in ingestor.ingest(rows, chunk_size=chunk_size):
+            results.extend(outcomes)
         
-        return JsonResponse(capability_data)
+        return JsonResponse({
+            'summary': summarize(results),
+            'ignored_columns': sorted(ingestor.unknown_columns),
+            'results': results,
+        })
         
     except Exception as e:
-        import traceback
-        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
         return JsonResponse({'error': str(e)}, status=400)
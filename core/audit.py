@@ -0,0 +1,162 @@
+"""判定漂移审计 - 只读地重新计算判定，找出存储结果与当前标准不一致的记录
+
+记录通过 iterator(chunk_size=...) 分块读取，在内存中重新判定，不写入数据库，
+也不使用 select_for_update，因此不会持有写锁。
+"""
+
+import csv
+from itertools import islice
+
+from products.judgment_engine import FAMILY_SPECS, judge_rows, measurement_fields
+from products.standards import get_standards_index
+from raw_materials.judgment import JUDGMENT_FIELDS as RAW_MATERIAL_JUDGMENT_FIELDS
+from raw_materials.models import RawMaterial
+from raw_materials.standards import RawMaterialStandardMatrix
+
+AUDIT_TYPES = {
+    'dryfilm': '干膜产品',
+    'adhesive': '胶粘剂产品',
+    'raw_material': '原料',
+}
+
+AUDIT_HEADER = ['类型', 'ID', '批号', '牌号/原料', '差异字段', '存储判定', '重新计算判定']
+TOTALS_HEADER = ['类型', '牌号/原料', '检查记录数', '判定不一致数']
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _summary(values, fields):
+    """判定字段（不含判定详情）拼接为一段文本"""
+    return ' / '.join(str(values[field]) for field in fields if field != 'judgment_details')
+
+
+def _count(totals, product_type, code, drifted):
+    entry = totals.setdefault((product_type, code), {'checked': 0, 'drifted': 0})
+    entry['checked'] += 1
+    entry['drifted'] += int(bool(drifted))
+
+
+def _product_drift(product_type, chunk_size, totals):
+    spec = FAMILY_SPECS[product_type]
+    model = spec['model']
+    value_fields = measurement_fields(product_type)
+    stored_fields = spec['judgment_fields'] + ['judgment_details']
+    stored_offset = 2 + len(value_fields) + 1
+    index = get_standards_index()
+
+    rows = (
+        model.objects.order_by('pk')
+        .values_list('pk', 'product_code', *value_fields, 'batch_number', *stored_fields)
+        .iterator(chunk_size=chunk_size)
+    )
+    for chunk in _chunks(rows, chunk_size):
+        results = judge_rows(product_type, chunk, value_fields, index)
+        for row, result in zip(chunk, results):
+            stored = dict(zip(stored_fields, row[stored_offset:]))
+            differing = [field for field in stored_fields if stored[field] != result[field]]
+            _count(totals, product_type, row[1], differing)
+            if differing:
+                yield {
+                    'product_type': product_type, 'id': row[0], 'batch_number': row[stored_offset - 1],
+                    'code': row[1], 'fields': differing,
+                    'stored': _summary(stored, stored_fields), 'recomputed': _summary(result, stored_fields),
+                }
+
+
+def _raw_material_drift(chunk_size, totals):
+    matrices = {}
+    materials = RawMaterial.objects.order_by('pk').iterator(chunk_size=chunk_size)
+    for chunk in _chunks(materials, chunk_size):
+        missing = {material.material_name for material in chunk} - matrices.keys()
+        if missing:
+            matrices.update(RawMaterialStandardMatrix.load_many(missing))
+
+        for material in chunk:
+            stored = {field: getattr(material, field) for field in RAW_MATERIAL_JUDGMENT_FIELDS}
+            # 只在内存中重新判定，不保存
+            material.calculate_judgment(matrices[material.material_name])
+            result = {field: getattr(material, field) for field in RAW_MATERIAL_JUDGMENT_FIELDS}
+            differing = [field for field in RAW_MATERIAL_JUDGMENT_FIELDS if stored[field] != result[field]]
+            _count(totals, 'raw_material', material.material_name, differing)
+            if differing:
+                yield {
+                    'product_type': 'raw_material', 'id': material.pk, 'batch_number': material.material_batch,
+                    'code': material.material_name, 'fields': differing,
+                    'stored': _summary(stored, RAW_MATERIAL_JUDGMENT_FIELDS),
+                    'recomputed': _summary(result, RAW_MATERIAL_JUDGMENT_FIELDS),
+                }
+
+
+def iter_drift(product_type, chunk_size=2000, totals=None):
+    """逐条生成判定不一致的记录；totals 不为空时按 (类型, 牌号) 累计检查数和不一致数"""
+    totals = {} if totals is None else totals
+    if product_type == 'raw_material':
+        return _raw_material_drift(chunk_size, totals)
+    return _product_drift(product_type, chunk_size, totals)
+
+
+def iter_audit_csv_rows(product_types, chunk_size=2000, totals=None):
+    """生成审计CSV的各行：不一致的记录，最后附上按牌号汇总的统计"""
+    totals = {} if totals is None else totals
+    yield AUDIT_HEADER
+    for product_type in product_types:
+        for drift in iter_drift(product_type, chunk_size, totals):
+            yield [
+                AUDIT_TYPES[drift['product_type']], drift['id'], drift['batch_number'], drift['code'],
+                ','.join(drift['fields']), drift['stored'], drift['recomputed'],
+            ]
+
+    yield []
+    yield TOTALS_HEADER
+    for (product_type, code), entry in sorted(totals.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+        yield [AUDIT_TYPES[product_type], code, entry['checked'], entry['drifted']]
+
+
+class _Echo:
+    """供 csv.writer 使用的伪文件，write 直接返回写入的内容"""
+
+    def write(self, value):
+        return value
+
+
+class JudgmentAuditMixin:
+    """为管理界面增加下载判定漂移审计CSV的页面"""
+
+    audit_product_type = None
+
+    def get_urls(self):
+        from django.urls import path
+        urls = super().get_urls()
+        opts = self.model._meta
+        custom_urls = [
+            path('judgment-audit/', self.admin_site.admin_view(self.judgment_audit_view),
+                 name=f'{opts.app_label}_{opts.model_name}_judgment_audit'),
+        ]
+        return custom_urls + urls
+
+    def judgment_audit_view(self, request):
+        """流式返回判定不一致记录的CSV，边计算边输出"""
+        from django.core.exceptions import PermissionDenied
+        from django.http import StreamingHttpResponse
+
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        writer = csv.writer(_Echo())
+
+        def stream():
+            # BOM 让 Excel 正确识别中文
+            yield '\ufeff'
+            for row in iter_audit_csv_rows([self.audit_product_type]):
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(stream(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{self.audit_product_type}_judgment_drift.csv"'
+        return response
@@ -0,0 +1,189 @@
+"""SPC 接口结果缓存 - 按规范化的筛选参数缓存JSON响应，数据写入时按牌号/原料精确失效
+
+每个缓存条目依赖一个或多个版本号：按牌号（原料名称）筛选的请求依赖该牌号的版本号，
+模糊匹配或未指定牌号的请求依赖整个范围的版本号。产品、原料或标准保存/删除后，
+只递增受影响牌号的版本号和范围版本号，旧条目不再被命中，等待过期淘汰。
+
+缓存后端由 settings.SPC_CACHE_ALIAS 指定；多进程部署时应使用文件或共享缓存后端，
+否则其他进程（包括管理命令）中的写入无法使本进程的缓存失效，只能等待条目过期。
+"""
+
+import hashlib
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+# 范围版本号使用的键：模糊匹配或未按牌号筛选的请求依赖它
+ALL = '*'
+
+STAT_KEYS = ('hits', 'misses')
+
+
+def _cache():
+    return caches[getattr(settings, 'SPC_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'SPC_CACHE_TIMEOUT', 300)
+
+
+def _version_key(scope, key):
+    digest = hashlib.md5(str(key).encode('utf-8')).hexdigest()
+    return f'spc:version:{scope}:{digest}'
+
+
+def _versions(scope, keys):
+    """读取各键的版本号；不存在时初始化为当前时间，避免被淘汰后复用旧条目"""
+    cache = _cache()
+    version_keys = [_version_key(scope, key) for key in keys]
+    versions = cache.get_many(version_keys)
+    for version_key in version_keys:
+        if version_key not in versions:
+            cache.add(version_key, time.time_ns(), None)
+            versions[version_key] = cache.get(version_key)
+    return [versions[version_key] for version_key in version_keys]
+
+
+def current_versions(scope, keys):
+    """当前的版本号，keys 为空时使用整个范围的版本号；用于生成 ETag 等依赖数据版本的标识"""
+    return _versions(scope, list(keys) or [ALL])
+
+
+def current_period():
+    """当前的缓存时间段编号，每 SPC_CACHE_TIMEOUT 秒变化一次"""
+    return int(time.time() // _timeout())
+
+
+def _bump(scope, keys):
+    cache = _cache()
+    for key in keys:
+        version_key = _version_key(scope, key)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.set(version_key, time.time_ns(), None)
+
+
+def invalidate(scope, keys):
+    """使某范围内指定牌号（原料名称）的缓存失效，同时使依赖整个范围的条目失效
+
+    立即失效一次，事务提交后再失效一次，防止其他请求在提交前用旧数据重新写入缓存。
+    """
+    keys = {key for key in keys if key is not None} | {ALL}
+    _bump(scope, keys)
+    transaction.on_commit(lambda: _bump(scope, keys))
+
+
+def _count(name):
+    cache = _cache()
+    key = f'spc:stats:{name}'
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def cache_stats():
+    """缓存命中和未命中次数"""
+    values = _cache().get_many([f'spc:stats:{name}' for name in STAT_KEYS])
+    stats = {name: values.get(f'spc:stats:{name}', 0) for name in STAT_KEYS}
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / total if total else 0.0
+    return stats
+
+
+def reset_cache_stats():
+    _cache().delete_many([f'spc:stats:{name}' for name in STAT_KEYS])
+
+
+def mark_uncacheable(response):
+    """标记响应不能缓存（例如受时间预算截断的结果）：cached_api 不写入缓存，conditional_api 不生成验证器"""
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+def is_cacheable(response):
+    return 'no-store' not in response.get('Cache-Control', '')
+
+
+def normalize_params(query_dict):
+    """规范化查询参数：按参数名排序，保留同名参数的原始顺序"""
+    return urlencode(sorted((name, values) for name, values in query_dict.lists()), doseq=True)
+
+
+def cached_api(scope, depends_on):
+    """缓存GET接口的成功响应
+
+    depends_on(request) 返回该请求依赖的牌号（原料名称）列表，返回空列表表示依赖整个范围。
+    JSON 和 MessagePack 响应分别缓存；视图用 mark_uncacheable 标记的响应不缓存。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            from core.encoding import negotiated_type
+
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            keys = list(depends_on(request)) or [ALL]
+            versions = _versions(scope, keys)
+            digest = hashlib.md5(
+                f'{request.path}?{normalize_params(request.GET)}|{negotiated_type(request)}|{versions}'.encode('utf-8')
+            ).hexdigest()
+            cache_key = f'spc:response:{digest}'
+
+            cache = _cache()
+            cached = cache.get(cache_key)
+            if cached is not None:
+                _count('hits')
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                patch_vary_headers(response, ['Accept'])
+                response['X-Cache'] = 'HIT'
+                return response
+
+            _count('misses')
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and is_cacheable(response):
+                cache.set(cache_key, (response.content, response['Content-Type']), _timeout())
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_value(scope, name, compute, keys=(), cacheable=None):
+    """缓存 compute() 的结果，与 cached_api 一样依赖 keys 的版本号（为空时依赖整个范围）
+
+    cacheable(value) 返回 False 时不写入缓存（例如受时间预算截断、不可重复的结果）。
+    """
+    versions = _versions(scope, list(keys) or [ALL])
+    digest = hashlib.md5(f'{name}|{versions}'.encode('utf-8')).hexdigest()
+    cache_key = f'spc:value:{digest}'
+
+    cache = _cache()
+    value = cache.get(cache_key)
+    if value is None:
+        value = compute()
+        if cacheable is None or cacheable(value):
+            cache.set(cache_key, value, _timeout())
+    return value
+
+
+def param_keys(name):
+    """依赖精确匹配参数（可以有多个值）的牌号或原料名称"""
+    def depends_on(request):
+        return [value for value in request.GET.getlist(name) if value]
+    return depends_on
+
+
+def whole_scope(request):
+    """模糊匹配或未筛选的请求依赖整个范围"""
+    return []
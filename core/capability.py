@@ -0,0 +1,293 @@
+"""过程能力 - Cp/Cpk 的置信区间（解析法和 bootstrap 法）和全部牌号 × 检测项目的能力矩阵
+
+解析法（analytic）直接由样本数和点估计计算：Cp 使用卡方分布的精确区间，
+Cpk 使用 Bissell 的正态近似，适合作为默认的快速方法。
+
+bootstrap 法把重抽样写成 (块大小, n) 的下标数组，一次算出一整块重抽样的均值和方差；
+块的大小按元素数上限确定以限制内存，超过时间预算时停止，按已完成的重抽样计算百分位区间。
+随机数种子固定，同样的数据总是得到同样的区间，完成全部重抽样的结果可以按数据版本缓存；
+受时间预算截断的结果取决于机器负载，不写入缓存。
+
+capability_matrix 一次查询取出某类产品全部数值检测项目，按牌号排序后用 reduceat
+同时算出每个 (牌号, 检测项目) 的样本数、均值、标准差、Cp/Cpk 和超规格率，
+标准来自内存中的标准索引（最多一次查询）。
+"""
+
+import io
+import time
+from operator import itemgetter
+
+import numpy as np
+
+from core.cache import cached_value
+from core.schema import get_family
+from core.spc import SPC_PRODUCT_TYPES, build_filters
+from products.standards import get_standards_index
+
+INTERVAL_METHODS = ('analytic', 'bootstrap')
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_RESAMPLES = 2000
+MAX_RESAMPLES = 20000
+
+# bootstrap 的时间预算（秒）
+DEFAULT_TIME_BUDGET = 2.0
+
+# 每块重抽样数组的元素数上限（int64 下标约16MB）
+BLOCK_ELEMENTS = 2_000_000
+
+BOOTSTRAP_SEED = 0
+
+# 能力矩阵每行的字段和导出时的列名
+MATRIX_FIELDS = {
+    'product_code': '牌号',
+    'test_item': '检测项目',
+    'label': '检测项目名称',
+    'n': '样本数',
+    'mean': '平均值',
+    'std_dev': '标准差',
+    'usl': '规格上限',
+    'lsl': '规格下限',
+    'cp': 'Cp',
+    'cpk': 'Cpk',
+    'out_of_spec_rate': '超规格率',
+}
+MATRIX_SORT_FIELDS = tuple(field for field in MATRIX_FIELDS if field != 'label')
+
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def parse_interval_options(params):
+    """从查询参数解析置信区间选项，未指定 interval 时返回None，参数无效时抛出 ValueError
+
+    interval（analytic/bootstrap）、confidence（置信水平，默认0.95）、resamples（bootstrap 重抽样次数）。
+    """
+    method = params.get('interval')
+    if not method:
+        return None
+    if method not in INTERVAL_METHODS:
+        raise ValueError(f'无效的置信区间方法: {method}')
+
+    try:
+        confidence = float(params.get('confidence') or DEFAULT_CONFIDENCE)
+        resamples = int(params.get('resamples') or DEFAULT_RESAMPLES)
+    except (TypeError, ValueError):
+        raise ValueError('无效的置信水平或重抽样次数')
+    if not 0 < confidence < 1:
+        raise ValueError('置信水平应在0到1之间')
+    if not 1 <= resamples <= MAX_RESAMPLES:
+        raise ValueError(f'重抽样次数应在1到{MAX_RESAMPLES}之间')
+    return {'method': method, 'confidence': confidence, 'resamples': resamples}
+
+
+def analytic_intervals(n, cp, cpk, confidence=DEFAULT_CONFIDENCE):
+    """Cp 的卡方区间和 Cpk 的 Bissell 近似区间，返回 {'cp': [下限, 上限], 'cpk': [下限, 上限]}"""
+    from scipy import stats
+
+    alpha = 1 - confidence
+    dof = n - 1
+    z = stats.norm.ppf(1 - alpha / 2)
+    cpk_error = np.sqrt(1 / (9 * n) + cpk * cpk / (2 * dof))
+    return {
+        'cp': [
+            float(cp * np.sqrt(stats.chi2.ppf(alpha / 2, dof) / dof)),
+            float(cp * np.sqrt(stats.chi2.ppf(1 - alpha / 2, dof) / dof)),
+        ],
+        'cpk': [float(cpk - z * cpk_error), float(cpk + z * cpk_error)],
+    }
+
+
+def bootstrap_intervals(values, usl, lsl, confidence=DEFAULT_CONFIDENCE, resamples=DEFAULT_RESAMPLES,
+                        time_budget=DEFAULT_TIME_BUDGET, seed=BOOTSTRAP_SEED):
+    """Cp/Cpk 的 bootstrap 百分位区间，返回值另含实际完成的重抽样次数 resamples"""
+    values = np.asarray(values, dtype=float)
+    n = values.size
+    # 减去均值后再重抽样，平方和相减求方差时不损失精度
+    center = values.mean()
+    centered = values - center
+    rng = np.random.default_rng(seed)
+    block = max(1, min(resamples, BLOCK_ELEMENTS // n))
+
+    means = []
+    variances = []
+    done = 0
+    deadline = time.perf_counter() + time_budget
+    while done < resamples:
+        size = min(block, resamples - done)
+        sample = centered[rng.integers(0, n, size=(size, n))]
+        mean = sample.sum(axis=1) / n
+        squares = np.einsum('ij,ij->i', sample, sample)
+        means.append(mean)
+        variances.append((squares - n * mean * mean) / (n - 1))
+        done += size
+        if time.perf_counter() > deadline:
+            break
+
+    mean = np.concatenate(means) + center
+    std_dev = np.sqrt(np.maximum(np.concatenate(variances), 0.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cp = (usl - lsl) / (6 * std_dev)
+        cpk = np.minimum(usl - mean, mean - lsl) / (3 * std_dev)
+
+    percentiles = [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100]
+    return {
+        'cp': _percentile_bounds(cp, percentiles),
+        'cpk': _percentile_bounds(cpk, percentiles),
+        'resamples': done,
+    }
+
+
+def _percentile_bounds(estimates, percentiles):
+    """有限值的百分位区间，所有重抽样的方差都为0（没有有限值）时返回 [None, None]"""
+    finite = estimates[np.isfinite(estimates)]
+    if not finite.size:
+        return [None, None]
+    return np.percentile(finite, percentiles).tolist()
+
+
+def capability_intervals(values, usl, lsl, cp, cpk, method='analytic', confidence=DEFAULT_CONFIDENCE,
+                         resamples=DEFAULT_RESAMPLES):
+    """按指定方法计算 Cp/Cpk 的置信区间，没有双侧规格或样本数少于2时返回None"""
+    values = np.asarray(values, dtype=float)
+    if cp is None or cpk is None or values.size < 2:
+        return None
+    if method == 'bootstrap':
+        result = bootstrap_intervals(values, usl, lsl, confidence, resamples)
+    else:
+        result = analytic_intervals(values.size, cp, cpk, confidence)
+    return {'method': method, 'confidence': confidence, **result}
+
+
+def intervals_complete(result, resamples=DEFAULT_RESAMPLES):
+    """置信区间是否完整：bootstrap 完成了全部 resamples 次重抽样（没有区间或解析法时总是完整）"""
+    return result is None or result.get('resamples', resamples) >= resamples
+
+
+def cached_capability_intervals(cache_name, product_codes, values, usl, lsl, cp, cpk, **options):
+    """按 cache_name（产品类型、牌号、检测项目、日期范围等）缓存置信区间，牌号的数据写入后失效
+
+    bootstrap 未完成全部重抽样（超过时间预算）时不缓存，下次请求重新计算。
+    """
+    options_key = ':'.join(f'{name}={value}' for name, value in sorted(options.items()))
+    requested = options.get('resamples', DEFAULT_RESAMPLES)
+    return cached_value(
+        'product', f'capability_intervals:{cache_name}:{options_key}',
+        lambda: capability_intervals(values, usl, lsl, cp, cpk, **options),
+        keys=product_codes,
+        cacheable=lambda result: intervals_complete(result, requested),
+    )
+
+
+def _nullable(value):
+    return None if value != value else float(value)
+
+
+def _spec_limits(codes, items):
+    """各 (牌号, 检测项目) 的内控标准上下限，没有标准时为 NaN"""
+    index = get_standards_index()
+    usl = np.full((len(codes), len(items)), np.nan)
+    lsl = np.full((len(codes), len(items)), np.nan)
+    for row, code in enumerate(codes):
+        for column, item in enumerate(items):
+            standard = index.get(code, 'internal_control', item.name)
+            if standard is None:
+                continue
+            if standard.upper_limit is not None:
+                usl[row, column] = standard.upper_limit
+            if standard.lower_limit is not None:
+                lsl[row, column] = standard.lower_limit
+    return usl, lsl
+
+
+def capability_matrix(product_type, product_code=None, production_line=None, start_date=None, end_date=None):
+    """某类产品每个 (牌号, 检测项目) 的过程能力，按牌号和检测项目的顺序返回行列表
+
+    标准差为样本标准差，Cp/Cpk 需要双侧规格限，超规格率只要有一侧规格限就计算。
+    product_type 无效时抛出 ValueError。
+    """
+    spec = SPC_PRODUCT_TYPES.get(product_type)
+    if spec is None:
+        raise ValueError('Invalid product type')
+    items = get_family(product_type).numeric_items
+    filters = build_filters(spec['date_field'], product_code, production_line, start_date, end_date)
+    rows = list(
+        spec['model'].objects.filter(**filters)
+        .values_list('product_code', *[item.column for item in items])
+    )
+    if not rows:
+        return []
+
+    codes, inverse = np.unique(np.array([row[0] for row in rows], dtype=str), return_inverse=True)
+    inverse = inverse.ravel()
+    matrix = np.array([row[1:] for row in rows], dtype=float).reshape(len(rows), len(items))
+    usl, lsl = _spec_limits(codes.tolist(), items)
+
+    # 按牌号排序一次，各列同时按分段归约
+    order = np.argsort(inverse, kind='stable')
+    matrix = matrix[order]
+    segment = inverse[order]
+    starts = np.concatenate(([0], np.cumsum(np.bincount(inverse))[:-1]))
+    present = ~np.isnan(matrix)
+    filled = np.where(present, matrix, 0.0)
+
+    counts = np.add.reduceat(present.astype(float), starts, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.add.reduceat(filled, starts, axis=0) / counts
+        deviation = np.where(present, matrix - means[segment], 0.0)
+        std_devs = np.sqrt(np.add.reduceat(deviation * deviation, starts, axis=0) / (counts - 1))
+        std_devs[counts < 2] = np.nan
+        capable = std_devs > 0
+        cp = np.where(capable, (usl - lsl) / (6 * std_devs), np.nan)
+        cpk = np.where(capable, np.minimum(usl - means, means - lsl) / (3 * std_devs), np.nan)
+
+        # 与 NaN 比较的结果为 False，缺少一侧规格限时该侧不算超规格
+        outside = present & ((matrix > usl[segment]) | (matrix < lsl[segment]))
+        has_limit = ~(np.isnan(usl) & np.isnan(lsl))
+        out_of_spec_rate = np.where(has_limit, np.add.reduceat(outside.astype(float), starts, axis=0) / counts, np.nan)
+
+    result = []
+    for row, code in enumerate(codes.tolist()):
+        for column, item in enumerate(items):
+            if not counts[row, column]:
+                continue
+            result.append({
+                'product_code': code,
+                'test_item': item.name,
+                'label': item.label,
+                'n': int(counts[row, column]),
+                'mean': float(means[row, column]),
+                'std_dev': _nullable(std_devs[row, column]),
+                'usl': _nullable(usl[row, column]),
+                'lsl': _nullable(lsl[row, column]),
+                'cp': _nullable(cp[row, column]),
+                'cpk': _nullable(cpk[row, column]),
+                'out_of_spec_rate': _nullable(out_of_spec_rate[row, column]),
+            })
+    return result
+
+
+def sort_matrix(rows, field=None, descending=False):
+    """按字段排序能力矩阵，没有值（None）的行总是排在最后；field 为空时保持原顺序"""
+    if not field:
+        return list(rows)
+    if field not in MATRIX_SORT_FIELDS:
+        raise ValueError(f'无效的排序字段: {field}')
+    valued = sorted((row for row in rows if row[field] is not None), key=itemgetter(field), reverse=descending)
+    return valued + [row for row in rows if row[field] is None]
+
+
+def matrix_workbook(rows, title):
+    """把能力矩阵写成 xlsx，返回文件内容"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = title
+    worksheet.append(list(MATRIX_FIELDS.values()))
+    for row in rows:
+        worksheet.append([row[field] for field in MATRIX_FIELDS])
+    worksheet.freeze_panes = 'A2'
+
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
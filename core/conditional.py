@@ -0,0 +1,86 @@
+"""读取接口的条件请求 - 根据数据指纹生成 ETag 和 Last-Modified，数据未变化时返回304
+
+按牌号（原料名称）筛选的请求，数据指纹由一次聚合查询得到：筛选后记录的 max(updated_at) 和记录数
+（由 (牌号, updated_at) 索引回答）。另外加入缓存版本号，重新判定等不更新 updated_at 的批量写入
+也会调用 core.cache.invalidate 使 ETag 变化。
+
+依赖整个范围的请求不扫描记录：范围版本号在该范围的每次写入时都会变化，ETag 只由版本号和
+当前的缓存时间段（SPC_CACHE_TIMEOUT）生成，不提供 Last-Modified。时间段使其他进程中的写入
+（不能使本进程的版本号变化）最多在一个缓存时间段后反映出来，与接口结果缓存的时效一致。
+数据没有变化时，一次请求最多执行一条聚合查询，不执行视图也不返回响应体。
+"""
+
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from core.cache import current_period, current_versions, is_cacheable, normalize_params, whole_scope
+
+
+def _fingerprint(request, source, field, scope, depends_on, args, kwargs):
+    """计算并在请求上缓存 (etag, last_modified)；筛选参数无效时返回 (None, None)，交给视图报错"""
+    cached = getattr(request, '_api_fingerprint', None)
+    if cached is not None:
+        return cached
+
+    from core.encoding import negotiated_type
+
+    try:
+        queryset = source(request, *args, **kwargs)
+        if callable(scope):
+            scope = scope(request, *args, **kwargs)
+        keys = list(depends_on(request)) if scope else []
+        request_key = f'{request.path}?{normalize_params(request.GET)}|{negotiated_type(request)}'
+        if queryset is None:
+            fingerprint = (None, None)
+        elif scope and not keys:
+            versions = current_versions(scope, [])
+            digest = hashlib.md5(f'{request_key}|{versions}|{current_period()}'.encode('utf-8')).hexdigest()
+            fingerprint = (digest, None)
+        else:
+            summary = queryset.order_by().aggregate(latest=Max(field), count=Count('pk'))
+            versions = current_versions(scope, keys) if scope else []
+            digest = hashlib.md5(
+                f'{request_key}|{summary["latest"]}|{summary["count"]}|{versions}'.encode('utf-8')
+            ).hexdigest()
+            fingerprint = (digest, summary['latest'])
+    except Exception:
+        fingerprint = (None, None)
+
+    request._api_fingerprint = fingerprint
+    return fingerprint
+
+
+def conditional_api(source, scope=None, depends_on=whole_scope, field='updated_at'):
+    """为GET接口加上 ETag/Last-Modified 和304处理
+
+    source(request, *args, **kwargs) 返回响应所依赖的筛选后的查询集，返回None时不生成验证器；
+    scope、depends_on 与 cached_api 相同，指定时 ETag 还包含对应的缓存版本号；
+    scope 也可以是按请求参数返回范围的函数。
+    """
+    def etag(request, *args, **kwargs):
+        return _fingerprint(request, source, field, scope, depends_on, args, kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return _fingerprint(request, source, field, scope, depends_on, args, kwargs)[1]
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if not is_cacheable(response) or response.status_code >= 400:
+                # 不能缓存的响应和错误响应不给验证器，避免客户端重新验证后继续使用
+                del response['ETag']
+                del response['Last-Modified']
+            elif response.has_header('ETag'):
+                # 浏览器每次都需要重新验证，不能按 Last-Modified 启发式缓存
+                patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapper
+    return decorator
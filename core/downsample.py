@@ -0,0 +1,77 @@
+"""序列降采样 - 用 Largest-Triangle-Three-Buckets (LTTB) 减少长序列返回给图表的点数
+
+只影响返回给前端绘图的点，统计量和控制限仍由调用方用完整数据计算。
+超规格、失控等必须保留的点通过 keep 掩码强制保留，不占用 LTTB 的点数配额。
+"""
+
+import numpy as np
+
+# max_points 的最小值：LTTB 至少保留首尾两点和一个中间点
+MIN_POINTS = 3
+
+
+def parse_max_points(value):
+    """解析 max_points 参数，为空时返回None（不降采样）"""
+    if value in (None, ''):
+        return None
+    try:
+        max_points = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'无效的最大点数: {value}')
+    if max_points < MIN_POINTS:
+        raise ValueError(f'最大点数不能小于{MIN_POINTS}')
+    return max_points
+
+
+def lttb_indices(x, y, threshold):
+    """对 (x, y) 执行 LTTB，返回保留点的下标（升序，包含首尾两点）"""
+    n = len(y)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # 下一个桶的平均点，最后一个桶使用末尾点
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def downsample_indices(values, max_points, keep=None):
+    """计算降采样后保留的点的下标，点数不超过 max_points 时返回None
+
+    缺失值（NaN）不参与 LTTB；keep 为布尔掩码，为 True 的点总是保留，
+    因此必须保留的点很多时返回的点数可能超过 max_points。
+    """
+    values = np.asarray(values, dtype=float)
+    if max_points is None or values.size <= max_points:
+        return None
+
+    keep = np.zeros(values.size, dtype=bool) if keep is None else np.asarray(keep, dtype=bool)
+    valid = np.flatnonzero(~np.isnan(values))
+    threshold = max(max_points - int(keep.sum()), MIN_POINTS)
+
+    # x 使用原始下标，保持点在横轴上的间距
+    sampled = valid[lttb_indices(valid.astype(float), values[valid], threshold)]
+    return np.union1d(sampled, np.flatnonzero(keep))
+
+
+def take(sequence, indices):
+    """按下标从列表或数组中取出元素"""
+    if isinstance(sequence, np.ndarray):
+        return sequence[indices]
+    return [sequence[index] for index in indices.tolist()]
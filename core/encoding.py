@@ -0,0 +1,131 @@
+"""图表接口的响应编码 - JSON（默认）或 MessagePack，由请求的 Accept 头协商
+
+图表数据在视图中保持为 NumPy 数组，不再逐个转换为 Python float：
+- JSON 响应由 ArrayJSONEncoder 在序列化时一次转换为列表，NaN 输出为 null；
+- MessagePack 响应（Accept: application/x-msgpack）把一维浮点数组直接写成 bin 类型（多维数组按行），
+  内容为小端 float64 序列，缺失值为 NaN，前端可以用 Float64Array 直接读取。
+"""
+
+import datetime
+import decimal
+import struct
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+
+from core.utils import array_to_list
+
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/x-msgpack'
+
+# 按优先顺序排列，Accept 为空或 */* 时使用 JSON
+RESPONSE_TYPES = [JSON_TYPE, MSGPACK_TYPE, 'application/msgpack']
+
+
+class ArrayJSONEncoder(DjangoJSONEncoder):
+    """支持 NumPy 数组和标量的 JSON 编码器"""
+
+    def default(self, o):
+        if isinstance(o, np.ndarray):
+            return array_to_list(o) if o.dtype.kind == 'f' else o.tolist()
+        if isinstance(o, np.generic):
+            return o.item()
+        return super().default(o)
+
+
+def _pack_length(out, length, small_tag, small_limit, tags):
+    """写入 str/bin/array/map 的类型和长度"""
+    if small_tag is not None and length < small_limit:
+        out.append(small_tag | length)
+    elif tags[0] is not None and length < 0x100:
+        out += struct.pack('>BB', tags[0], length)
+    elif length < 0x10000:
+        out += struct.pack('>BH', tags[1], length)
+    else:
+        out += struct.pack('>BI', tags[2], length)
+
+
+def _pack_int(out, value):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif 0 <= value < 0x100000000:
+        out += struct.pack('>BI', 0xce, value)
+    elif 0 <= value < 0x10000000000000000:
+        out += struct.pack('>BQ', 0xcf, value)
+    elif -0x80000000 <= value < 0:
+        out += struct.pack('>Bi', 0xd2, value)
+    else:
+        out += struct.pack('>Bq', 0xd3, value)
+
+
+def _pack(out, obj):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        _pack_int(out, obj)
+    elif isinstance(obj, float):
+        out += struct.pack('>Bd', 0xcb, obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        _pack_length(out, len(data), 0xa0, 32, (0xd9, 0xda, 0xdb))
+        out += data
+    elif isinstance(obj, np.ndarray) and obj.dtype.kind == 'f' and obj.ndim == 1:
+        data = obj.astype('<f8', copy=False).tobytes()
+        _pack_length(out, len(data), None, 0, (0xc4, 0xc5, 0xc6))
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_length(out, len(obj), None, 0, (0xc4, 0xc5, 0xc6))
+        out += obj
+    elif isinstance(obj, dict):
+        _pack_length(out, len(obj), 0x80, 16, (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(out, key if isinstance(key, str) else str(key))
+            _pack(out, value)
+    elif isinstance(obj, (list, tuple)):
+        _pack_length(out, len(obj), 0x90, 16, (None, 0xdc, 0xdd))
+        for value in obj:
+            _pack(out, value)
+    elif isinstance(obj, np.ndarray) and obj.dtype.kind == 'f':
+        # 多维浮点数组按行写成数组，每行仍为 bin
+        _pack(out, list(obj))
+    elif isinstance(obj, np.ndarray):
+        _pack(out, obj.tolist())
+    elif isinstance(obj, np.generic):
+        _pack(out, obj.item())
+    elif isinstance(obj, (datetime.date, datetime.time)):
+        _pack(out, obj.isoformat())
+    elif isinstance(obj, decimal.Decimal):
+        _pack(out, float(obj))
+    else:
+        raise TypeError(f'无法编码为 MessagePack 的类型: {type(obj).__name__}')
+
+
+def packb(obj):
+    """把字典、列表和 NumPy 数组编码为 MessagePack 字节串"""
+    out = bytearray()
+    _pack(out, obj)
+    return bytes(out)
+
+
+def negotiated_type(request):
+    """按 Accept 头选择响应格式"""
+    preferred = request.get_preferred_type(RESPONSE_TYPES)
+    return JSON_TYPE if preferred in (None, JSON_TYPE) else MSGPACK_TYPE
+
+
+def api_response(request, payload, status=200):
+    """按协商的格式返回图表数据"""
+    if negotiated_type(request) == MSGPACK_TYPE:
+        response = HttpResponse(packb(payload), content_type=MSGPACK_TYPE, status=status)
+    else:
+        response = JsonResponse(payload, encoder=ArrayJSONEncoder, status=status)
+    patch_vary_headers(response, ['Accept'])
+    return response
@@ -0,0 +1,163 @@
+"""历史检测数据导入 - 流式读取xlsx/CSV，分块交给 core.ingest 校验、判定和批量写入
+
+xlsx 使用 openpyxl 只读模式逐行读取，CSV 逐行解析，内存占用只与块大小有关。
+列名可以是字段名或模型字段的中文名称（verbose_name）。
+"""
+
+import io
+import os
+import time
+
+from core.ingest import Ingestor, iter_csv
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# 处理结果中最多保留的错误行数
+MAX_REPORTED_ERRORS = 50
+
+# 管理界面中显示的错误行数
+ADMIN_REPORTED_ERRORS = 10
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def iter_xlsx(file, sheet_name=None):
+    """逐行读取工作表（首个非空行为表头），生成 (行号, 数据)"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.active
+        headers = None
+        for row_number, values in enumerate(worksheet.iter_rows(values_only=True), start=1):
+            if all(_is_blank(value) for value in values):
+                continue
+            if headers is None:
+                headers = [str(value).strip() if value is not None else '' for value in values]
+                continue
+            yield row_number, {header: value for header, value in zip(headers, values) if header}
+    finally:
+        workbook.close()
+
+
+def _iter_csv_path(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from iter_csv(f)
+
+
+def iter_rows(file, file_name, sheet_name=None):
+    """根据文件扩展名选择读取方式，file 可以是文件路径或二进制文件对象"""
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        return iter_xlsx(file, sheet_name)
+    if extension == '.csv':
+        if isinstance(file, str):
+            return _iter_csv_path(file)
+        return iter_csv(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+    raise ValueError(f'不支持的文件类型: {extension}，请使用 xlsx 或 csv')
+
+
+def import_file(product_type, file, file_name, chunk_size=1000, sheet_name=None,
+                modified_by='import', dry_run=False, progress=None, on_error=None):
+    """分块导入文件，返回统计信息和前若干条错误
+
+    progress 为可选回调，每处理完一块调用一次 progress(summary, elapsed)；
+    on_error 为可选回调，对每个错误或冲突的处理结果调用一次。
+    """
+    ingestor = Ingestor(product_type, modified_by=modified_by, dry_run=dry_run)
+    summary = {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'conflict': 0, 'error': 0}
+    errors = []
+    start_time = time.time()
+
+    for outcomes in ingestor.ingest(iter_rows(file, file_name, sheet_name), chunk_size=chunk_size):
+        for outcome in outcomes:
+            summary['total'] += 1
+            summary[outcome['status']] += 1
+            if outcome['status'] in ('error', 'conflict'):
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(outcome)
+                if on_error:
+                    on_error(outcome)
+        if progress:
+            progress(summary, time.time() - start_time)
+
+    elapsed = time.time() - start_time
+    return {
+        'summary': summary,
+        'errors': errors,
+        'ignored_columns': sorted(ingestor.unknown_columns),
+        'elapsed': elapsed,
+        'rows_per_sec': summary['total'] / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def format_errors(errors):
+    """把错误字典整理为一行文本"""
+    return '; '.join(f"{field}: {'，'.join(messages)}" for field, messages in errors.items())
+
+
+class ImportMeasurementsMixin:
+    """为管理界面增加上传xlsx/CSV导入检测数据的页面"""
+
+    import_product_type = None
+    change_list_template = 'admin/measurement_change_list.html'
+
+    def get_urls(self):
+        from django.urls import path
+        urls = super().get_urls()
+        opts = self.model._meta
+        custom_urls = [
+            path('import/', self.admin_site.admin_view(self.import_view),
+                 name=f'{opts.app_label}_{opts.model_name}_import'),
+        ]
+        return custom_urls + urls
+
+    def import_view(self, request):
+        """上传文件并导入，导入完成后返回列表页显示结果"""
+        from django.contrib import messages
+        from django.core.exceptions import PermissionDenied
+        from django.http import HttpResponseRedirect
+        from django.shortcuts import render
+        from django.urls import reverse
+
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        opts = self.model._meta
+        if request.method == 'POST' and request.FILES.get('file'):
+            upload = request.FILES['file']
+            try:
+                result = import_file(
+                    self.import_product_type, upload.file, upload.name,
+                    sheet_name=request.POST.get('sheet_name') or None,
+                    modified_by=request.user.username,
+                    dry_run=bool(request.POST.get('dry_run')),
+                )
+            except Exception as e:
+                messages.error(request, f'导入失败：{e}')
+            else:
+                summary = result['summary']
+                prefix = '试运行' if request.POST.get('dry_run') else '导入'
+                messages.success(
+                    request,
+                    f"{prefix}完成：共 {summary['total']} 行，新增 {summary['created']} 条，"
+                    f"更新 {summary['updated']} 条，无变化 {summary['unchanged']} 条，"
+                    f"冲突 {summary['conflict']} 条，错误 {summary['error']} 条"
+                )
+                if result['ignored_columns']:
+                    messages.warning(request, f"已忽略无法识别的列：{'、'.join(result['ignored_columns'])}")
+                for outcome in result['errors'][:ADMIN_REPORTED_ERRORS]:
+                    messages.error(request, f"第 {outcome['row']} 行 {outcome.get('key') or ''}：{format_errors(outcome['errors'])}")
+                if summary['error'] + summary['conflict'] > ADMIN_REPORTED_ERRORS:
+                    messages.warning(request, '只显示前几条错误，完整错误清单请使用 import_measurements 命令的 --errors-csv 参数导出')
+                return HttpResponseRedirect(reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist'))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'导入{opts.verbose_name}',
+            'opts': opts,
+            'app_label': opts.app_label,
+        }
+        return render(request, 'admin/import_measurements.html', context)
@@ -0,0 +1,333 @@
+"""检测数据批量导入 - 按批号新增或更新记录
+
+每块记录先在内存中校验，再用缓存的标准一次性判定，最后在同一个事务中
+通过 bulk_create / bulk_update 写入记录和修改历史。返回每一行的处理结果。
+"""
+
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from core import rollup
+from core.cache import invalidate
+from products.judgment_engine import FAMILY_SPECS, judge_rows, measurement_fields
+from products.models import (
+    DryFilmProduct, DryFilmProductHistory, AdhesiveProduct, AdhesiveProductHistory,
+    PilotProduct, PilotProductHistory
+)
+from products.standards import get_standards_index
+from raw_materials.judgment import JUDGMENT_FIELDS as RAW_MATERIAL_JUDGMENT_FIELDS
+from raw_materials.models import RawMaterial, RawMaterialHistory
+from raw_materials.standards import RawMaterialStandardMatrix
+
+# 各类型的模型、唯一键、历史记录模型、判定后需要写回的字段以及结果缓存的范围和键字段
+INGEST_FAMILIES = {
+    'dryfilm': {
+        'model': DryFilmProduct,
+        'key': 'batch_number',
+        'history': (DryFilmProductHistory, 'dryfilm_product'),
+        'judgment_fields': FAMILY_SPECS['dryfilm']['judgment_fields'] + ['judgment_details'],
+        'cache': ('product', 'product_code'),
+    },
+    'adhesive': {
+        'model': AdhesiveProduct,
+        'key': 'batch_number',
+        'history': (AdhesiveProductHistory, 'adhesive_product'),
+        'judgment_fields': FAMILY_SPECS['adhesive']['judgment_fields'] + ['judgment_details'],
+        'cache': ('product', 'product_code'),
+    },
+    'pilot': {
+        'model': PilotProduct,
+        'key': 'batch_number',
+        'history': (PilotProductHistory, 'pilot_product'),
+        'judgment_fields': [],
+        'cache': None,
+    },
+    'raw_material': {
+        'model': RawMaterial,
+        'key': 'material_batch',
+        'history': (RawMaterialHistory, 'raw_material'),
+        'judgment_fields': RAW_MATERIAL_JUDGMENT_FIELDS,
+        'cache': ('raw_material', 'material_name'),
+    },
+}
+
+# 由系统维护、不接受导入的字段
+SYSTEM_FIELDS = ['id', 'created_at', 'updated_at']
+
+
+def writable_fields(product_type):
+    """可以导入的字段"""
+    family = INGEST_FAMILIES[product_type]
+    excluded = set(SYSTEM_FIELDS) | set(family['judgment_fields'])
+    return [field for field in family['model']._meta.concrete_fields if field.name not in excluded]
+
+
+def column_lookup(product_type):
+    """列名到字段名的映射，同时接受字段名和中文名称（verbose_name）"""
+    lookup = {}
+    for field in writable_fields(product_type):
+        lookup[field.name] = field.name
+        lookup[str(field.verbose_name)] = field.name
+    return lookup
+
+
+def iter_ndjson(lines):
+    """逐行解析NDJSON，生成 (行号, 数据或错误信息)"""
+    for row_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, f'JSON格式错误: {e}'
+            continue
+        if not isinstance(data, dict):
+            yield row_number, 'JSON行必须是对象'
+            continue
+        yield row_number, data
+
+
+def iter_csv(text_stream):
+    """逐行解析CSV（首行为表头），生成 (行号, 数据)"""
+    reader = csv.DictReader(text_stream)
+    for row_number, data in enumerate(reader, start=2):
+        yield row_number, data
+
+
+def parse_body(body, content_type):
+    """根据Content-Type解析请求体，返回行迭代器"""
+    if 'csv' in content_type:
+        return iter_csv(io.StringIO(body.decode('utf-8-sig')))
+    return iter_ndjson(body.splitlines())
+
+
+def _clean_value(field, value):
+    """把导入的原始值转换为字段类型，空字符串视为未填写"""
+    if isinstance(value, str):
+        value = value.strip()
+        if value == '':
+            value = None
+    if value is None:
+        return None if field.null or not field.empty_strings_allowed else ''
+    return field.to_python(value)
+
+
+def _error_messages(error):
+    if hasattr(error, 'message_dict'):
+        return {field: [str(message) for message in messages] for field, messages in error.message_dict.items()}
+    return {'__all__': [str(message) for message in error.messages]}
+
+
+def _judge(product_type, objects):
+    """用缓存的标准一次性判定一块记录"""
+    if not objects:
+        return
+
+    if product_type in FAMILY_SPECS:
+        value_fields = measurement_fields(product_type)
+        rows = [
+            (obj.pk, obj.product_code, *[getattr(obj, field) for field in value_fields])
+            for obj in objects
+        ]
+        results = judge_rows(product_type, rows, value_fields, get_standards_index())
+        for obj, result in zip(objects, results):
+            for field, value in result.items():
+                setattr(obj, field, value)
+
+    elif product_type == 'raw_material':
+        matrices = RawMaterialStandardMatrix.load_many({obj.material_name for obj in objects})
+        for obj in objects:
+            obj.calculate_judgment(matrices[obj.material_name])
+
+
+class Ingestor:
+    """按块导入某一类型的检测数据"""
+
+    def __init__(self, product_type, modified_by='API', dry_run=False):
+        self.product_type = product_type
+        self.family = INGEST_FAMILIES[product_type]
+        self.model = self.family['model']
+        self.key_field = self.family['key']
+        self.fields = {field.name: field for field in writable_fields(product_type)}
+        self.columns = column_lookup(product_type)
+        self.modified_by = modified_by
+        self.dry_run = dry_run
+        # 无法识别、已忽略的列名
+        self.unknown_columns = set()
+
+    def clean_row(self, data):
+        """按列名找到字段并转换类型，返回 (值, 错误)"""
+        values = {}
+        errors = {}
+        for column, raw_value in data.items():
+            field_name = self.columns.get(str(column).strip()) if column is not None else None
+            if field_name is None:
+                self.unknown_columns.add(str(column))
+                continue
+            field = self.fields[field_name]
+            try:
+                values[field_name] = _clean_value(field, raw_value)
+            except ValidationError as e:
+                errors[field_name] = [str(message) for message in e.messages]
+
+        if not values.get(self.key_field):
+            errors.setdefault(self.key_field, []).append('缺少批号')
+        return values, errors
+
+    def ingest_chunk(self, rows):
+        """导入一块 (行号, 数据) 记录，返回每行的处理结果"""
+        outcomes = {}
+        parsed = []
+        seen_keys = set()
+
+        for row_number, data in rows:
+            if isinstance(data, str):
+                outcomes[row_number] = {'row': row_number, 'status': 'error', 'errors': {'__all__': [data]}}
+                continue
+            values, errors = self.clean_row(data)
+            key = values.get(self.key_field)
+            if not errors and key in seen_keys:
+                errors[self.key_field] = ['同一批数据中批号重复']
+            if errors:
+                outcomes[row_number] = {'row': row_number, 'key': key, 'status': 'error', 'errors': errors}
+                continue
+            seen_keys.add(key)
+            parsed.append((row_number, key, values))
+
+        # 一次查询取出本块涉及的已有记录，加载时即记录原值用于生成修改历史
+        existing = {}
+        for obj in self.model.objects.filter(**{f'{self.key_field}__in': seen_keys}):
+            existing.setdefault(getattr(obj, self.key_field), []).append(obj)
+
+        to_create = []
+        to_update = []
+        update_fields = set()
+        for row_number, key, values in parsed:
+            matches = existing.get(key, [])
+            if len(matches) > 1:
+                # 原料批号不唯一时无法确定要更新哪一条
+                outcomes[row_number] = {
+                    'row': row_number, 'key': key, 'status': 'conflict',
+                    'errors': {self.key_field: [f'存在 {len(matches)} 条相同批号的记录']},
+                }
+                continue
+
+            obj = matches[0] if matches else self.model()
+            for field_name, value in values.items():
+                setattr(obj, field_name, value)
+            obj.modified_by = values.get('modified_by') or self.modified_by
+            if matches:
+                # 未提供修改原因时由修改历史自动生成
+                obj.modification_reason = values.get('modification_reason') or ''
+
+            try:
+                obj.full_clean(
+                    exclude=SYSTEM_FIELDS + self.family['judgment_fields'],
+                    validate_unique=False, validate_constraints=False
+                )
+            except ValidationError as e:
+                outcomes[row_number] = {'row': row_number, 'key': key, 'status': 'error', 'errors': _error_messages(e)}
+                continue
+
+            if matches:
+                history = obj.build_history(*self.family['history'])
+                if history is None:
+                    outcomes[row_number] = {'row': row_number, 'key': key, 'status': 'unchanged', 'id': obj.pk}
+                    continue
+                update_fields.update(values)
+                to_update.append((row_number, obj, history))
+            else:
+                to_create.append((row_number, obj))
+
+        _judge(self.product_type, [obj for _, obj in to_create] + [obj for _, obj, _ in to_update])
+
+        if not self.dry_run and (to_create or to_update):
+            now = timezone.now()
+            for _, obj, _ in to_update:
+                obj.updated_at = now
+            update_fields.update(self.family['judgment_fields'])
+            update_fields.update(['updated_at', 'modified_by', 'modification_reason'])
+            update_fields.discard(self.key_field)
+
+            try:
+                with transaction.atomic():
+                    self.model.objects.bulk_create([obj for _, obj in to_create])
+                    self._fetch_created_ids([obj for _, obj in to_create])
+                    if to_update:
+                        self.model.objects.bulk_update([obj for _, obj, _ in to_update], sorted(update_fields))
+                        history_model = self.family['history'][0]
+                        history_model.objects.bulk_create([history for _, _, history in to_update])
+                    if self.family['cache']:
+                        self._invalidate_cache([obj for _, obj in to_create], [obj for _, obj, _ in to_update])
+                    if self.product_type in rollup.ROLLUP_FAMILIES:
+                        self._refresh_rollups([obj for _, obj in to_create], [obj for _, obj, _ in to_update])
+            except Exception as e:
+                # 整块回滚，块内待写入的记录都标记为失败
+                for row_number, obj in to_create:
+                    outcomes[row_number] = {'row': row_number, 'key': getattr(obj, self.key_field), 'status': 'error', 'errors': {'__all__': [str(e)]}}
+                for row_number, obj, _ in to_update:
+                    outcomes[row_number] = {'row': row_number, 'key': getattr(obj, self.key_field), 'status': 'error', 'errors': {'__all__': [str(e)]}}
+                to_create, to_update = [], []
+
+        for status, items in (('created', to_create), ('updated', [(row, obj) for row, obj, _ in to_update])):
+            for row_number, obj in items:
+                outcome = {'row': row_number, 'key': getattr(obj, self.key_field), 'status': status, 'id': obj.pk}
+                if self.family['judgment_fields']:
+                    outcome['judgment_status'] = obj.judgment_status
+                outcomes[row_number] = outcome
+
+        return [outcomes[row_number] for row_number in sorted(outcomes)]
+
+    def _fetch_created_ids(self, created):
+        """bulk_create 在 MySQL 上不返回主键，按批号一次查询补上新记录的 id"""
+        missing = {getattr(obj, self.key_field): obj for obj in created if obj.pk is None}
+        if not missing:
+            return
+        # 同一批号有多条时（原料批号不唯一）取最新插入的一条
+        rows = (
+            self.model.objects.filter(**{f'{self.key_field}__in': list(missing)})
+            .order_by('pk').values_list(self.key_field, 'pk')
+        )
+        for key, pk in rows:
+            missing[key].pk = pk
+
+    def _invalidate_cache(self, created, updated):
+        """使写入记录所属牌号或原料的接口缓存失效，更新的记录还包括修改前的牌号或原料"""
+        scope, field = self.family['cache']
+        keys = {getattr(obj, field) for obj in created + updated}
+        keys.update(obj.get_original_value(field) for obj in updated)
+        invalidate(scope, keys)
+
+    def _refresh_rollups(self, created, updated):
+        """重算写入记录修改前后所在分组的每日汇总"""
+        buckets = [rollup.bucket_of(self.product_type, obj) for obj in created + updated]
+        buckets += [rollup.original_bucket_of(self.product_type, obj) for obj in updated]
+        rollup.refresh_buckets(self.product_type, buckets)
+
+    def ingest(self, rows, chunk_size=500):
+        """分块导入，逐块生成处理结果列表"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield self.ingest_chunk(chunk)
+                chunk = []
+        if chunk:
+            yield self.ingest_chunk(chunk)
+
+
+def summarize(outcomes):
+    """按处理结果统计行数"""
+    summary = {'total': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'conflict': 0, 'error': 0}
+    for outcome in outcomes:
+        summary['total'] += 1
+        summary[outcome['status']] += 1
+    return summary
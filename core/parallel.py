@@ -0,0 +1,135 @@
+"""多进程分块执行 - 按主键范围切分数据表，由多个工作进程并行处理
+
+每个块在工作进程中单独提交事务，完成的块记录到检查点文件，
+中途崩溃后可以用 resume 从最后一个已提交的块继续。
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+
+CHECKPOINT_DIR = os.path.join(settings.BASE_DIR, 'checkpoints')
+
+
+def plan_pk_ranges(queryset, chunk_size):
+    """把查询集按主键切分为每块 chunk_size 条记录的闭区间 [(start_pk, end_pk), ...]"""
+    pks = list(queryset.order_by('pk').values_list('pk', flat=True))
+    return [
+        (pks[start], pks[min(start + chunk_size, len(pks)) - 1])
+        for start in range(0, len(pks), chunk_size)
+    ]
+
+
+class Checkpoint:
+    """记录切分计划和已提交块的检查点文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.ranges = []
+        self.done = set()
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.ranges = [tuple(pk_range) for pk_range in data['ranges']]
+        self.done = set(data['done'])
+        return self
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'ranges': self.ranges, 'done': sorted(self.done)}, f)
+        # 先写临时文件再替换，避免崩溃时留下不完整的检查点
+        os.replace(tmp_path, self.path)
+
+    def mark_done(self, chunk_index):
+        self.done.add(chunk_index)
+        self.save()
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def checkpoint_path(job_name):
+    return os.path.join(CHECKPOINT_DIR, f'{job_name}.json')
+
+
+def _init_worker():
+    """工作进程初始化：spawn 方式启动时需要重新加载 Django"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _run_chunk(chunk_func, chunk_index, start_pk, end_pk):
+    result = chunk_func(start_pk, end_pk)
+    return chunk_index, result
+
+
+def run_chunks(job_name, queryset, chunk_func, chunk_size, workers=1, resume=False, progress=None):
+    """按主键范围分块执行 chunk_func(start_pk, end_pk)
+
+    chunk_func 必须是可被子进程导入的模块级函数（或其 functools.partial），
+    返回 {'processed', 'updated'}。progress 回调参数为
+    (completed_chunks, total_chunks, processed, updated, elapsed)。
+    """
+    checkpoint = Checkpoint(checkpoint_path(job_name))
+    if resume and checkpoint.exists():
+        checkpoint.load()
+    else:
+        checkpoint.ranges = plan_pk_ranges(queryset, chunk_size)
+        checkpoint.done = set()
+        checkpoint.save()
+
+    pending = [
+        (chunk_index, start_pk, end_pk)
+        for chunk_index, (start_pk, end_pk) in enumerate(checkpoint.ranges)
+        if chunk_index not in checkpoint.done
+    ]
+    total_chunks = len(checkpoint.ranges)
+    processed = updated = 0
+    start_time = time.time()
+
+    def record(chunk_index, result):
+        nonlocal processed, updated
+        checkpoint.mark_done(chunk_index)
+        processed += result['processed']
+        updated += result['updated']
+        if progress:
+            progress(len(checkpoint.done), total_chunks, processed, updated, time.time() - start_time)
+
+    if workers <= 1:
+        for chunk_index, start_pk, end_pk in pending:
+            record(*_run_chunk(chunk_func, chunk_index, start_pk, end_pk))
+    else:
+        # 子进程不能复用父进程的数据库连接，派生前先全部关闭
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = [
+                executor.submit(_run_chunk, chunk_func, chunk_index, start_pk, end_pk)
+                for chunk_index, start_pk, end_pk in pending
+            ]
+            for future in as_completed(futures):
+                record(*future.result())
+
+    checkpoint.clear()
+    elapsed = time.time() - start_time
+    return {
+        'chunks': total_chunks,
+        'resumed_chunks': total_chunks - len(pending),
+        'processed': processed,
+        'updated': updated,
+        'elapsed': elapsed,
+        'rows_per_sec': processed / elapsed if elapsed > 0 else 0.0,
+    }
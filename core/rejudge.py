@@ -0,0 +1,201 @@
+"""标准变更后的增量重新判定队列
+
+标准保存或删除后，只把受影响的牌号（或原料名称/供应商）加入队列，由后台线程重新判定。
+同一范围在合并窗口内的多次修改只会触发一次判定，进度可通过 rejudge_status() 查询。
+已结束的进度记录超过保留时间或数量上限后清除。
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def _run_product_scope(product_code, progress):
+    """重新判定某牌号下的干膜和胶粘剂产品"""
+    from products.judgment_engine import FAMILY_SPECS, rejudge_queryset
+
+    totals = {'processed': 0, 'updated': 0}
+    for product_type, spec in FAMILY_SPECS.items():
+        queryset = spec['model'].objects.filter(product_code=product_code)
+        result = rejudge_queryset(product_type, queryset, progress=progress)
+        totals['processed'] += result['processed']
+        totals['updated'] += result['updated']
+    return totals
+
+
+def _run_raw_material_scope(scope, progress):
+    """重新判定某原料（及供应商）范围内的原料记录，供应商为空表示该原料全部记录"""
+    from raw_materials.judgment import rejudge_queryset
+    from raw_materials.models import RawMaterial
+    from raw_materials.standards import normalize_supplier
+
+    material_name, supplier = scope
+    supplier = normalize_supplier(supplier)
+    queryset = RawMaterial.objects.filter(material_name=material_name)
+    if supplier:
+        # 与标准匹配一致，按去除首尾空白后的供应商名称筛选
+        candidates = queryset.filter(supplier__contains=supplier).values_list('pk', 'supplier')
+        queryset = queryset.filter(pk__in=[pk for pk, value in candidates if normalize_supplier(value) == supplier])
+    result = rejudge_queryset(queryset, progress=progress)
+    return {'processed': result['processed'], 'updated': result['updated']}
+
+
+SCOPE_RUNNERS = {
+    'product': _run_product_scope,
+    'raw_material': _run_raw_material_scope,
+}
+
+FINISHED_STATES = ('done', 'error')
+
+# 已结束任务进度的保留时间（秒）和保留数量上限
+STATUS_TTL_SECONDS = 3600
+MAX_FINISHED_STATUS = 100
+
+
+class RejudgeQueue:
+    """合并同一范围重复请求的后台重新判定队列"""
+
+    def __init__(self, runners=None, coalesce_seconds=2.0, status_ttl=STATUS_TTL_SECONDS,
+                 max_finished=MAX_FINISHED_STATUS):
+        self.runners = runners or SCOPE_RUNNERS
+        self.coalesce_seconds = coalesce_seconds
+        self.status_ttl = status_ttl
+        self.max_finished = max_finished
+        self._pending = {}
+        self._status = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def enqueue(self, scope, key):
+        """加入队列；范围已在排队时只刷新合并窗口
+
+        进度记录原地更新：范围正在执行时保留其进度（执行中的 progress 回调仍写入同一记录），
+        只标记 queued，执行结束后会再判定一次。
+        """
+        with self._condition:
+            self._pending[(scope, key)] = time.monotonic()
+            status = self._status.setdefault((scope, key), {'scope': scope, 'key': key})
+            if status.get('state') == 'running':
+                status['queued'] = True
+            else:
+                status.update(state='pending', processed=0, total=None, updated=0, error='', queued=True)
+            self._prune()
+            self._ensure_worker()
+            self._condition.notify()
+
+    def run_now(self, scope, key):
+        """在当前线程立即执行（同步模式和测试使用）"""
+        with self._condition:
+            self._pending.pop((scope, key), None)
+        self._run(scope, key)
+
+    def status(self):
+        """所有已知范围的最新进度"""
+        with self._condition:
+            self._prune()
+            return [dict(item) for item in self._status.values()]
+
+    def _prune(self):
+        """清除超过保留时间的已结束记录，已结束记录超过数量上限时清除最早结束的（调用方持有锁）"""
+        finished = sorted(
+            (status['finished_at'], item) for item, status in self._status.items()
+            if status.get('state') in FINISHED_STATES and item not in self._pending
+        )
+        expired_before = time.time() - self.status_ttl
+        excess = len(finished) - self.max_finished
+        for index, (finished_at, item) in enumerate(finished):
+            if index < excess or finished_at < expired_before:
+                del self._status[item]
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name='rejudge-worker', daemon=True)
+            self._thread.start()
+
+    def _next_ready(self):
+        """取出合并窗口已结束的范围，没有时等待"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                ready = [
+                    item for item, enqueued_at in self._pending.items()
+                    if now - enqueued_at >= self.coalesce_seconds
+                ]
+                if ready:
+                    item = ready[0]
+                    del self._pending[item]
+                    return item
+
+                if self._pending:
+                    wait = self.coalesce_seconds - (now - min(self._pending.values()))
+                    self._condition.wait(timeout=max(wait, 0.01))
+                else:
+                    self._condition.wait()
+
+    def _worker(self):
+        while True:
+            scope, key = self._next_ready()
+            try:
+                self._run(scope, key)
+            finally:
+                close_old_connections()
+
+    def _run(self, scope, key):
+        status = self._status.setdefault((scope, key), {'scope': scope, 'key': key})
+
+        def progress(processed, total, updated, elapsed):
+            with self._condition:
+                status.update(processed=processed, total=total, updated=updated)
+
+        with self._condition:
+            status.update(
+                state='running', processed=0, total=None, updated=0, error='', queued=False, started_at=time.time()
+            )
+        logger.info('开始重新判定 %s=%s', scope, key)
+
+        try:
+            result = self.runners[scope](key, progress)
+        except Exception as e:
+            logger.exception('重新判定 %s=%s 失败', scope, key)
+            with self._condition:
+                status.update(state='error', error=str(e), finished_at=time.time())
+                self._prune()
+            return
+
+        with self._condition:
+            status.update(
+                state='done', processed=result['processed'], total=result['processed'],
+                updated=result['updated'], finished_at=time.time()
+            )
+            self._prune()
+        logger.info('重新判定 %s=%s 完成：处理 %s 条，更新 %s 条', scope, key, result['processed'], result['updated'])
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_rejudge_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = RejudgeQueue(coalesce_seconds=getattr(settings, 'REJUDGE_COALESCE_SECONDS', 2.0))
+        return _queue
+
+
+def schedule_rejudge(scope, key):
+    """安排重新判定；REJUDGE_ASYNC 关闭时在当前线程立即执行"""
+    queue = get_rejudge_queue()
+    if getattr(settings, 'REJUDGE_ASYNC', True):
+        queue.enqueue(scope, key)
+    else:
+        queue.run_now(scope, key)
+
+
+def rejudge_status():
+    return get_rejudge_queue().status()
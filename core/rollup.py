@@ -0,0 +1,461 @@
+"""每日汇总 - 维护 DailyRollup 表，并从汇总表回答按日/月/年的趋势和统计查询
+
+汇总按 (牌号/原料名称, 产线/供应商, 日期) 分组重新计算：记录保存或删除时只重算
+修改前后所在的分组，批量导入和重新判定也按写入的记录重算对应分组，
+rebuild_rollups 命令用一次分组聚合查询重建全部数据；升级时 dashboard 的数据迁移
+按已有记录回填一次汇总表。
+stats_snapshot 用一次分组查询得到仪表板和统计接口需要的全部汇总，并按数据版本缓存。
+"""
+
+import math
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+
+from core.cache import cached_value, invalidate
+from core.schema import get_family
+from dashboard.models import DailyRollup
+from products.models import DryFilmProduct, AdhesiveProduct
+from raw_materials.models import RawMaterial
+
+# 只统计记录数和判定结果的检测项目
+RECORD_ITEM = '*'
+
+# 各类型的模型、缓存范围、分组字段、日期字段以及合格/不合格/待判定的条件
+ROLLUP_FAMILIES = {
+    'dryfilm': {
+        'model': DryFilmProduct,
+        'scope': 'product',
+        'code': 'product_code',
+        'line': 'production_line',
+        'date': 'test_date',
+        'pass': Q(internal_final_judgment='内控合格'),
+        'fail': Q(internal_final_judgment='内控不合格'),
+        'pending': Q(judgment_status='待判定'),
+    },
+    'adhesive': {
+        'model': AdhesiveProduct,
+        'scope': 'product',
+        'code': 'product_code',
+        'line': 'production_line',
+        'date': 'physical_test_date',
+        'pass': Q(final_judgment='合格'),
+        'fail': Q(final_judgment='不合格'),
+        'pending': Q(judgment_status='待判定'),
+    },
+    'raw_material': {
+        'model': RawMaterial,
+        'scope': 'raw_material',
+        'code': 'material_name',
+        'line': 'supplier',
+        'date': 'test_date',
+        'pass': Q(judgment_status='合格'),
+        'fail': Q(judgment_status='不合格'),
+        'pending': Q(judgment_status='待判定'),
+    },
+}
+
+# 时间粒度：截断函数和标签格式
+BUCKETS = {
+    'day': (None, '%Y-%m-%d'),
+    'month': (TruncMonth, '%Y-%m'),
+    'year': (TruncYear, '%Y'),
+}
+
+# 每次重算的分组数量上限，避免查询条件过长
+REFRESH_BATCH = 200
+
+# 重算时覆盖的汇总字段
+ROLLUP_VALUE_FIELDS = [
+    'count', 'total', 'total_sq', 'min_value', 'max_value', 'pass_count', 'fail_count', 'pending_count',
+]
+
+
+def family_for_model(model):
+    for family, spec in ROLLUP_FAMILIES.items():
+        if spec['model'] is model:
+            return family
+    return None
+
+
+def _annotations(spec, columns):
+    annotations = {
+        'n': Count('pk'),
+        'passed': Count('pk', filter=spec['pass']),
+        'failed': Count('pk', filter=spec['fail']),
+        'pending': Count('pk', filter=spec['pending']),
+    }
+    for column in columns:
+        annotations.update({
+            f'{column}__n': Count(column),
+            f'{column}__sum': Sum(column),
+            f'{column}__sq': Sum(F(column) * F(column)),
+            f'{column}__min': Min(column),
+            f'{column}__max': Max(column),
+            f'{column}__passed': Count(column, filter=spec['pass']),
+            f'{column}__failed': Count(column, filter=spec['fail']),
+            f'{column}__pending': Count(column, filter=spec['pending']),
+        })
+    return annotations
+
+
+def aggregate_rollups(family, queryset=None):
+    """按 (牌号, 产线, 日期) 分组聚合，逐个生成未保存的 DailyRollup
+
+    queryset 可以来自迁移中的历史模型，该模型还没有的检测项目列不参与汇总。
+    """
+    spec = ROLLUP_FAMILIES[family]
+    queryset = spec['model'].objects.all() if queryset is None else queryset
+    existing = {field.name for field in queryset.model._meta.get_fields()}
+    columns = [column for column in get_family(family).numeric_columns if column in existing]
+    groups = (
+        queryset.values(spec['code'], spec['line'], spec['date'])
+        .annotate(**_annotations(spec, columns))
+        .order_by()
+    )
+    for group in groups.iterator():
+        yield from _group_rollups(family, spec, columns, group)
+
+
+def _locked_groups(spec, columns, queryset):
+    """加锁逐行读取记录并在内存中按分组累加，结果格式与 _annotations 的分组查询相同
+
+    加锁读取（SELECT ... FOR UPDATE）读到的是已提交的最新数据而不是事务快照，
+    同一分组的并发重算因此依次执行，不会各自用旧快照写入汇总。
+    """
+    flags = {
+        name: ExpressionWrapper(spec[name], output_field=BooleanField())
+        for name in ('pass', 'fail', 'pending')
+    }
+    rows = (
+        queryset.select_for_update()
+        .annotate(**{f'is_{name}': flag for name, flag in flags.items()})
+        .values(spec['code'], spec['line'], spec['date'], 'is_pass', 'is_fail', 'is_pending', *columns)
+        .order_by('pk')
+    )
+
+    groups = {}
+    for row in rows:
+        key = (row[spec['code']], row[spec['line']], row[spec['date']])
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                spec['code']: key[0], spec['line']: key[1], spec['date']: key[2],
+                'n': 0, 'passed': 0, 'failed': 0, 'pending': 0,
+            }
+            for column in columns:
+                group.update({
+                    f'{column}__n': 0, f'{column}__sum': 0.0, f'{column}__sq': 0.0,
+                    f'{column}__min': None, f'{column}__max': None,
+                    f'{column}__passed': 0, f'{column}__failed': 0, f'{column}__pending': 0,
+                })
+        counted = [name for name, flag in (('passed', 'is_pass'), ('failed', 'is_fail'), ('pending', 'is_pending'))
+                   if row[flag]]
+        group['n'] += 1
+        for name in counted:
+            group[name] += 1
+        for column in columns:
+            value = row[column]
+            if value is None:
+                continue
+            group[f'{column}__n'] += 1
+            group[f'{column}__sum'] += value
+            group[f'{column}__sq'] += value * value
+            low, high = group[f'{column}__min'], group[f'{column}__max']
+            group[f'{column}__min'] = value if low is None else min(low, value)
+            group[f'{column}__max'] = value if high is None else max(high, value)
+            for name in counted:
+                group[f'{column}__{name}'] += 1
+    return groups.values()
+
+
+def _group_rollups(family, spec, columns, group):
+    """一个 (牌号, 产线, 日期) 分组的记录汇总行和各检测项目汇总行"""
+    key = {
+        'family': family,
+        'code': group[spec['code']] or '',
+        'line': group[spec['line']] or '',
+        'day': group[spec['date']],
+    }
+    yield DailyRollup(
+        **key, test_item=RECORD_ITEM, count=group['n'],
+        pass_count=group['passed'], fail_count=group['failed'], pending_count=group['pending'],
+    )
+    for column in columns:
+        if not group[f'{column}__n']:
+            continue
+        yield DailyRollup(
+            **key, test_item=column,
+            count=group[f'{column}__n'],
+            total=group[f'{column}__sum'],
+            total_sq=group[f'{column}__sq'],
+            min_value=group[f'{column}__min'],
+            max_value=group[f'{column}__max'],
+            pass_count=group[f'{column}__passed'],
+            fail_count=group[f'{column}__failed'],
+            pending_count=group[f'{column}__pending'],
+        )
+
+
+def bucket_of(family, obj):
+    """记录所在的汇总分组 (牌号, 产线, 日期)"""
+    spec = ROLLUP_FAMILIES[family]
+    return (getattr(obj, spec['code']) or '', getattr(obj, spec['line']) or '', getattr(obj, spec['date']))
+
+
+def original_bucket_of(family, obj):
+    """记录修改前所在的汇总分组，新记录返回None"""
+    if not obj.pk:
+        return None
+    spec = ROLLUP_FAMILIES[family]
+    original = obj.get_original_values([spec['code'], spec['line'], spec['date']])
+    if not original:
+        return None
+    return (original[spec['code']] or '', original[spec['line']] or '', original[spec['date']])
+
+
+def _upsert_options():
+    """汇总行已存在时更新数值；MySQL 的 ON DUPLICATE KEY UPDATE 不指定冲突字段"""
+    options = {'update_conflicts': True, 'update_fields': ROLLUP_VALUE_FIELDS}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['family', 'code', 'line', 'test_item', 'day']
+    return options
+
+
+def refresh_buckets(family, buckets):
+    """重新计算指定分组的汇总数据，在调用方的事务中执行（没有事务时单独开启一个）
+
+    分组内的记录用加锁读取取出并在内存中汇总（见 _locked_groups），汇总行按唯一键写入或更新，
+    两个事务同时保存同一 (牌号, 产线, 日期) 的记录时不会写入过期的汇总，也不会违反唯一约束。
+    """
+    spec = ROLLUP_FAMILIES[family]
+    columns = get_family(family).numeric_columns
+    buckets = sorted(bucket for bucket in set(buckets) if bucket is not None and bucket[2] is not None)
+
+    with transaction.atomic():
+        for start in range(0, len(buckets), REFRESH_BATCH):
+            batch = buckets[start:start + REFRESH_BATCH]
+            source_filter = Q()
+            for code, line, day in batch:
+                source_filter |= Q(**{spec['code']: code, spec['line']: line, spec['date']: day})
+
+            # 先加锁读取分组内的记录，再替换汇总行；并发修改同一分组的事务在加锁处依次执行
+            groups = _locked_groups(spec, columns, spec['model'].objects.filter(source_filter))
+            rollups = [rollup for group in groups for rollup in _group_rollups(family, spec, columns, group)]
+            items = defaultdict(list)
+            for rollup in rollups:
+                items[(rollup.code, rollup.line, rollup.day)].append(rollup.test_item)
+            # 删除已没有记录的分组和已没有检测值的检测项目
+            stale = Q()
+            for code, line, day in batch:
+                stale |= Q(code=code, line=line, day=day) & ~Q(test_item__in=items[(code, line, day)])
+            DailyRollup.objects.filter(stale, family=family).delete()
+            DailyRollup.objects.bulk_create(rollups, **_upsert_options())
+
+
+def refresh_for_pks(family, pks):
+    """按记录主键重新计算其所在分组，用于不经过模型信号的批量写入"""
+    if not pks:
+        return
+    spec = ROLLUP_FAMILIES[family]
+    buckets = spec['model'].objects.filter(pk__in=pks).values_list(spec['code'], spec['line'], spec['date']).distinct()
+    refresh_buckets(family, [(code or '', line or '', day) for code, line, day in buckets])
+
+
+def rebuild(family, batch_size=2000, queryset=None):
+    """清空并重建某类型的全部汇总数据，返回写入的行数；queryset 为空时使用该类型的全部记录"""
+    created = 0
+    with transaction.atomic():
+        DailyRollup.objects.filter(family=family).delete()
+        batch = []
+        for rollup in aggregate_rollups(family, queryset):
+            batch.append(rollup)
+            if len(batch) >= batch_size:
+                DailyRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            DailyRollup.objects.bulk_create(batch)
+            created += len(batch)
+        invalidate(ROLLUP_FAMILIES[family]['scope'], [])
+    return created
+
+
+def _rollup_queryset(family, test_item, code=None, line=None, start_date=None, end_date=None):
+    queryset = DailyRollup.objects.filter(family=family, test_item=test_item)
+    if code:
+        queryset = queryset.filter(code=code)
+    if line:
+        queryset = queryset.filter(line=line)
+    if start_date:
+        queryset = queryset.filter(day__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(day__lte=end_date)
+    return queryset
+
+
+def _moments(count, total, total_sq):
+    """由数量、合计和平方和计算均值和总体标准差"""
+    if not count:
+        return None, None
+    mean = total / count
+    # 浮点误差可能使方差略小于0
+    variance = max(total_sq / count - mean * mean, 0.0)
+    return mean, math.sqrt(variance)
+
+
+def trend_series(family, test_item, bucket='day', **filters):
+    """按日/月/年汇总的趋势数据，返回各时间段的数量、均值、标准差、极值和判定统计"""
+    if bucket not in BUCKETS:
+        raise ValueError(f'无效的时间粒度: {bucket}')
+
+    queryset = _rollup_queryset(family, test_item, **filters)
+    trunc, label_format = BUCKETS[bucket]
+    period = trunc('day') if trunc else F('day')
+    rows = (
+        queryset.annotate(period=period).values('period')
+        .annotate(
+            n=Sum('count'), total_sum=Sum('total'), sq_sum=Sum('total_sq'),
+            low=Min('min_value'), high=Max('max_value'),
+            passed=Sum('pass_count'), failed=Sum('fail_count'), pending=Sum('pending_count'),
+        )
+        .order_by('period')
+    )
+
+    series = []
+    for row in rows:
+        mean, std_dev = _moments(row['n'], row['total_sum'], row['sq_sum'])
+        series.append({
+            'period': row['period'].strftime(label_format),
+            'count': row['n'],
+            'mean': mean if test_item != RECORD_ITEM else None,
+            'std_dev': std_dev if test_item != RECORD_ITEM else None,
+            'min': row['low'],
+            'max': row['high'],
+            'pass_count': row['passed'],
+            'fail_count': row['failed'],
+            'pending_count': row['pending'],
+        })
+    return series
+
+
+def judgment_counts(family, group_by=None, **filters):
+    """按记录统计合格/不合格/待判定数量；group_by 为 'code' 或 'line' 时分组返回"""
+    queryset = _rollup_queryset(family, RECORD_ITEM, **filters)
+    totals = dict(
+        total=Sum('count'), qualified=Sum('pass_count'),
+        unqualified=Sum('fail_count'), pending=Sum('pending_count'),
+    )
+    if group_by is None:
+        result = queryset.aggregate(**totals)
+        return {key: value or 0 for key, value in result.items()}
+    return list(queryset.values(group_by).annotate(**totals).order_by(group_by))
+
+
+def item_summary(family, test_item, **filters):
+    """检测项目的汇总统计：平均值、最大值、最小值和数量"""
+    result = _rollup_queryset(family, test_item, **filters).aggregate(
+        n=Sum('count'), total_sum=Sum('total'), low=Min('min_value'), high=Max('max_value'),
+    )
+    count = result['n'] or 0
+    return {
+        'avg': result['total_sum'] / count if count else None,
+        'max': result['high'],
+        'min': result['low'],
+        'count': count,
+    }
+
+
+def _judgment_totals():
+    return {'total': 0, 'qualified': 0, 'unqualified': 0, 'pending': 0}
+
+
+def _source_snapshot_rows(family):
+    """汇总表没有该类型的数据时，直接按 (牌号, 产线) 条件聚合原始记录，生成与汇总表查询相同格式的行"""
+    spec = ROLLUP_FAMILIES[family]
+    columns = get_family(family).numeric_columns
+    groups = (
+        spec['model'].objects.values(spec['code'], spec['line'])
+        .annotate(**_annotations(spec, columns))
+        .order_by()
+    )
+    for group in groups:
+        key = {'code': group[spec['code']] or '', 'line': group[spec['line']] or ''}
+        yield {
+            **key, 'test_item': RECORD_ITEM, 'n': group['n'], 'total_sum': None, 'low': None, 'high': None,
+            'passed': group['passed'], 'failed': group['failed'], 'pending': group['pending'],
+        }
+        for column in columns:
+            yield {
+                **key, 'test_item': column, 'n': group[f'{column}__n'], 'total_sum': group[f'{column}__sum'],
+                'low': group[f'{column}__min'], 'high': group[f'{column}__max'],
+                'passed': group[f'{column}__passed'], 'failed': group[f'{column}__failed'],
+                'pending': group[f'{column}__pending'],
+            }
+
+
+def compute_stats_snapshot(family):
+    """一次按 (牌号, 产线, 检测项目) 分组查询汇总表，合并出全部统计数据
+
+    返回 {'total': 判定统计, 'by_code': [...], 'by_line': [...], 'items': {检测项目: 汇总统计}}，
+    by_code/by_line 每项为判定统计加上 'code'/'line'，按分组键排序；
+    判定统计和汇总统计的格式与 judgment_counts、item_summary 相同。
+    汇总表还没有该类型的数据（尚未回填）时改为一次条件聚合查询原始记录，结果相同。
+    """
+    rows = list(
+        DailyRollup.objects.filter(family=family)
+        .values('code', 'line', 'test_item')
+        .annotate(
+            n=Sum('count'), total_sum=Sum('total'), low=Min('min_value'), high=Max('max_value'),
+            passed=Sum('pass_count'), failed=Sum('fail_count'), pending=Sum('pending_count'),
+        )
+        .order_by()
+    )
+    if not rows:
+        rows = _source_snapshot_rows(family)
+
+    total = _judgment_totals()
+    by_code = {}
+    by_line = {}
+    items = {column: {'n': 0, 'sum': 0.0, 'low': None, 'high': None} for column in get_family(family).numeric_columns}
+    for row in rows:
+        if row['test_item'] == RECORD_ITEM:
+            counts = {'total': row['n'], 'qualified': row['passed'], 'unqualified': row['failed'], 'pending': row['pending']}
+            for target in (total, by_code.setdefault(row['code'], _judgment_totals()),
+                           by_line.setdefault(row['line'], _judgment_totals())):
+                for key, value in counts.items():
+                    target[key] += value or 0
+            continue
+
+        item = items.get(row['test_item'])
+        if item is None or not row['n']:
+            continue
+        item['n'] += row['n']
+        item['sum'] += row['total_sum']
+        item['low'] = row['low'] if item['low'] is None else min(item['low'], row['low'])
+        item['high'] = row['high'] if item['high'] is None else max(item['high'], row['high'])
+
+    return {
+        'total': total,
+        'by_code': [{'code': code, **by_code[code]} for code in sorted(by_code)],
+        'by_line': [{'line': line, **by_line[line]} for line in sorted(by_line)],
+        'items': {
+            column: {
+                'avg': item['sum'] / item['n'] if item['n'] else None,
+                'max': item['high'],
+                'min': item['low'],
+                'count': item['n'],
+            }
+            for column, item in items.items()
+        },
+    }
+
+
+def stats_snapshot(family):
+    """缓存的统计快照，该类型的记录写入后（缓存范围版本号变化）重新计算"""
+    return cached_value(
+        ROLLUP_FAMILIES[family]['scope'], f'stats_snapshot:{family}',
+        lambda: compute_stats_snapshot(family),
+    )
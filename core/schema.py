@@ -0,0 +1,167 @@
+"""检测项目注册表 - 各产品类型的检测项目、字段名、中文名称和数据类型
+
+模块导入时编译一次，判定、SPC、导出、报告和管理界面都从这里查找检测项目，
+不再各自维护字段列表或在每次调用时重建映射。
+"""
+
+from operator import attrgetter
+
+NUMERIC = 'numeric'
+TEXT = 'text'
+
+
+class TestItem:
+    """单个检测项目"""
+
+    __slots__ = ('name', 'label', 'report_label', 'kind', 'group', 'standard')
+
+    def __init__(self, name, label, kind=NUMERIC, report_label=None, group='', standard=False):
+        self.name = name
+        # 与模型字段 verbose_name 一致的名称
+        self.label = label
+        # 报告中使用的名称
+        self.report_label = report_label or label
+        self.kind = kind
+        self.group = group
+        # 是否可以在产品标准（ProductStandard.TEST_ITEMS）中设置上下限
+        self.standard = standard
+
+    @property
+    def column(self):
+        """模型中的字段名"""
+        return self.name
+
+    @property
+    def is_numeric(self):
+        return self.kind == NUMERIC
+
+    def __repr__(self):
+        return f'TestItem({self.name!r})'
+
+
+class FamilySchema:
+    """某一产品类型的检测项目集合"""
+
+    def __init__(self, name, label, items):
+        self.name = name
+        self.label = label
+        self.items = tuple(items)
+        self.by_name = {item.name: item for item in self.items}
+        self.columns = [item.column for item in self.items]
+        self.labels = {item.name: item.label for item in self.items}
+        self.numeric_items = tuple(item for item in self.items if item.is_numeric)
+        self.text_items = tuple(item for item in self.items if not item.is_numeric)
+        self.numeric_columns = [item.column for item in self.numeric_items]
+        self._getter = attrgetter(*self.columns)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def numeric(self, name):
+        """获取数值型检测项目，不存在或不是数值时返回None"""
+        item = self.by_name.get(name)
+        return item if item is not None and item.is_numeric else None
+
+    def group(self, group):
+        return tuple(item for item in self.items if item.group == group)
+
+    def values(self, obj):
+        """一次取出记录的全部检测值，返回 {字段名: 值}"""
+        return dict(zip(self.columns, self._getter(obj)))
+
+    def without(self, *names):
+        """除指定名称外的检测项目"""
+        return tuple(item for item in self.items if item.name not in names)
+
+    def export_columns(self, head, tail, items=None):
+        """导出字段和表头：head、tail 为检测项目前后的 (字段名, 表头) 列表，items 默认为全部检测项目"""
+        items = self.items if items is None else items
+        columns = list(head) + [(item.column, item.label) for item in items] + list(tail)
+        return [field for field, _ in columns], [label for _, label in columns]
+
+    def filled_lines(self, obj, items=None):
+        """不为空的检测值，格式为 '名称: 值'，用于复制文本"""
+        items = self.items if items is None else items
+        lines = []
+        for item in items:
+            value = getattr(obj, item.column)
+            if value is not None and value != "":
+                lines.append(f"{item.label}: {value}")
+        return lines
+
+
+# 产品检测项目（顺序与模型字段一致）
+_PRODUCT_ITEMS = {
+    'appearance': TestItem('appearance', '外观', TEXT, group='physical'),
+    'solid_content': TestItem('solid_content', '固含', group='physical'),
+    'viscosity': TestItem('viscosity', '粘度', group='physical'),
+    'acid_value': TestItem('acid_value', '酸值', group='physical'),
+    'moisture': TestItem('moisture', '水分', group='physical'),
+    'residual_monomer': TestItem('residual_monomer', '残单', group='physical'),
+    'weight_avg_molecular_weight': TestItem('weight_avg_molecular_weight', '重均分子量', group='physical'),
+    'pdi': TestItem('pdi', 'PDI', group='physical'),
+    'color': TestItem('color', '色度', group='physical'),
+    'polymerization_inhibitor': TestItem('polymerization_inhibitor', '阻聚剂', group='process'),
+    'conversion_rate': TestItem('conversion_rate', '转化率', group='process'),
+    'loading_temperature': TestItem('loading_temperature', '装车温度', group='process'),
+    'dispersion': TestItem('dispersion', '分散性', group='physical'),
+    'stability': TestItem('stability', '稳定性', group='physical'),
+    'initial_tack': TestItem('initial_tack', '初粘', report_label='初粘力', group='tape'),
+    'peel_strength': TestItem('peel_strength', '剥离', report_label='剥离力', group='tape'),
+    'high_temperature_holding': TestItem('high_temperature_holding', '高温持粘', group='tape'),
+    'room_temperature_holding': TestItem('room_temperature_holding', '常温持粘', group='tape'),
+    'constant_load_peel': TestItem('constant_load_peel', '定荷重剥离', group='tape'),
+    'tape_structure': TestItem('tape_structure', '胶带结构', TEXT, group='tape'),
+}
+
+_PHYSICAL = [
+    'appearance', 'solid_content', 'viscosity', 'acid_value', 'moisture',
+    'residual_monomer', 'weight_avg_molecular_weight', 'pdi', 'color',
+]
+_PROCESS = ['polymerization_inhibitor', 'conversion_rate', 'loading_temperature']
+_TAPE = [
+    'initial_tack', 'peel_strength', 'high_temperature_holding',
+    'room_temperature_holding', 'constant_load_peel', 'tape_structure',
+]
+
+# 原料检测项目
+_RAW_MATERIAL_ITEMS = [
+    TestItem('appearance', '外观', TEXT),
+    TestItem('purity', '纯度'),
+    TestItem('peak_position', '出峰位置'),
+    TestItem('inhibitor_content', '阻聚剂含量'),
+    TestItem('moisture_content', '水分含量'),
+    TestItem('color', '色度'),
+    TestItem('ethanol_content', '乙醇含量'),
+    TestItem('acidity', '酸度'),
+]
+
+FAMILIES = {
+    'dryfilm': FamilySchema(
+        'dryfilm', '干膜产品',
+        [_PRODUCT_ITEMS[name] for name in _PHYSICAL + _PROCESS + ['dispersion', 'stability']]
+    ),
+    'adhesive': FamilySchema('adhesive', '胶粘剂产品', [_PRODUCT_ITEMS[name] for name in _PHYSICAL + _TAPE]),
+    'pilot': FamilySchema('pilot', '小试产品', [_PRODUCT_ITEMS[name] for name in _PHYSICAL + _PROCESS]),
+    'raw_material': FamilySchema('raw_material', '原料', _RAW_MATERIAL_ITEMS),
+}
+
+# 工艺类检测项目不在产品标准中设置上下限
+for _item in _PRODUCT_ITEMS.values():
+    _item.standard = _item.group != 'process'
+
+# 全部产品检测项目的报告名称
+REPORT_LABELS = {name: item.report_label for name, item in _PRODUCT_ITEMS.items()}
+
+
+def get_family(product_type):
+    """获取产品类型的检测项目集合，类型不存在时抛出 KeyError"""
+    return FAMILIES[product_type]
+
+
+def report_label(test_item):
+    """检测项目在报告中的中文名称"""
+    return REPORT_LABELS.get(test_item, test_item)
@@ -0,0 +1,153 @@
+"""产品查询 - 按 (日期倒序, 批号) 的游标分页和字段投影
+
+每页只查询 limit + 1 行，下一页从上一页最后一条记录的 (日期, 批号) 之后继续，
+不使用 OFFSET，翻到任何一页的开销都相同；fields 参数指定返回的字段，
+直接用 values() 查询这些列，不实例化模型对象。
+
+match=prefix 时牌号和批号按前缀匹配（startswith），可以使用牌号和批号上的索引；
+默认的 contains（icontains）保持原来的模糊匹配行为，但需要扫描全表。
+"""
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.db import models
+from django.db.models import Q
+
+from core.spc import SPC_PRODUCT_TYPES
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+MATCH_LOOKUPS = {
+    'contains': 'icontains',
+    'prefix': 'startswith',
+}
+
+# 不允许通过 fields 参数查询的字段
+HIDDEN_FIELDS = {'judgment_details', 'modification_reason'}
+
+
+def default_fields(product_type):
+    """未指定 fields 时返回的字段，与原来的查询结果一致"""
+    spec = SPC_PRODUCT_TYPES[product_type]
+    return [
+        'id', 'product_code', 'batch_number', 'production_line', 'test_date', 'judgment_status',
+        *spec['judgment_fields'], *spec['detail_fields'],
+    ]
+
+
+def selectable_fields(product_type):
+    """可以查询的字段：模型的普通字段，另外 test_date 总是表示该类型的测试日期"""
+    model = SPC_PRODUCT_TYPES[product_type]['model']
+    fields = [
+        field.name for field in model._meta.concrete_fields
+        if field.name not in HIDDEN_FIELDS and not isinstance(field, models.JSONField)
+    ]
+    if 'test_date' not in fields:
+        fields.append('test_date')
+    return fields
+
+
+def parse_fields(product_type, value):
+    """解析 fields 参数（逗号分隔），为空时返回默认字段"""
+    if not value:
+        return default_fields(product_type)
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in selectable_fields(product_type)]
+    if unknown:
+        raise ValueError(f"无效的字段: {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'无效的每页数量: {value}')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'每页数量应在1到{MAX_LIMIT}之间')
+    return limit
+
+
+def encode_cursor(date_value, batch_number):
+    raw = json.dumps([date_value.isoformat(), batch_number], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (日期, 批号)"""
+    try:
+        date_text, batch_number = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.date.fromisoformat(date_text), str(batch_number)
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise ValueError('无效的分页游标')
+
+
+def search_queryset(product_type, match='contains', product_code=None, batch_number=None,
+                    production_line=None, start_date=None, end_date=None):
+    """按查询条件筛选的产品查询集（未分页），参数无效时抛出 ValueError"""
+    spec = SPC_PRODUCT_TYPES.get(product_type)
+    if spec is None:
+        raise ValueError('Invalid product type')
+    lookup = MATCH_LOOKUPS.get(match)
+    if lookup is None:
+        raise ValueError(f'无效的匹配方式: {match}')
+
+    date_field = spec['date_field']
+    filters = {}
+    if product_code:
+        filters[f'product_code__{lookup}'] = product_code
+    if batch_number:
+        filters[f'batch_number__{lookup}'] = batch_number
+    if production_line:
+        filters['production_line'] = production_line
+    if start_date:
+        filters[f'{date_field}__gte'] = start_date
+    if end_date:
+        filters[f'{date_field}__lte'] = end_date
+    return spec['model'].objects.filter(**filters)
+
+
+def search_page(product_type, fields=None, cursor=None, limit=DEFAULT_LIMIT, **filter_params):
+    """查询一页产品，返回 {'products': [...], 'next_cursor': 下一页游标或None}
+
+    filter_params 为 search_queryset 的查询条件，参数无效时抛出 ValueError。
+    """
+    queryset = search_queryset(product_type, **filter_params)
+    date_field = SPC_PRODUCT_TYPES[product_type]['date_field']
+    fields = default_fields(product_type) if fields is None else fields
+
+    if cursor:
+        last_date, last_batch = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__lt': last_date})
+            | Q(**{date_field: last_date, 'batch_number__gt': last_batch})
+        )
+
+    # 日期和批号总是查询，用于生成下一页的游标
+    columns = [date_field if field == 'test_date' else field for field in fields]
+    columns = list(dict.fromkeys(columns + [date_field, 'batch_number']))
+    rows = list(
+        queryset.order_by(f'-{date_field}', 'batch_number').values(*columns)[:limit + 1]
+    )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][date_field], rows[-1]['batch_number'])
+
+    products = []
+    for row in rows:
+        product = {}
+        for field in fields:
+            value = row[date_field if field == 'test_date' else field]
+            if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+                value = value.strftime('%Y-%m-%d')
+            product[field] = value
+        products.append(product)
+    return {'products': products, 'next_cursor': next_cursor}
@@ -0,0 +1,185 @@
+"""SPC 组合数据 - 一次查询同时生成单值图、移动极差、过程能力和查询结果
+
+仪表盘每次修改筛选条件只需请求一次，所有部分都从同一次 values_list 查询的结果计算，
+不再各自构建筛选条件、重复执行相同的查询并实例化完整的模型对象。
+"""
+
+import numpy as np
+
+from products.models import DryFilmProduct, AdhesiveProduct
+from core.schema import get_family
+from core.downsample import downsample_indices, take
+from core.utils import (
+    calculate_statistics, calculate_moving_range_data, calculate_capability_analysis,
+    as_float_array, get_batch_label, get_product_standard
+)
+
+# 各产品类型的查询配置：日期字段、判定字段和查询结果中附带的字段
+SPC_PRODUCT_TYPES = {
+    'dryfilm': {
+        'model': DryFilmProduct,
+        'date_field': 'test_date',
+        'judgment_fields': ['external_final_judgment', 'internal_final_judgment'],
+        'detail_fields': ['inspector', 'solid_content', 'viscosity', 'acid_value'],
+    },
+    'adhesive': {
+        'model': AdhesiveProduct,
+        'date_field': 'physical_test_date',
+        'judgment_fields': ['physical_judgment', 'tape_judgment', 'final_judgment'],
+        'detail_fields': ['physical_inspector', 'tape_inspector', 'solid_content', 'viscosity', 'acid_value'],
+    },
+}
+
+SPC_PARTS = ('series', 'moving_range', 'capability', 'search')
+
+# 需要检测项目的部分
+VALUE_PARTS = {'series', 'moving_range', 'capability'}
+
+
+def parse_parts(value):
+    """解析 parts 参数（逗号分隔），为空时返回全部部分"""
+    if not value:
+        return list(SPC_PARTS)
+    parts = [part.strip() for part in value.split(',') if part.strip()]
+    unknown = [part for part in parts if part not in SPC_PARTS]
+    if unknown:
+        raise ValueError(f"无效的数据部分: {', '.join(unknown)}")
+    return parts
+
+
+def build_filters(date_field, product_code=None, production_line=None, start_date=None,
+                  end_date=None, batch_number=None):
+    """构建与各图表接口一致的查询条件"""
+    filters = {}
+    if product_code:
+        filters['product_code'] = product_code
+    if batch_number:
+        filters['batch_number__icontains'] = batch_number
+    if production_line:
+        filters['production_line'] = production_line
+    if start_date:
+        filters[f'{date_field}__gte'] = start_date
+    if end_date:
+        filters[f'{date_field}__lte'] = end_date
+    return filters
+
+
+def keep_mask(values, statistics, usl=None, lsl=None, moving_range_statistics=None):
+    """降采样时必须保留的点：超出规格限、超出 ±3σ 控制限或移动极差超出上控制限的点"""
+    keep = np.zeros(values.size, dtype=bool)
+    if statistics['std_dev'] > 0:
+        lines = statistics['std_dev_lines']
+        keep |= (values > lines['plus_3sigma']) | (values < lines['minus_3sigma'])
+    if usl is not None:
+        keep |= values > usl
+    if lsl is not None:
+        keep |= values < lsl
+    if moving_range_statistics and moving_range_statistics['ucl_mr'] > 0 and values.size > 1:
+        keep[1:] |= np.abs(np.diff(values)) > moving_range_statistics['ucl_mr']
+    return keep
+
+
+def sample_series(values, max_points, product_code=None, test_item=None, statistics=None,
+                  moving_range_statistics=None):
+    """计算单值图和移动极差图降采样后保留的下标，不需要降采样时返回None
+
+    统计量由调用方用完整数据计算后传入，控制限和规格限以外的点总是保留。
+    """
+    if max_points is None or values.size <= max_points:
+        return None
+    statistics = statistics or calculate_statistics(values)
+    usl, lsl, _ = get_product_standard(product_code, test_item, statistics['average'])
+    return downsample_indices(
+        values, max_points, keep_mask(values, statistics, usl, lsl, moving_range_statistics)
+    )
+
+
+def sampled(part, indices, total, keys):
+    """按保留的下标截取各序列，并记录原始点数和保留点的下标"""
+    if indices is None:
+        return part
+    for key in keys:
+        part[key] = take(part[key], indices)
+    part['downsample'] = {'total_points': total, 'indices': indices.tolist()}
+    return part
+
+
+def build_spc_payload(product_type, test_item=None, parts=SPC_PARTS, max_points=None, **filter_params):
+    """按需计算 SPC 各部分数据，只执行一次数据库查询
+
+    max_points 不为空时单值图和移动极差图按 LTTB 降采样，统计量仍使用完整数据。
+    product_type 或 test_item 无效时抛出 ValueError。
+    """
+    spec = SPC_PRODUCT_TYPES.get(product_type)
+    if spec is None:
+        raise ValueError('Invalid product type')
+
+    parts = set(parts)
+    item = None
+    if parts & VALUE_PARTS:
+        item = get_family(product_type).numeric(test_item)
+        if item is None:
+            raise ValueError(f'无效的检测项目: {test_item}')
+
+    date_field = spec['date_field']
+    columns = ['batch_number', date_field]
+    if item is not None:
+        columns.append(item.column)
+    search_columns = []
+    if 'search' in parts:
+        search_columns = [
+            'id', 'product_code', 'production_line', 'judgment_status',
+            *spec['judgment_fields'], *spec['detail_fields'],
+        ]
+        columns += [column for column in search_columns if column not in columns]
+
+    rows = list(
+        spec['model'].objects.filter(**build_filters(date_field, **filter_params))
+        .order_by(date_field, 'batch_number')
+        .values_list(*columns)
+    )
+
+    payload = {}
+    if item is not None:
+        value_index = columns.index(item.column)
+        labels = [get_batch_label(row[0], row[1]) for row in rows]
+        values = as_float_array([row[value_index] for row in rows])
+        statistics = calculate_statistics(values)
+        moving_range_result = calculate_moving_range_data(values)
+        # 两个图表使用相同的下标，保持横轴一致
+        indices = sample_series(
+            values, max_points, filter_params.get('product_code'), item.name,
+            statistics, moving_range_result['statistics']
+        )
+
+        if 'series' in parts:
+            payload['series'] = sampled({
+                'labels': labels,
+                'data': values,
+                'statistics': statistics,
+            }, indices, len(rows), ['labels', 'data'])
+        if 'moving_range' in parts:
+            payload['moving_range'] = sampled({
+                'labels': labels,
+                'data_values': values,
+                'moving_ranges': moving_range_result['moving_ranges'],
+                'statistics': moving_range_result['statistics'],
+            }, indices, len(rows), ['labels', 'data_values', 'moving_ranges'])
+        if 'capability' in parts:
+            payload['capability'] = calculate_capability_analysis(
+                values[~np.isnan(values)],
+                filter_params.get('product_code'), item.name
+            )
+
+    if 'search' in parts:
+        positions = [columns.index(column) for column in search_columns]
+        products = []
+        # 查询结果按日期倒序；sorted 是稳定排序，同一日期内仍按批号升序
+        for row in sorted(rows, key=lambda row: row[1], reverse=True):
+            product = {column: row[position] for column, position in zip(search_columns, positions)}
+            product['batch_number'] = row[0]
+            product['test_date'] = row[1].strftime('%Y-%m-%d') if row[1] else ''
+            products.append(product)
+        payload['search'] = {'products': products}
+
+    return payload
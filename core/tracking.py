@@ -0,0 +1,135 @@
+"""字段变更跟踪 - 实例从数据库加载时记录字段原值，保存时直接与原值比较
+
+模型保存和管理后台共用同一份原值快照，生成修改历史时不再重新查询数据库。
+只有实例没有快照（例如手动构造并指定主键）时才回退为查询一次数据库。
+"""
+
+import copy
+import datetime
+from decimal import Decimal
+
+# 不参与修改比较的字段
+TRACKING_EXCLUDED_FIELDS = ['created_at', 'updated_at', 'modified_by', 'modification_reason']
+
+
+def _history_value(value):
+    """转换为可写入 JSONField 的值"""
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class TrackedModelMixin:
+    """在 from_db 时记录字段原值的模型混入类"""
+
+    # 没有字段变化时写入历史记录使用的修改原因，为None时不写入
+    history_empty_reason = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._take_snapshot(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # 保存后的值成为下一次比较的原值
+        self._take_snapshot(kwargs.get('update_fields'))
+
+    def _take_snapshot(self, fields=None):
+        """记录已加载字段的当前值；fields 不为空时只更新这些字段"""
+        if fields is None or not hasattr(self, '_original_values'):
+            self._original_values = {}
+        deferred = self.get_deferred_fields()
+
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if fields is not None and field.name not in fields and field.attname not in fields:
+                continue
+            # JSON字段可能被原地修改，需要深拷贝
+            self._original_values[field.name] = copy.deepcopy(getattr(self, field.attname))
+
+    def get_original_values(self, field_names):
+        """获取字段原值；快照中没有的字段查询一次数据库补齐"""
+        snapshot = getattr(self, '_original_values', None)
+        if snapshot is None:
+            snapshot = self._original_values = {}
+
+        missing = [name for name in field_names if name not in snapshot]
+        if missing and self.pk is not None:
+            row = type(self)._base_manager.filter(pk=self.pk).values(*missing).first()
+            if row:
+                snapshot.update(row)
+
+        return {name: snapshot[name] for name in field_names if name in snapshot}
+
+    def get_original_value(self, field_name):
+        return self.get_original_values([field_name]).get(field_name)
+
+    def get_changes(self, update_fields=None):
+        """与原值比较，返回 (修改描述列表, 修改数据)
+
+        update_fields 不为空时只比较即将写入的字段。
+        """
+        fields = [
+            field for field in self._meta.concrete_fields
+            if field.name not in TRACKING_EXCLUDED_FIELDS
+            and (update_fields is None or field.name in update_fields)
+        ]
+        original_values = self.get_original_values([field.name for field in fields])
+
+        changed_fields = []
+        modified_data = {}
+        for field in fields:
+            if field.name not in original_values:
+                continue
+            original_value = original_values[field.name]
+            new_value = getattr(self, field.attname)
+
+            if original_value != new_value:
+                changed_fields.append(f"{field.verbose_name}: {original_value} → {new_value}")
+                modified_data[field.name] = {
+                    'old': _history_value(original_value),
+                    'new': _history_value(new_value)
+                }
+        return changed_fields, modified_data
+
+    def record_history(self, history_model, related_name, update_fields=None, empty_reason=None):
+        """比较字段变化并写入一条修改历史，返回创建的历史记录
+
+        新对象不记录；没有字段变化时只有提供 empty_reason 才记录。
+        """
+        history = self.build_history(history_model, related_name, update_fields, empty_reason)
+        if history is not None:
+            history.save()
+        return history
+
+    def build_history(self, history_model, related_name, update_fields=None, empty_reason=None):
+        """生成未保存的修改历史记录，供批量写入使用，规则同 record_history"""
+        if self.pk is None:
+            return None
+
+        changed_fields, modified_data = self.get_changes(update_fields)
+        if changed_fields:
+            # 自动生成修改描述
+            if not self.modification_reason:
+                self.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
+        elif empty_reason:
+            if not self.modification_reason:
+                self.modification_reason = empty_reason
+        else:
+            return None
+
+        return history_model(**{
+            related_name: self,
+            'modified_by': self.modified_by if self.modified_by else 'system',
+            'modification_reason': self.modification_reason,
+            'modified_data': modified_data,
+        })
@@ -1,6 +1,10 @@
 from django.urls import path
 from . import views
-from .api_views import get_product_data, search_products, get_moving_range_data, get_capability_analysis_data
+from .api_views import (
+    get_product_data, search_products, get_moving_range_data, get_capability_analysis_data,
+    get_subgroup_data, get_capability_matrix, get_spc_data, get_trend_data, get_cache_stats,
+    get_rejudge_status, ingest_measurements
+)
 
 urlpatterns = [
     path('clipboard-test/', views.clipboard_test, name='clipboard_test'),
@@ -9,4 +13,11 @@ urlpatterns = [
     path('api/products/<str:product_type>/search/', search_products, name='product_search'),
     path('api/products/<str:product_type>/moving-range/', get_moving_range_data, name='moving_range_data'),
     path('api/products/<str:product_type>/capability-analysis/', get_capability_analysis_data, name='capability_analysis'),
+    path('api/products/<str:product_type>/subgroup/', get_subgroup_data, name='product_subgroup_data'),
+    path('api/products/<str:product_type>/capability-matrix/', get_capability_matrix, name='capability_matrix'),
+    path('api/products/<str:product_type>/spc/', get_spc_data, name='product_spc_data'),
+    path('api/trend/<str:family>/', get_trend_data, name='trend_data'),
+    path('api/cache-stats/', get_cache_stats, name='cache_stats'),
+    path('api/rejudge-status/', get_rejudge_status, name='rejudge_status'),
+    path('api/ingest/<str:product_type>/', ingest_measurements, name='ingest_measurements'),
 ]
@@ -1,101 +1,144 @@
-"""通用工具函数模块 - 用于提取重复的统计计算逻辑"""
+"""通用工具函数模块 - 用于提取重复的统计计算逻辑
+
+SciPy 和 openpyxl 在函数内首次使用时才导入，只提供管理页面的进程不必加载它们。
+"""
 
 import csv
 import io
 from django.http import HttpResponse
 from django.db.models import Avg, StdDev
 import numpy as np
-from scipy import stats
-from products.models import ProductStandard
-import openpyxl
-from openpyxl.utils import get_column_letter
+from products.standards import get_standards_index
+from core.schema import get_family
+
+SIGMA_LEVELS = (1, 2, 3, 4, 5)
+
+def as_float_array(values):
+    """把检测值序列转换为浮点数组，None 转为 NaN"""
+    if isinstance(values, np.ndarray):
+        return values.astype(float, copy=False)
+    values = list(values)
+    return np.fromiter((np.nan if v is None else v for v in values), dtype=float, count=len(values))
+
+def array_to_list(values):
+    """浮点数组（任意维数）转换为可序列化的嵌套列表，NaN 转回 None"""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isnan(values), None, values.astype(object)).tolist()
+
+def fetch_series(queryset, date_field, column):
+    """只查询 (批号, 日期, 检测值) 三列，返回图表标签和检测值数组（缺失值为NaN）"""
+    rows = list(queryset.values_list('batch_number', date_field, column))
+    labels = [get_batch_label(batch_number, date_value) for batch_number, date_value, _ in rows]
+    return labels, as_float_array([row[2] for row in rows])
 
 def calculate_statistics(data_values):
-    """计算基本统计信息"""
-    valid_data = [x for x in data_values if x is not None]
-    if not valid_data:
-        return {
-            'average': 0,
-            'std_dev': 0,
-            'std_dev_lines': {
-                'plus_1sigma': 0, 'minus_1sigma': 0,
-                'plus_2sigma': 0, 'minus_2sigma': 0,
-                'plus_3sigma': 0, 'minus_3sigma': 0,
-                'plus_4sigma': 0, 'minus_4sigma': 0,
-                'plus_5sigma': 0, 'minus_5sigma': 0,
-            }
-        }
+    """计算基本统计信息（总体标准差），data_values 可以是列表或数组，缺失值会被忽略"""
+    data_array = as_float_array(data_values)
+    valid_data = data_array[~np.isnan(data_array)]
+    if not valid_data.size:
+        avg = std_dev = 0
+    else:
+        avg = float(valid_data.mean())
+        std_dev = float(valid_data.std())
     
-    avg = sum(valid_data) / len(valid_data)
-    std_dev = (sum((x - avg) ** 2 for x in valid_data) / len(valid_data)) ** 0.5
+    std_dev_lines = {}
+    for level in SIGMA_LEVELS:
+        std_dev_lines[f'plus_{level}sigma'] = avg + level * std_dev
+        std_dev_lines[f'minus_{level}sigma'] = avg - level * std_dev
     
     return {
         'average': avg,
         'std_dev': std_dev,
-        'std_dev_lines': {
-            'plus_1sigma': avg + std_dev,
-            'minus_1sigma': avg - std_dev,
-            'plus_2sigma': avg + 2 * std_dev,
-            'minus_2sigma': avg - 2 * std_dev,
-            'plus_3sigma': avg + 3 * std_dev,
-            'minus_3sigma': avg - 3 * std_dev,
-            'plus_4sigma': avg + 4 * std_dev,
-            'minus_4sigma': avg - 4 * std_dev,
-            'plus_5sigma': avg + 5 * std_dev,
-            'minus_5sigma': avg - 5 * std_dev,
-        }
+        'std_dev_lines': std_dev_lines,
     }
 
-def get_product_field_value(product, test_item, product_type='dryfilm'):
-    """根据测试项目获取产品字段值"""
-    field_mapping = {
-        'dryfilm': {
-            'solid_content': 'solid_content',
-            'viscosity': 'viscosity',
-            'acid_value': 'acid_value',
-            'moisture': 'moisture',
-            'residual_monomer': 'residual_monomer',
-            'weight_avg_molecular_weight': 'weight_avg_molecular_weight',
-            'pdi': 'pdi',
-            'color': 'color',
-        },
-        'adhesive': {
-            'solid_content': 'solid_content',
-            'viscosity': 'viscosity',
-            'acid_value': 'acid_value',
-            'moisture': 'moisture',
-            'residual_monomer': 'residual_monomer',
-            'weight_avg_molecular_weight': 'weight_avg_molecular_weight',
-            'pdi': 'pdi',
-            'color': 'color',
-            'initial_tack': 'initial_tack',
-            'peel_strength': 'peel_strength',
-            'high_temperature_holding': 'high_temperature_holding',
-            'room_temperature_holding': 'room_temperature_holding',
-            'constant_load_peel': 'constant_load_peel',
-        }
+def pairwise_pearson(matrix):
+    """按列计算两两 Pearson 相关系数和双侧 p 值，每一对只使用两列都不缺失的行
+
+    matrix 为 (样本数, 列数) 的浮点数组，缺失值为 NaN。返回 (r, p, n) 三个 (列数, 列数) 数组，
+    样本数少于2或某列方差为0时该对的 r 和 p 为 NaN；结果与逐对调用 stats.pearsonr 一致。
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    present = (~np.isnan(matrix)).astype(float)
+    filled = np.where(present > 0, matrix, 0.0)
+
+    # 对每一对 (i, j)：两列都存在的行数，以及这些行上第 i 列的合计和平方和
+    n = present.T @ present
+    sum_x = filled.T @ present
+    sum_xx = (filled * filled).T @ present
+    sum_xy = filled.T @ filled
+
+    from scipy import stats
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var_x = sum_xx - sum_x * sum_x / n
+        r = cov / np.sqrt(var_x * var_x.T)
+        r = np.clip(r, -1.0, 1.0)
+        r[(n < 2) | ~np.isfinite(r)] = np.nan
+
+        dof = n - 2
+        t = r * np.sqrt(dof / (1.0 - r * r))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    p[np.abs(r) == 1.0] = 0.0
+    # 只有两个样本时相关系数总是 ±1，没有统计意义
+    p[n == 2] = 1.0
+    p[np.isnan(r)] = np.nan
+    return r, p, n.astype(int)
+
+GROUPED_QUANTILES = {'q1': 0.25, 'median': 0.5, 'q3': 0.75}
+
+def grouped_statistics(keys, values):
+    """按分组键一次计算全部分组的统计量，缺失值会被忽略
+
+    排序一次（分组键、检测值），再用 reduceat 按分段求和与极值，四分位数按分段内的位置线性插值，
+    与 np.percentile 的默认方法一致；标准差为总体标准差。
+    返回 (分组键数组, {'count', 'mean', 'std', 'min', 'max', 'q1', 'median', 'q3': 数组})，分组键升序。
+    """
+    values = as_float_array(values)
+    valid = ~np.isnan(values)
+    group_keys, codes = np.unique(np.asarray(keys)[valid], return_inverse=True)
+    values = values[valid]
+    if not values.size:
+        return group_keys, {name: np.empty(0) for name in ('count', 'mean', 'std', 'min', 'max', *GROUPED_QUANTILES)}
+
+    order = np.lexsort((values, codes))
+    values = values[order]
+    counts = np.bincount(codes, minlength=len(group_keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ends = starts + counts - 1
+
+    mean = np.add.reduceat(values, starts) / counts
+    deviation = values - np.repeat(mean, counts)
+    result = {
+        'count': counts,
+        'mean': mean,
+        'std': np.sqrt(np.add.reduceat(deviation * deviation, starts) / counts),
+        'min': values[starts],
+        'max': values[ends],
     }
-    
-    field_name = field_mapping[product_type].get(test_item)
-    return getattr(product, field_name, None) if field_name else None
+    for name, q in GROUPED_QUANTILES.items():
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.ceil(position).astype(int)
+        result[name] = values[lower] + (position - lower) * (values[upper] - values[lower])
+    return group_keys, result
+
+def get_product_field_value(product, test_item, product_type='dryfilm'):
+    """根据测试项目获取产品字段值，非数值检测项目返回None"""
+    item = get_family(product_type).numeric(test_item)
+    return getattr(product, item.column, None) if item else None
 
 def calculate_moving_range_data(data_values):
-    """计算移动极差数据"""
-    moving_ranges = []
-    previous_value = None
-    
-    for current_value in data_values:
-        if previous_value is not None and current_value is not None:
-            moving_range = abs(current_value - previous_value)
-            moving_ranges.append(moving_range)
-        else:
-            moving_ranges.append(None)
-        previous_value = current_value
+    """计算移动极差数据，返回的移动极差为数组，第一个点和相邻两点任一缺失的点为NaN"""
+    data_array = as_float_array(data_values)
+    ranges = np.abs(np.diff(data_array))
+    moving_ranges = np.concatenate(([np.nan], ranges)) if data_array.size else np.empty(0)
     
     # 计算移动极差统计
-    valid_moving_ranges = [x for x in moving_ranges if x is not None]
-    if valid_moving_ranges:
-        mr_avg = sum(valid_moving_ranges) / len(valid_moving_ranges)
+    valid_moving_ranges = ranges[~np.isnan(ranges)]
+    if valid_moving_ranges.size:
+        mr_avg = float(valid_moving_ranges.mean())
         ucl_mr = 3.267 * mr_avg  # 移动极差图上控制限
     else:
         mr_avg = 0
@@ -110,8 +153,12 @@ def calculate_moving_range_data(data_values):
     }
 
 def calculate_capability_analysis(data_values, product_code=None, test_item=None):
-    """计算能力分析数据"""
-    if not data_values or len(data_values) <= 1:
+    """计算能力分析数据，data_values 为不含缺失值的列表或数组
+
+    直方图和正态分布曲线以数组返回，由响应编码器统一序列化。
+    """
+    data_array = np.asarray(data_values, dtype=float)
+    if data_array.size <= 1:
         return {
             'histogram': {'values': [], 'bins': []},
             'normal_distribution': {'x': [], 'y': []},
@@ -121,7 +168,6 @@ def calculate_capability_analysis(data_values, product_code=None, test_item=None
             }
         }
     
-    data_array = np.array(data_values)
     mean = float(np.mean(data_array))
     std_dev = float(np.std(data_array, ddof=1))  # 样本标准差
     
@@ -132,22 +178,23 @@ def calculate_capability_analysis(data_values, product_code=None, test_item=None
     cp, cpk = calculate_process_capability(mean, std_dev, usl, lsl)
     
     # 生成正态分布曲线数据
-    x_min = float(min(data_values) - 3 * std_dev)
-    x_max = float(max(data_values) + 3 * std_dev)
+    x_min = float(data_array.min() - 3 * std_dev)
+    x_max = float(data_array.max() + 3 * std_dev)
     x = np.linspace(x_min, x_max, 100)
-    y = stats.norm.pdf(x, mean, std_dev)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.exp(-0.5 * ((x - mean) / std_dev) ** 2) / (std_dev * np.sqrt(2 * np.pi))
     
     # 计算直方图数据
-    hist, bin_edges = np.histogram(data_values, bins=min(10, len(data_values)), density=True)
+    hist, bin_edges = np.histogram(data_array, bins=min(10, data_array.size), density=True)
     
     return {
         'histogram': {
-            'values': [float(v) for v in hist.tolist()],
-            'bins': [float(b) for b in bin_edges.tolist()]
+            'values': hist,
+            'bins': bin_edges
         },
         'normal_distribution': {
-            'x': [float(v) for v in x.tolist()],
-            'y': [float(v) for v in y.tolist()]
+            'x': x,
+            'y': y
         },
         'statistics': {
             'mean': mean,
@@ -157,7 +204,7 @@ def calculate_capability_analysis(data_values, product_code=None, test_item=None
             'target': target,
             'cp': cp,
             'cpk': cpk,
-            'sample_size': len(data_values)
+            'sample_size': int(data_array.size)
         }
     }
 
@@ -166,18 +213,15 @@ def get_product_standard(product_code, test_item, default_target):
     if not product_code or not test_item:
         return None, None, default_target
     
-    try:
-        standard = ProductStandard.objects.get(
-            product_code=product_code,
-            test_item=test_item,
-            standard_type='internal_control'
-        )
-        usl = float(standard.upper_limit) if standard.upper_limit else None
-        lsl = float(standard.lower_limit) if standard.lower_limit else None
-        target = float(standard.target_value) if standard.target_value else default_target
-        return usl, lsl, target
-    except ProductStandard.DoesNotExist:
+    standard = get_standards_index().get(product_code, 'internal_control', test_item)
+    if standard is None:
         return None, None, default_target
+    
+    # 规格限为0也是有效的限值
+    usl = float(standard.upper_limit) if standard.upper_limit is not None else None
+    lsl = float(standard.lower_limit) if standard.lower_limit is not None else None
+    target = float(standard.target_value) if standard.target_value is not None else default_target
+    return usl, lsl, target
 
 def calculate_process_capability(mean, std_dev, usl, lsl):
     """计算过程能力指数"""
@@ -190,11 +234,13 @@ def calculate_process_capability(mean, std_dev, usl, lsl):
 
 def get_batch_date(product, date_field='test_date'):
     """获取批次日期"""
-    if hasattr(product, 'batch_number') and len(getattr(product, 'batch_number', '')) >= 8:
-        return product.batch_number[:8]
-    else:
-        date_value = getattr(product, date_field)
-        return date_value.strftime('%Y%m%d') if date_value else '00000000'
+    return get_batch_label(getattr(product, 'batch_number', ''), getattr(product, date_field))
+
+def get_batch_label(batch_number, date_value):
+    """根据批号和测试日期生成图表标签：批号前8位，批号过短时使用测试日期"""
+    if batch_number and len(batch_number) >= 8:
+        return batch_number[:8]
+    return date_value.strftime('%Y%m%d') if date_value else '00000000'
 
 def export_to_csv(model_name, queryset, fields, field_names=None):
     """导出数据到CSV格式"""
@@ -225,6 +271,8 @@ def export_to_csv(model_name, queryset, fields, field_names=None):
 
 def export_to_excel(model_name, queryset, fields, field_names=None):
     """导出数据到Excel格式"""
+    import openpyxl
+
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = model_name
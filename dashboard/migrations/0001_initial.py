@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('family', models.CharField(choices=[('dryfilm', '干膜产品'), ('adhesive', '胶粘剂产品'), ('raw_material', '原料')], max_length=20, verbose_name='产品类型')),
+                ('code', models.CharField(max_length=100, verbose_name='牌号/原料名称')),
+                ('line', models.CharField(blank=True, max_length=100, verbose_name='产线/供应商')),
+                ('test_item', models.CharField(max_length=50, verbose_name='检测项目')),
+                ('day', models.DateField(verbose_name='日期')),
+                ('count', models.IntegerField(default=0, verbose_name='数量')),
+                ('total', models.FloatField(default=0, verbose_name='合计')),
+                ('total_sq', models.FloatField(default=0, verbose_name='平方和')),
+                ('min_value', models.FloatField(blank=True, null=True, verbose_name='最小值')),
+                ('max_value', models.FloatField(blank=True, null=True, verbose_name='最大值')),
+                ('pass_count', models.IntegerField(default=0, verbose_name='合格数')),
+                ('fail_count', models.IntegerField(default=0, verbose_name='不合格数')),
+                ('pending_count', models.IntegerField(default=0, verbose_name='待判定数')),
+            ],
+            options={
+                'verbose_name': '每日汇总',
+                'verbose_name_plural': '每日汇总',
+                'indexes': [models.Index(fields=['family', 'test_item', 'day'], name='rollup_item_day_idx')],
+                'unique_together': {('family', 'code', 'line', 'test_item', 'day')},
+            },
+        ),
+    ]
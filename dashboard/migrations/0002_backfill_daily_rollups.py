@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# 汇总的类型和对应的历史模型
+FAMILY_MODELS = {
+    'dryfilm': ('products', 'DryFilmProduct'),
+    'adhesive': ('products', 'AdhesiveProduct'),
+    'raw_material': ('raw_materials', 'RawMaterial'),
+}
+
+
+def backfill_daily_rollups(apps, schema_editor):
+    """按升级前已有的检测记录回填每日汇总表，之后由保存信号增量维护"""
+    from core import rollup
+
+    for family, (app_label, model_name) in FAMILY_MODELS.items():
+        model = apps.get_model(app_label, model_name)
+        rollup.rebuild(family, queryset=model.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+        ('products', '0011_search_indexes'),
+        ('raw_materials', '0005_remove_unique_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_rollups, migrations.RunPython.noop),
+    ]
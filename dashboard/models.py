@@ -1,3 +1,41 @@
 from django.db import models
 
-# Create your models here.
+
+class DailyRollup(models.Model):
+    """按天汇总的检测数据，用于长时间范围的趋势和统计查询
+
+    每行对应 (产品类型, 牌号/原料名称, 产线/供应商, 检测项目, 日期)。
+    检测项目为 '*' 的行只统计记录数和判定结果，不含检测值。
+    数据随检测记录的保存和删除增量维护，可用 rebuild_rollups 命令重建。
+    """
+    FAMILY_CHOICES = [
+        ('dryfilm', '干膜产品'),
+        ('adhesive', '胶粘剂产品'),
+        ('raw_material', '原料'),
+    ]
+
+    family = models.CharField(max_length=20, choices=FAMILY_CHOICES, verbose_name="产品类型")
+    code = models.CharField(max_length=100, verbose_name="牌号/原料名称")
+    line = models.CharField(max_length=100, blank=True, verbose_name="产线/供应商")
+    test_item = models.CharField(max_length=50, verbose_name="检测项目")
+    day = models.DateField(verbose_name="日期")
+
+    count = models.IntegerField(default=0, verbose_name="数量")
+    total = models.FloatField(default=0, verbose_name="合计")
+    total_sq = models.FloatField(default=0, verbose_name="平方和")
+    min_value = models.FloatField(null=True, blank=True, verbose_name="最小值")
+    max_value = models.FloatField(null=True, blank=True, verbose_name="最大值")
+    pass_count = models.IntegerField(default=0, verbose_name="合格数")
+    fail_count = models.IntegerField(default=0, verbose_name="不合格数")
+    pending_count = models.IntegerField(default=0, verbose_name="待判定数")
+
+    class Meta:
+        verbose_name = "每日汇总"
+        verbose_name_plural = "每日汇总"
+        unique_together = ['family', 'code', 'line', 'test_item', 'day']
+        indexes = [
+            models.Index(fields=['family', 'test_item', 'day'], name='rollup_item_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_family_display()} {self.code} {self.test_item} {self.day}"
@@ -9,4 +9,7 @@ urlpatterns = [
     path('api/products/<str:product_type>/search/', views.search_products, name='product_search'),
     path('api/products/<str:product_type>/moving-range/', views.get_moving_range_data, name='product_moving_range'),
     path('api/products/<str:product_type>/capability-analysis/', views.get_capability_analysis_data, name='product_capability_analysis'),
+    path('api/products/<str:product_type>/subgroup/', views.get_subgroup_data, name='product_subgroup'),
+    path('api/products/<str:product_type>/capability-matrix/', views.get_capability_matrix, name='product_capability_matrix'),
+    path('api/products/<str:product_type>/spc/', views.get_spc_data, name='product_spc'),
 ]
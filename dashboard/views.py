@@ -2,7 +2,8 @@ from django.shortcuts import render
 from django.http import JsonResponse
 from products.models import DryFilmProduct, AdhesiveProduct
 from core.api_views import (
-    get_product_data, search_products, get_moving_range_data, get_capability_analysis_data
+    get_product_data, search_products, get_moving_range_data, get_capability_analysis_data,
+    get_subgroup_data, get_capability_matrix, get_spc_data
 )
 from django.views.decorators.csrf import csrf_exempt
 
@@ -34,3 +35,4 @@ get_product_data = get_product_data
 search_products = search_products
 get_moving_range_data = get_moving_range_data
 get_capability_analysis_data = get_capability_analysis_data
+get_spc_data = get_spc_data
@@ -1,10 +1,55 @@
 from django.contrib import admin
 from django.contrib import messages
+from core.audit import JudgmentAuditMixin
+from core.importing import ImportMeasurementsMixin
+from core.schema import get_family
 from core.utils import export_data
 from .models import DryFilmProduct, ProductStandard, ProductStandardHistory, DryFilmProductHistory, AdhesiveProduct, AdhesiveProductHistory, PilotProduct, PilotProductHistory
 
+# 导出和复制文本中的检测项目：干膜不含分散性、稳定性，胶粘剂不含胶带结构
+DRYFILM_OUTPUT_ITEMS = get_family('dryfilm').without('dispersion', 'stability')
+ADHESIVE_TAPE_OUTPUT_ITEMS = tuple(
+    item for item in get_family('adhesive').group('tape') if item.name != 'tape_structure'
+)
+
+# 各产品导出的字段和表头，检测项目取自检测项目注册表
+DRYFILM_EXPORT_COLUMNS = get_family('dryfilm').export_columns(
+    [
+        ('product_code', '牌号'), ('batch_number', '批号'), ('production_line', '生产线'),
+        ('inspector', '检测人'), ('test_date', '测试日期'), ('sample_category', '样品类别'),
+    ],
+    [
+        ('external_final_judgment', '外部最终判定'), ('internal_final_judgment', '内部最终判定'),
+        ('judgment_status', '判定状态'), ('remarks', '备注'), ('created_at', '创建时间'), ('updated_at', '更新时间'),
+    ],
+    DRYFILM_OUTPUT_ITEMS,
+)
+
+ADHESIVE_EXPORT_COLUMNS = get_family('adhesive').export_columns(
+    [
+        ('product_code', '牌号'), ('batch_number', '批号'), ('production_line', '生产线'),
+        ('physical_inspector', '理化检测人'), ('tape_inspector', '胶带检测人'),
+        ('physical_test_date', '理化测试日期'), ('tape_test_date', '胶带测试日期'), ('sample_category', '样品类别'),
+    ],
+    [
+        ('physical_judgment', '理化判定'), ('tape_judgment', '胶带判定'), ('final_judgment', '最终判定'),
+        ('judgment_status', '判定状态'), ('remarks', '备注'), ('created_at', '创建时间'), ('updated_at', '更新时间'),
+    ],
+    get_family('adhesive').group('physical') + ADHESIVE_TAPE_OUTPUT_ITEMS,
+)
+
+PILOT_EXPORT_COLUMNS = get_family('pilot').export_columns(
+    [
+        ('product_code', '产品牌号'), ('batch_number', '产品批号'), ('production_line', '产线'),
+        ('inspector', '检测人'), ('test_date', '测试日期'), ('sample_category', '样品类别'),
+    ],
+    [('remarks', '备注'), ('created_at', '创建时间'), ('updated_at', '更新时间')],
+)
+
 @admin.register(DryFilmProduct)
-class DryFilmProductAdmin(admin.ModelAdmin):
+class DryFilmProductAdmin(ImportMeasurementsMixin, JudgmentAuditMixin, admin.ModelAdmin):
+    import_product_type = 'dryfilm'
+    audit_product_type = 'dryfilm'
     actions = ['update_judgments_action', 'export_dryfilm_products_csv', 'export_dryfilm_products_excel']
     list_display = [
         'product_code', 'batch_number', 'production_line', 'inspector', 
@@ -92,26 +137,7 @@ class DryFilmProductAdmin(admin.ModelAdmin):
         product_info = f"牌号: {obj.product_code}\n批号: {obj.batch_number}\n"
         
         # 产品数据（不为空的内容）
-        data_fields = [
-            ('appearance', '外观'),
-            ('solid_content', '固含'),
-            ('viscosity', '粘度'),
-            ('acid_value', '酸值'),
-            ('moisture', '水分'),
-            ('residual_monomer', '残单'),
-            ('weight_avg_molecular_weight', '重均分子量'),
-            ('pdi', 'PDI'),
-            ('color', '色度'),
-            ('polymerization_inhibitor', '阻聚剂'),
-            ('conversion_rate', '转化率'),
-            ('loading_temperature', '装车温度')
-        ]
-        
-        data_lines = []
-        for field_name, field_label in data_fields:
-            value = getattr(obj, field_name)
-            if value is not None and value != "":
-                data_lines.append(f"{field_label}: {value}")
+        data_lines = get_family('dryfilm').filled_lines(obj, DRYFILM_OUTPUT_ITEMS)
         
         if data_lines:
             product_info += "\n".join(data_lines)
@@ -150,43 +176,11 @@ class DryFilmProductAdmin(admin.ModelAdmin):
         if change:  # 如果是修改操作
             obj.modified_by = request.user.username
             
-            # 获取原始对象和当前表单数据的差异
-            original_obj = self.model.objects.get(pk=obj.pk)
-            changed_fields = []
-            modified_data = {}
-            
-            # 检查哪些字段被修改了
-            for field in obj._meta.fields:
-                field_name = field.name
-                if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                    original_value = getattr(original_obj, field_name)
-                    new_value = getattr(obj, field_name)
-                    
-                    if original_value != new_value:
-                        # 格式化字段显示名称
-                        field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                        changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                        modified_data[field_name] = {
-                            'old': original_value,
-                            'new': new_value
-                        }
-            
-            # 生成自动修改描述
-            if changed_fields:
-                obj.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-            else:
-                obj.modification_reason = "通过管理界面修改（无数据变更）"
-            
-            # 创建历史记录（每次修改都创建，无论是否有修改原因）
-            DryFilmProductHistory.objects.create(
-                dryfilm_product=obj,
-                modified_by=request.user.username,
-                modification_reason=obj.modification_reason,
-                modified_data=modified_data
-            )
+            # 修改历史由模型保存时根据加载时的原值生成，每次修改都记录一条
+            obj.modification_reason = ''
+            obj.history_empty_reason = "通过管理界面修改（无数据变更）"
         
-        # 自动计算整体判定
-        obj.calculate_final_judgments()
+        # 保存时模型会自动计算整体判定
         super().save_model(request, obj, form, change)
     
     def response_add(self, request, obj, post_url_continue=None):
@@ -237,40 +231,14 @@ class DryFilmProductAdmin(admin.ModelAdmin):
 
     def export_pilot_products_csv(self, request, queryset):
         """导出选定的中试产品记录为CSV格式"""
-        fields = [
-            'product_code', 'batch_number', 'production_line', 'inspector',
-            'test_date', 'sample_category', 'appearance', 'solid_content',
-            'viscosity', 'acid_value', 'moisture', 'residual_monomer',
-            'weight_avg_molecular_weight', 'pdi', 'color', 'polymerization_inhibitor',
-            'conversion_rate', 'loading_temperature', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '产品牌号', '产品批号', '产线', '检测人',
-            '测试日期', '样品类别', '外观', '固含',
-            '粘度', '酸值', '水分', '残单',
-            '重均分子量', 'PDI', '色度', '阻聚剂',
-            '转化率', '装车温度', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = PILOT_EXPORT_COLUMNS
         return export_data(request, queryset, 'PilotProduct', fields, 'csv', field_names)
     
     export_pilot_products_csv.short_description = "导出选定中试产品记录 (CSV)"
 
     def export_pilot_products_excel(self, request, queryset):
         """导出选定的中试产品记录为Excel格式"""
-        fields = [
-            'product_code', 'batch_number', 'production_line', 'inspector',
-            'test_date', 'sample_category', 'appearance', 'solid_content',
-            'viscosity', 'acid_value', 'moisture', 'residual_monomer',
-            'weight_avg_molecular_weight', 'pdi', 'color', 'polymerization_inhibitor',
-            'conversion_rate', 'loading_temperature', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '产品牌号', '产品批号', '产线', '检测人',
-            '测试日期', '样品类别', '外观', '固含',
-            '粘度', '酸值', '水分', '残单',
-            '重均分子量', 'PDI', '色度', '阻聚剂',
-            '转化率', '装车温度', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = PILOT_EXPORT_COLUMNS
         return export_data(request, queryset, 'PilotProduct', fields, 'excel', field_names)
     
     export_pilot_products_excel.short_description = "导出选定中试产品记录 (Excel)"
@@ -302,44 +270,14 @@ class DryFilmProductAdmin(admin.ModelAdmin):
 
     def export_dryfilm_products_csv(self, request, queryset):
         """导出选定的干膜产品记录为CSV格式"""
-        fields = [
-            'product_code', 'batch_number', 'production_line', 'inspector',
-            'test_date', 'sample_category', 'appearance', 'solid_content',
-            'viscosity', 'acid_value', 'moisture', 'residual_monomer',
-            'weight_avg_molecular_weight', 'pdi', 'color', 'polymerization_inhibitor',
-            'conversion_rate', 'loading_temperature', 'external_final_judgment',
-            'internal_final_judgment', 'judgment_status', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '牌号', '批号', '生产线', '检测人',
-            '测试日期', '样品类别', '外观', '固含',
-            '粘度', '酸值', '水分', '残单',
-            '重均分子量', 'PDI', '色度', '阻聚剂',
-            '转化率', '装车温度', '外部最终判定',
-            '内部最终判定', '判定状态', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = DRYFILM_EXPORT_COLUMNS
         return export_data(request, queryset, 'DryFilmProduct', fields, 'csv', field_names)
     
     export_dryfilm_products_csv.short_description = "导出选定干膜产品记录 (CSV)"
 
     def export_dryfilm_products_excel(self, request, queryset):
         """导出选定的干膜产品记录为Excel格式"""
-        fields = [
-            'product_code', 'batch_number', 'production_line', 'inspector',
-            'test_date', 'sample_category', 'appearance', 'solid_content',
-            'viscosity', 'acid_value', 'moisture', 'residual_monomer',
-            'weight_avg_molecular_weight', 'pdi', 'color', 'polymerization_inhibitor',
-            'conversion_rate', 'loading_temperature', 'external_final_judgment',
-            'internal_final_judgment', 'judgment_status', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '牌号', '批号', '生产线', '检测人',
-            '测试日期', '样品类别', '外观', '固含',
-            '粘度', '酸值', '水分', '残单',
-            '重均分子量', 'PDI', '色度', '阻聚剂',
-            '转化率', '装车温度', '外部最终判定',
-            '内部最终判定', '判定状态', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = DRYFILM_EXPORT_COLUMNS
         return export_data(request, queryset, 'DryFilmProduct', fields, 'excel', field_names)
     
     export_dryfilm_products_excel.short_description = "导出选定干膜产品记录 (Excel)"
@@ -420,42 +358,18 @@ class ProductStandardAdmin(admin.ModelAdmin):
         if change:  # 如果是修改操作
             obj.modified_by = request.user.username if hasattr(request, 'user') and hasattr(request.user, 'username') else 'system'
             
-            # 获取原始对象和当前表单数据的差异
-            original_obj = self.model.objects.get(pk=obj.pk)
-            changed_fields = []
-            modified_data = {}
-            
-            # 检查哪些字段被修改了
-            for field in obj._meta.fields:
-                field_name = field.name
-                if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                    original_value = getattr(original_obj, field_name)
-                    new_value = getattr(obj, field_name)
-                    
-                    if original_value != new_value:
-                        # 格式化字段显示名称
-                        field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                        changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                        modified_data[field_name] = {
-                            'old': original_value,
-                            'new': new_value
-                        }
-            
-            # 生成自动修改描述
-            if changed_fields:
-                obj.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-            else:
-                obj.modification_reason = "通过管理界面修改（无数据变更）"
-            
-            # 创建历史记录（每次修改都创建，无论是否有修改原因）
-            ProductStandardHistory.objects.create(
-                product_standard=obj,
-                modified_by=request.user.username if hasattr(request, 'user') and hasattr(request.user, 'username') else 'system',
-                modification_reason=obj.modification_reason,
-                modified_data=modified_data
-            )
+            # 与加载时记录的原值比较，每次修改都创建历史记录
+            obj.modification_reason = ''
+            obj.record_history(ProductStandardHistory, 'product_standard', empty_reason="通过管理界面修改（无数据变更）")
         
         super().save_model(request, obj, form, change)
+        
+        # 标准保存后由信号安排后台重新判定该牌号的产品记录
+        self.message_user(
+            request,
+            f'已安排重新判定牌号 {obj.product_code} 的产品记录，可在 /core/api/rejudge-status/ 查看进度',
+            messages.INFO
+        )
     
     def history_view(self, request, object_id, extra_context=None):
         """自定义历史记录视图"""
@@ -523,7 +437,9 @@ class DryFilmProductHistoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(AdhesiveProduct)
-class AdhesiveProductAdmin(admin.ModelAdmin):
+class AdhesiveProductAdmin(ImportMeasurementsMixin, JudgmentAuditMixin, admin.ModelAdmin):
+    import_product_type = 'adhesive'
+    audit_product_type = 'adhesive'
     actions = ['update_judgments_action', 'export_adhesive_products_csv', 'export_adhesive_products_excel']
     list_display = [
         'product_code', 'batch_number', 'production_line', 
@@ -621,41 +537,14 @@ class AdhesiveProductAdmin(admin.ModelAdmin):
         product_info += f"理化测试日期: {obj.physical_test_date}\n胶带测试日期: {obj.tape_test_date}\n"
         
         # 理化性能数据（不为空的内容）
-        physical_fields = [
-            ('appearance', '外观'),
-            ('solid_content', '固含'),
-            ('viscosity', '粘度'),
-            ('acid_value', '酸值'),
-            ('moisture', '水分'),
-            ('residual_monomer', '残单'),
-            ('weight_avg_molecular_weight', '重均分子量'),
-            ('pdi', 'PDI'),
-            ('color', '色度')
-        ]
-        
-        physical_lines = []
-        for field_name, field_label in physical_fields:
-            value = getattr(obj, field_name)
-            if value is not None and value != "":
-                physical_lines.append(f"{field_label}: {value}")
+        adhesive = get_family('adhesive')
+        physical_lines = adhesive.filled_lines(obj, adhesive.group('physical'))
         
         if physical_lines:
             product_info += "\n理化性能:\n" + "\n".join(physical_lines)
         
         # 胶带性能数据（不为空的内容）
-        tape_fields = [
-            ('initial_tack', '初粘'),
-            ('peel_strength', '剥离'),
-            ('high_temperature_holding', '高温持粘'),
-            ('room_temperature_holding', '常温持粘'),
-            ('constant_load_peel', '定荷重剥离')
-        ]
-        
-        tape_lines = []
-        for field_name, field_label in tape_fields:
-            value = getattr(obj, field_name)
-            if value is not None and value != "":
-                tape_lines.append(f"{field_label}: {value}")
+        tape_lines = adhesive.filled_lines(obj, ADHESIVE_TAPE_OUTPUT_ITEMS)
         
         if tape_lines:
             product_info += "\n胶带性能:\n" + "\n".join(tape_lines)
@@ -694,43 +583,11 @@ class AdhesiveProductAdmin(admin.ModelAdmin):
         if change:  # 如果是修改操作
             obj.modified_by = request.user.username
             
-            # 获取原始对象和当前表单数据的差异
-            original_obj = self.model.objects.get(pk=obj.pk)
-            changed_fields = []
-            modified_data = {}
-            
-            # 检查哪些字段被修改了
-            for field in obj._meta.fields:
-                field_name = field.name
-                if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                    original_value = getattr(original_obj, field_name)
-                    new_value = getattr(obj, field_name)
-                    
-                    if original_value != new_value:
-                        # 格式化字段显示名称
-                        field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                        changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                        modified_data[field_name] = {
-                            'old': original_value,
-                            'new': new_value
-                        }
-            
-            # 生成自动修改描述
-            if changed_fields:
-                obj.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-            else:
-                obj.modification_reason = "通过管理界面修改（无数据变更）"
-            
-            # 创建历史记录（每次修改都创建，无论是否有修改原因）
-            AdhesiveProductHistory.objects.create(
-                adhesive_product=obj,
-                modified_by=request.user.username,
-                modification_reason=obj.modification_reason,
-                modified_data=modified_data
-            )
+            # 修改历史由模型保存时根据加载时的原值生成，每次修改都记录一条
+            obj.modification_reason = ''
+            obj.history_empty_reason = "通过管理界面修改（无数据变更）"
         
-        # 自动计算判定结果
-        obj.calculate_judgments()
+        # 保存时模型会自动计算判定结果
         super().save_model(request, obj, form, change)
     
     def response_add(self, request, obj, post_url_continue=None):
@@ -781,52 +638,14 @@ class AdhesiveProductAdmin(admin.ModelAdmin):
 
     def export_adhesive_products_csv(self, request, queryset):
         """导出选定的胶粘剂产品记录为CSV格式"""
-        fields = [
-            'product_code', 'batch_number', 'production_line', 
-            'physical_inspector', 'tape_inspector', 'physical_test_date',
-            'tape_test_date', 'sample_category', 'appearance', 'solid_content',
-            'viscosity', 'acid_value', 'moisture', 'residual_monomer',
-            'weight_avg_molecular_weight', 'pdi', 'color', 'initial_tack',
-            'peel_strength', 'high_temperature_holding', 'room_temperature_holding',
-            'constant_load_peel', 'physical_judgment', 'tape_judgment',
-            'final_judgment', 'judgment_status', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '牌号', '批号', '生产线', 
-            '理化检测人', '胶带检测人', '理化测试日期',
-            '胶带测试日期', '样品类别', '外观', '固含',
-            '粘度', '酸值', '水分', '残单',
-            '重均分子量', 'PDI', '色度', '初粘',
-            '剥离', '高温持粘', '常温持粘',
-            '定荷重剥离', '理化判定', '胶带判定',
-            '最终判定', '判定状态', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = ADHESIVE_EXPORT_COLUMNS
         return export_data(request, queryset, 'AdhesiveProduct', fields, 'csv', field_names)
     
     export_adhesive_products_csv.short_description = "导出选定胶粘剂产品记录 (CSV)"
 
     def export_adhesive_products_excel(self, request, queryset):
         """导出选定的胶粘剂产品记录为Excel格式"""
-        fields = [
-            'product_code', 'batch_number', 'production_line', 
-            'physical_inspector', 'tape_inspector', 'physical_test_date',
-            'tape_test_date', 'sample_category', 'appearance', 'solid_content',
-            'viscosity', 'acid_value', 'moisture', 'residual_monomer',
-            'weight_avg_molecular_weight', 'pdi', 'color', 'initial_tack',
-            'peel_strength', 'high_temperature_holding', 'room_temperature_holding',
-            'constant_load_peel', 'physical_judgment', 'tape_judgment',
-            'final_judgment', 'judgment_status', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '牌号', '批号', '生产线', 
-            '理化检测人', '胶带检测人', '理化测试日期',
-            '胶带测试日期', '样品类别', '外观', '固含',
-            '粘度', '酸值', '水分', '残单',
-            '重均分子量', 'PDI', '色度', '初粘',
-            '剥离', '高温持粘', '常温持粘',
-            '定荷重剥离', '理化判定', '胶带判定',
-            '最终判定', '判定状态', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = ADHESIVE_EXPORT_COLUMNS
         return export_data(request, queryset, 'AdhesiveProduct', fields, 'excel', field_names)
     
     export_adhesive_products_excel.short_description = "导出选定胶粘剂产品记录 (Excel)"
@@ -876,7 +695,8 @@ class AdhesiveProductHistoryAdmin(admin.ModelAdmin):
 
 
 @admin.register(PilotProduct)
-class PilotProductAdmin(admin.ModelAdmin):
+class PilotProductAdmin(ImportMeasurementsMixin, admin.ModelAdmin):
+    import_product_type = 'pilot'
     actions = ['export_pilot_products_csv', 'export_pilot_products_excel']
     list_display = [
         'product_code', 'batch_number', 'production_line', 'inspector', 
@@ -945,26 +765,7 @@ class PilotProductAdmin(admin.ModelAdmin):
         product_info = f"牌号: {obj.product_code}\n批号: {obj.batch_number}\n"
         
         # 产品数据（不为空的内容）
-        data_fields = [
-            ('appearance', '外观'),
-            ('solid_content', '固含'),
-            ('viscosity', '粘度'),
-            ('acid_value', '酸值'),
-            ('moisture', '水分'),
-            ('residual_monomer', '残单'),
-            ('weight_avg_molecular_weight', '重均分子量'),
-            ('pdi', 'PDI'),
-            ('color', '色度'),
-            ('polymerization_inhibitor', '阻聚剂'),
-            ('conversion_rate', '转化率'),
-            ('loading_temperature', '装车温度')
-        ]
-        
-        data_lines = []
-        for field_name, field_label in data_fields:
-            value = getattr(obj, field_name)
-            if value is not None and value != "":
-                data_lines.append(f"{field_label}: {value}")
+        data_lines = get_family('pilot').filled_lines(obj)
         
         if data_lines:
             product_info += "\n".join(data_lines)
@@ -1003,40 +804,9 @@ class PilotProductAdmin(admin.ModelAdmin):
         if change:  # 如果是修改操作
             obj.modified_by = request.user.username
             
-            # 获取原始对象和当前表单数据的差异
-            original_obj = self.model.objects.get(pk=obj.pk)
-            changed_fields = []
-            modified_data = {}
-            
-            # 检查哪些字段被修改了
-            for field in obj._meta.fields:
-                field_name = field.name
-                if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                    original_value = getattr(original_obj, field_name)
-                    new_value = getattr(obj, field_name)
-                    
-                    if original_value != new_value:
-                        # 格式化字段显示名称
-                        field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                        changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                        modified_data[field_name] = {
-                            'old': original_value,
-                            'new': new_value
-                        }
-            
-            # 生成自动修改描述
-            if changed_fields:
-                obj.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-            else:
-                obj.modification_reason = "通过管理界面修改（无数据变更）"
-            
-            # 创建历史记录（每次修改都创建，无论是否有修改原因）
-            PilotProductHistory.objects.create(
-                pilot_product=obj,
-                modified_by=request.user.username,
-                modification_reason=obj.modification_reason,
-                modified_data=modified_data
-            )
+            # 修改历史由模型保存时根据加载时的原值生成，每次修改都记录一条
+            obj.modification_reason = ''
+            obj.history_empty_reason = "通过管理界面修改（无数据变更）"
         
         super().save_model(request, obj, form, change)
     
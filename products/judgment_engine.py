@@ -0,0 +1,276 @@
+"""批量判定引擎 - 按列加载检测数据，用NumPy数组一次性评估整批记录
+
+判定规则与 DryFilmProduct.calculate_final_judgments / AdhesiveProduct.calculate_judgments
+逐行方法完全一致，只把结果有变化的记录通过 bulk_update 写回。
+"""
+
+import time
+
+import numpy as np
+from django.db import transaction
+
+from products.models import DryFilmProduct, AdhesiveProduct
+from core import rollup
+from core.cache import invalidate
+from core.schema import get_family
+from products.standards import get_standards_index
+
+# 各产品类型的判定配置：分组名称、选择标准的条件以及判定结果字段
+FAMILY_SPECS = {
+    'dryfilm': {
+        'model': DryFilmProduct,
+        'label': '干膜产品',
+        'judgment_fields': ['external_final_judgment', 'internal_final_judgment', 'judgment_status'],
+        'sections': [
+            ('external', {'standard_type': 'external_control'}),
+            ('internal', {'standard_type': 'internal_control'}),
+        ],
+    },
+    'adhesive': {
+        'model': AdhesiveProduct,
+        'label': '胶粘剂产品',
+        'judgment_fields': ['physical_judgment', 'tape_judgment', 'final_judgment', 'judgment_status'],
+        'sections': [
+            ('physical', {'test_items': AdhesiveProduct.PHYSICAL_TEST_ITEMS}),
+            ('tape', {'test_items': AdhesiveProduct.TAPE_TEST_ITEMS}),
+        ],
+    },
+}
+
+
+def _section_standards(index, product_code, spec):
+    """获取某牌号在各判定分组下的标准列表"""
+    return [
+        (section, index.for_product(product_code, **criteria))
+        for section, criteria in spec['sections']
+    ]
+
+
+def _column_array(rows, position):
+    """把某一列转换为数组：数值列为float64（空值为NaN），文本列保持object"""
+    values = [row[position] for row in rows]
+    if all(value is None or isinstance(value, (int, float)) for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return np.array(values, dtype=object)
+
+
+def _evaluate_standard(column, standard):
+    """对一列数据评估单条标准，返回(未完成掩码, 不合格掩码)"""
+    if column.dtype == object:
+        # 文本项目只有空值才算未完成，且不做上下限比较
+        unfinished = np.array([value is None for value in column], dtype=bool)
+        return unfinished, np.zeros(len(column), dtype=bool)
+
+    unfinished = np.isnan(column) | (column == 0)
+    if standard.lower_limit is None or standard.upper_limit is None:
+        return unfinished, np.zeros(len(column), dtype=bool)
+
+    with np.errstate(invalid='ignore'):
+        qualified = (standard.lower_limit <= column) & (column <= standard.upper_limit)
+    return unfinished, ~unfinished & ~qualified
+
+
+def _evaluate_group(rows, columns, section_standards):
+    """对同一牌号的记录批量评估所有标准，返回每行的判定详情及未完成/不合格标记"""
+    row_count = len(rows)
+    details = [{} for _ in range(row_count)]
+    flags = {}
+
+    for section, standards in section_standards:
+        for detail in details:
+            detail[section] = {'standards_count': len(standards), 'unfinished_items': [], 'failed_items': []}
+
+        has_unfinished = np.zeros(row_count, dtype=bool)
+        has_failed = np.zeros(row_count, dtype=bool)
+
+        # 按标准顺序追加，保证明细列表顺序与逐行判定一致
+        for standard in standards:
+            column, raw_position = columns.get(standard.test_item, (None, None))
+            if column is None:
+                # 模型上没有该字段，逐行判定时 getattr 返回 None
+                has_unfinished[:] = True
+                for detail in details:
+                    detail[section]['unfinished_items'].append(standard.test_item)
+                continue
+
+            unfinished, failed = _evaluate_standard(column, standard)
+            has_unfinished |= unfinished
+            has_failed |= failed
+
+            for i in np.flatnonzero(unfinished):
+                details[i][section]['unfinished_items'].append(standard.test_item)
+            for i in np.flatnonzero(failed):
+                details[i][section]['failed_items'].append({
+                    'item': standard.test_item,
+                    'value': rows[i][raw_position],
+                    'lower_limit': standard.lower_limit,
+                    'upper_limit': standard.upper_limit
+                })
+
+        flags[section] = (len(standards) > 0, has_unfinished, has_failed)
+
+    return details, flags
+
+
+def _dryfilm_judgments(flags, i):
+    """根据标记生成干膜产品的判定字段（规则同 calculate_final_judgments）"""
+    result = {}
+    for section, field, prefix, missing in (
+        ('external', 'external_final_judgment', '外控', '无外控标准'),
+        ('internal', 'internal_final_judgment', '内控', '无内控标准'),
+    ):
+        has_standards, has_unfinished, has_failed = flags[section]
+        if not has_standards:
+            result[field] = missing
+            result['judgment_status'] = "已完成"
+        elif has_unfinished[i]:
+            result[field] = f"{prefix}未完成"
+            result['judgment_status'] = "待判定"
+        elif not has_failed[i]:
+            result[field] = f"{prefix}合格"
+            result['judgment_status'] = "已完成"
+        else:
+            result[field] = f"{prefix}不合格"
+            result['judgment_status'] = "已完成"
+    return result
+
+
+def _adhesive_judgments(flags, i):
+    """根据标记生成胶粘剂产品的判定字段（规则同 calculate_judgments）"""
+    result = {}
+    for section, field, prefix in (
+        ('physical', 'physical_judgment', '理化'),
+        ('tape', 'tape_judgment', '胶带'),
+    ):
+        has_standards, has_unfinished, has_failed = flags[section]
+        if not has_standards:
+            result[field] = f"无{prefix}标准"
+        elif has_unfinished[i]:
+            result[field] = f"{prefix}未完成"
+        elif not has_failed[i]:
+            result[field] = f"{prefix}合格"
+        else:
+            result[field] = f"{prefix}不合格"
+
+    physical, tape = result['physical_judgment'], result['tape_judgment']
+    if physical == "理化合格" and tape == "胶带合格":
+        result['final_judgment'], result['judgment_status'] = "合格", "已完成"
+    elif "不合格" in physical or "不合格" in tape:
+        result['final_judgment'], result['judgment_status'] = "不合格", "已完成"
+    elif "未完成" in physical or "未完成" in tape:
+        result['final_judgment'], result['judgment_status'] = "未完成", "待判定"
+    else:
+        result['final_judgment'], result['judgment_status'] = "待判定", "待判定"
+    return result
+
+
+JUDGMENT_BUILDERS = {
+    'dryfilm': _dryfilm_judgments,
+    'adhesive': _adhesive_judgments,
+}
+
+
+def judge_rows(product_type, rows, value_fields, index=None):
+    """批量判定一组记录
+
+    rows 为 (pk, product_code, *value_fields) 元组列表，返回与之对应的判定结果字典列表，
+    每个字典包含判定字段和 judgment_details。
+    """
+    spec = FAMILY_SPECS[product_type]
+    build_judgments = JUDGMENT_BUILDERS[product_type]
+    index = index or get_standards_index()
+
+    results = [None] * len(rows)
+    groups = {}
+    for position, row in enumerate(rows):
+        groups.setdefault(row[1], []).append(position)
+
+    for product_code, positions in groups.items():
+        group_rows = [rows[p] for p in positions]
+        columns = {
+            field: (_column_array(group_rows, offset + 2), offset + 2)
+            for offset, field in enumerate(value_fields)
+        }
+        details, flags = _evaluate_group(group_rows, columns, _section_standards(index, product_code, spec))
+
+        for i, position in enumerate(positions):
+            result = build_judgments(flags, i)
+            result['judgment_details'] = details[i]
+            results[position] = result
+
+    return results
+
+
+def measurement_fields(product_type):
+    """产品类型中可能被标准引用的检测字段"""
+    return [item.column for item in get_family(product_type).items if item.standard]
+
+
+def rejudge_queryset(product_type, queryset=None, chunk_size=1000, dry_run=False, progress=None):
+    """按主键分块重新判定查询集中的记录，只写回判定结果有变化的行
+
+    progress 为可选回调，每处理完一块调用一次 progress(processed, total, updated, elapsed)。
+    返回 {'processed', 'updated', 'elapsed', 'rows_per_sec'} 统计信息。
+    """
+    spec = FAMILY_SPECS[product_type]
+    model = spec['model']
+    queryset = model.objects.all() if queryset is None else queryset
+    judgment_fields = spec['judgment_fields']
+    value_fields = measurement_fields(product_type)
+    stored_fields = judgment_fields + ['judgment_details']
+
+    total = queryset.count()
+    index = get_standards_index()
+    processed = updated = 0
+    last_pk = None
+    start_time = time.time()
+
+    while True:
+        chunk_qs = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+        rows = list(chunk_qs.values_list('pk', 'product_code', *value_fields, *stored_fields)[:chunk_size])
+        if not rows:
+            break
+
+        results = judge_rows(product_type, rows, value_fields, index)
+
+        stored_offset = 2 + len(value_fields)
+        changed = []
+        changed_codes = set()
+        for row, result in zip(rows, results):
+            stored = dict(zip(stored_fields, row[stored_offset:]))
+            if any(stored[field] != result[field] for field in stored_fields):
+                changed.append(model(pk=row[0], **result))
+                changed_codes.add(row[1])
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                model.objects.bulk_update(changed, stored_fields, batch_size=chunk_size)
+                invalidate('product', changed_codes)
+                rollup.refresh_for_pks(product_type, [obj.pk for obj in changed])
+
+        processed += len(rows)
+        updated += len(changed)
+        last_pk = rows[-1][0]
+
+        if progress:
+            progress(processed, total, updated, time.time() - start_time)
+
+        if len(rows) < chunk_size:
+            break
+
+    elapsed = time.time() - start_time
+    return {
+        'processed': processed,
+        'updated': updated,
+        'elapsed': elapsed,
+        'rows_per_sec': processed / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def rejudge_pk_range(product_type, start_pk, end_pk, dry_run=False):
+    """重新判定主键闭区间内的记录，供多进程模式的工作进程调用"""
+    model = FAMILY_SPECS[product_type]['model']
+    queryset = model.objects.filter(pk__gte=start_pk, pk__lte=end_pk)
+    return rejudge_queryset(product_type, queryset, chunk_size=end_pk - start_pk + 1, dry_run=dry_run)
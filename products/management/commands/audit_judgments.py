@@ -0,0 +1,58 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from core.audit import AUDIT_TYPES, iter_audit_csv_rows
+
+
+class Command(BaseCommand):
+    help = '只读审计：按当前标准重新计算判定，输出存储结果不一致的记录'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product-type',
+            type=str,
+            choices=list(AUDIT_TYPES) + ['all'],
+            default='all',
+            help='要审计的类型：dryfilm(干膜产品), adhesive(胶粘剂产品), raw_material(原料), all(全部)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='每次从数据库读取的记录数量，默认为2000'
+        )
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=None,
+            help='CSV输出文件路径，不指定时输出到标准输出'
+        )
+
+    def handle(self, *args, **options):
+        product_type = options['product_type']
+        product_types = list(AUDIT_TYPES) if product_type == 'all' else [product_type]
+        totals = {}
+        rows = iter_audit_csv_rows(product_types, options['chunk_size'], totals)
+
+        if not options['output']:
+            writer = csv.writer(self.stdout)
+            for row in rows:
+                writer.writerow(row)
+            return
+
+        with open(options['output'], 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            for row in rows:
+                writer.writerow(row)
+
+        checked = sum(entry['checked'] for entry in totals.values())
+        drifted = sum(entry['drifted'] for entry in totals.values())
+        for (family, code), entry in sorted(totals.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+            if entry['drifted']:
+                self.stdout.write(
+                    self.style.WARNING(f"{AUDIT_TYPES[family]} {code or '(空牌号)'}: {entry['drifted']}/{entry['checked']} 条判定不一致")
+                )
+        self.stdout.write(
+            self.style.SUCCESS(f'审计完成：共检查 {checked} 条记录，{drifted} 条判定不一致，结果已写入 {options["output"]}')
+        )
@@ -0,0 +1,118 @@
+import csv
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importing import EXCEL_EXTENSIONS, format_errors, import_file
+from core.ingest import INGEST_FAMILIES
+
+
+class Command(BaseCommand):
+    help = '从xlsx或CSV文件导入历史检测数据，按批号新增或更新记录并批量判定'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=str, help='要导入的xlsx或CSV文件路径')
+        parser.add_argument(
+            '--product-type',
+            type=str,
+            choices=list(INGEST_FAMILIES),
+            required=True,
+            help='数据类型：dryfilm(干膜产品), adhesive(胶粘剂产品), pilot(小试产品), raw_material(原料)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='每个事务处理的行数，默认为1000'
+        )
+        parser.add_argument(
+            '--sheet',
+            type=str,
+            default=None,
+            help='xlsx工作表名称，默认为第一个工作表'
+        )
+        parser.add_argument(
+            '--modified-by',
+            type=str,
+            default='import',
+            help='记录的修改人，默认为import'
+        )
+        parser.add_argument(
+            '--errors-csv',
+            type=str,
+            default=None,
+            help='把所有错误和冲突行写入该CSV文件'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='试运行，只校验和判定，不实际写入'
+        )
+
+    def handle(self, *args, **options):
+        path = options['file']
+        if not os.path.exists(path):
+            raise CommandError(f'文件不存在: {path}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size 必须大于0')
+        if options['sheet'] and not path.lower().endswith(EXCEL_EXTENSIONS):
+            raise CommandError('--sheet 只适用于xlsx文件')
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING('试运行模式：不会实际保存更改')
+            )
+
+        def report_progress(summary, elapsed):
+            rate = summary['total'] / elapsed if elapsed > 0 else 0.0
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"已处理 {summary['total']} 行：新增 {summary['created']}，更新 {summary['updated']}，"
+                    f"无变化 {summary['unchanged']}，冲突 {summary['conflict']}，错误 {summary['error']} "
+                    f"(速度: {rate:.0f} 行/秒)"
+                )
+            )
+
+        errors_file = None
+        on_error = None
+        if options['errors_csv']:
+            errors_file = open(options['errors_csv'], 'w', encoding='utf-8-sig', newline='')
+            writer = csv.writer(errors_file)
+            writer.writerow(['行号', '批号', '结果', '错误'])
+
+            def on_error(outcome):
+                writer.writerow([outcome['row'], outcome.get('key') or '', outcome['status'], format_errors(outcome['errors'])])
+
+        try:
+            result = import_file(
+                options['product_type'], path, path,
+                chunk_size=options['chunk_size'],
+                sheet_name=options['sheet'],
+                modified_by=options['modified_by'],
+                dry_run=options['dry_run'],
+                progress=report_progress,
+                on_error=on_error,
+            )
+        except (ValueError, KeyError) as e:
+            raise CommandError(str(e))
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        if result['ignored_columns']:
+            self.stdout.write(
+                self.style.WARNING(f"已忽略无法识别的列：{'、'.join(result['ignored_columns'])}")
+            )
+        for outcome in result['errors']:
+            self.stdout.write(
+                self.style.ERROR(f"第 {outcome['row']} 行 {outcome.get('key') or ''}：{format_errors(outcome['errors'])}")
+            )
+
+        summary = result['summary']
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"导入完成：共 {summary['total']} 行，新增 {summary['created']} 条，更新 {summary['updated']} 条，"
+                f"无变化 {summary['unchanged']} 条，冲突 {summary['conflict']} 条，错误 {summary['error']} 条 "
+                f"(耗时: {result['elapsed']:.2f}秒, 速度: {result['rows_per_sec']:.0f} 行/秒)"
+            )
+        )
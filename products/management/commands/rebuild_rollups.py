@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.rollup import ROLLUP_FAMILIES, rebuild
+
+
+class Command(BaseCommand):
+    help = '清空并按检测记录重建每日汇总表（首次部署或数据修复后运行）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product-type',
+            type=str,
+            choices=list(ROLLUP_FAMILIES) + ['all'],
+            default='all',
+            help='要重建的类型：dryfilm(干膜产品), adhesive(胶粘剂产品), raw_material(原料), all(全部)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='每次写入的汇总行数，默认为2000'
+        )
+
+    def handle(self, *args, **options):
+        product_type = options['product_type']
+        families = list(ROLLUP_FAMILIES) if product_type == 'all' else [product_type]
+
+        for family in families:
+            created = rebuild(family, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{family}: 写入 {created} 条汇总数据'))
@@ -1,4 +1,4 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from products.models import DryFilmProduct, AdhesiveProduct
 import time
@@ -25,18 +25,140 @@ class Command(BaseCommand):
             action='store_true',
             help='试运行，不实际保存更改'
         )
+        parser.add_argument(
+            '--engine',
+            type=str,
+            choices=['vectorized', 'row'],
+            default='vectorized',
+            help='判定引擎：vectorized(按列批量判定，默认), row(逐行调用save)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='并行工作进程数，大于1时按主键范围分块并行判定，默认为1'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='从上次中断时最后一个已提交的块继续'
+        )
 
     def handle(self, *args, **options):
         product_type = options['product_type']
         batch_size = options['batch_size']
         dry_run = options['dry_run']
+        engine = options['engine']
+        workers = options['workers']
+        resume = options['resume']
+        
+        if workers < 1:
+            raise CommandError('--workers 必须大于等于1')
+        if engine == 'row' and (workers > 1 or resume):
+            raise CommandError('--workers 和 --resume 只支持 vectorized 引擎')
         
         # 根据产品类型获取相应的记录
         if product_type == 'dryfilm' or product_type == 'all':
-            self.update_dryfilm_products(dry_run)
+            if workers > 1 or resume:
+                self.rejudge_parallel('dryfilm', batch_size, dry_run, workers, resume)
+            elif engine == 'vectorized':
+                self.rejudge_vectorized('dryfilm', batch_size, dry_run)
+            else:
+                self.update_dryfilm_products(dry_run)
         
         if product_type == 'adhesive' or product_type == 'all':
-            self.update_adhesive_products(dry_run)
+            if workers > 1 or resume:
+                self.rejudge_parallel('adhesive', batch_size, dry_run, workers, resume)
+            elif engine == 'vectorized':
+                self.rejudge_vectorized('adhesive', batch_size, dry_run)
+            else:
+                self.update_adhesive_products(dry_run)
+
+    def rejudge_vectorized(self, product_type, batch_size, dry_run):
+        """使用批量判定引擎更新判定结果"""
+        from products.judgment_engine import FAMILY_SPECS, rejudge_queryset
+        
+        label = FAMILY_SPECS[product_type]['label']
+        
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING('试运行模式：不会实际保存更改')
+            )
+        
+        def report_progress(processed, total, updated, elapsed):
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{label} - 已处理 {processed}/{total} 条记录 '
+                    f'({processed / total * 100:.1f}%), '
+                    f'判定变化 {updated} 条, '
+                    f'速度: {rate:.0f} 条/秒'
+                )
+            )
+        
+        result = rejudge_queryset(
+            product_type, chunk_size=batch_size, dry_run=dry_run, progress=report_progress
+        )
+        
+        action = '将更新' if dry_run else '已更新'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{label}判定完成：共处理 {result["processed"]} 条记录，'
+                f'{action} {result["updated"]} 条 '
+                f'(耗时: {result["elapsed"]:.2f}秒, 速度: {result["rows_per_sec"]:.0f} 条/秒)'
+            )
+        )
+
+    def rejudge_parallel(self, product_type, batch_size, dry_run, workers, resume):
+        """按主键范围分块，由多个工作进程并行判定，每块单独提交"""
+        from functools import partial
+        from core.parallel import run_chunks
+        from products.judgment_engine import FAMILY_SPECS, rejudge_pk_range
+        
+        spec = FAMILY_SPECS[product_type]
+        label = spec['label']
+        
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING('试运行模式：不会实际保存更改')
+            )
+        
+        def report_progress(completed, total_chunks, processed, updated, elapsed):
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'{label} - 已完成 {completed}/{total_chunks} 块, '
+                    f'处理 {processed} 条记录, '
+                    f'判定变化 {updated} 条, '
+                    f'合计速度: {rate:.0f} 条/秒'
+                )
+            )
+        
+        # 试运行和正式运行使用不同的检查点文件
+        job_name = f'update_product_judgments_{product_type}' + ('_dry_run' if dry_run else '')
+        result = run_chunks(
+            job_name,
+            spec['model'].objects.all(),
+            partial(rejudge_pk_range, product_type, dry_run=dry_run),
+            chunk_size=batch_size,
+            workers=workers,
+            resume=resume,
+            progress=report_progress,
+        )
+        
+        if result['resumed_chunks']:
+            self.stdout.write(
+                self.style.WARNING(f'{label} - 从检查点继续，跳过已提交的 {result["resumed_chunks"]} 块')
+            )
+        
+        action = '将更新' if dry_run else '已更新'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{label}判定完成（{workers} 个进程）：共处理 {result["processed"]} 条记录，'
+                f'{action} {result["updated"]} 条 '
+                f'(耗时: {result["elapsed"]:.2f}秒, 速度: {result["rows_per_sec"]:.0f} 条/秒)'
+            )
+        )
 
     def update_dryfilm_products(self, dry_run):
         """更新干膜产品的判定结果"""
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_adhesiveproduct_tape_structure_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adhesiveproduct',
+            name='product_code',
+            field=models.CharField(blank=True, db_index=True, max_length=50, verbose_name='产品牌号'),
+        ),
+        migrations.AlterField(
+            model_name='dryfilmproduct',
+            name='product_code',
+            field=models.CharField(blank=True, db_index=True, max_length=50, verbose_name='产品牌号'),
+        ),
+        migrations.AddIndex(
+            model_name='adhesiveproduct',
+            index=models.Index(fields=['-physical_test_date', 'batch_number'], name='adhesive_date_batch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dryfilmproduct',
+            index=models.Index(fields=['-test_date', 'batch_number'], name='dryfilm_date_batch_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adhesiveproduct',
+            index=models.Index(fields=['product_code', 'production_line', 'physical_test_date'], name='adhesive_rollup_bucket_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dryfilmproduct',
+            index=models.Index(fields=['product_code', 'production_line', 'test_date'], name='dryfilm_rollup_bucket_idx'),
+        ),
+    ]
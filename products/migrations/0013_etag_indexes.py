@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_rollup_bucket_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adhesiveproduct',
+            index=models.Index(fields=['product_code', 'updated_at'], name='adhesive_code_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dryfilmproduct',
+            index=models.Index(fields=['product_code', 'updated_at'], name='dryfilm_code_updated_idx'),
+        ),
+    ]
@@ -2,9 +2,11 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 import json
 
-class DryFilmProduct(models.Model):
+from core.tracking import TrackedModelMixin
+
+class DryFilmProduct(TrackedModelMixin, models.Model):
     # 产品信息
-    product_code = models.CharField(max_length=50, verbose_name="产品牌号", blank=True)
+    product_code = models.CharField(max_length=50, verbose_name="产品牌号", blank=True, db_index=True)
     batch_number = models.CharField(max_length=50, verbose_name="产品批号", unique=True)
     production_line = models.CharField(max_length=50, verbose_name="产线")
     inspector = models.CharField(max_length=50, verbose_name="检测人")
@@ -42,79 +44,41 @@ class DryFilmProduct(models.Model):
         verbose_name = "干膜产品"
         verbose_name_plural = "干膜产品"
         ordering = ['-test_date', 'batch_number']
+        indexes = [
+            # 产品查询按 (日期倒序, 批号) 游标分页
+            models.Index(fields=['-test_date', 'batch_number'], name='dryfilm_date_batch_idx'),
+            # 每日汇总按 (牌号, 产线, 日期) 分组加锁读取
+            models.Index(fields=['product_code', 'production_line', 'test_date'], name='dryfilm_rollup_bucket_idx'),
+            # 按牌号的条件请求用 max(updated_at) 生成 ETag
+            models.Index(fields=['product_code', 'updated_at'], name='dryfilm_code_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.product_code} - {self.batch_number}"
 
     def save(self, *args, **kwargs):
-        # 检查是否是更新操作
-        is_update = self.pk is not None
-        
-        # 如果是更新操作，获取原始数据用于比较
-        if is_update:
-            try:
-                original_obj = DryFilmProduct.objects.get(pk=self.pk)
-                changed_fields = []
-                modified_data = {}
-                
-                # 检查哪些字段被修改了
-                for field in self._meta.fields:
-                    field_name = field.name
-                    if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                        original_value = getattr(original_obj, field_name)
-                        new_value = getattr(self, field_name)
-                        
-                        if original_value != new_value:
-                            # 格式化字段显示名称
-                            field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                            changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                            modified_data[field_name] = {
-                                'old': original_value,
-                                'new': new_value
-                            }
-                
-                # 如果有字段被修改，创建历史记录
-                if changed_fields:
-                    # 自动生成修改描述
-                    if not self.modification_reason:
-                        self.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-                    
-                    # 创建历史记录
-                    DryFilmProductHistory.objects.create(
-                        dryfilm_product=self,
-                        modified_by=self.modified_by if self.modified_by else 'system',
-                        modification_reason=self.modification_reason,
-                        modified_data=modified_data
-                    )
-                    
-            except DryFilmProduct.DoesNotExist:
-                # 如果是新对象，不需要创建历史记录
-                pass
+        # 与加载时记录的原值比较，有字段被修改时创建历史记录
+        self.record_history(DryFilmProductHistory, 'dryfilm_product', kwargs.get('update_fields'), self.history_empty_reason)
         
         # 自动计算整体判定
         self.calculate_final_judgments()
         super().save(*args, **kwargs)
 
     def calculate_final_judgments(self):
-        from products.models import ProductStandard
+        from products.standards import get_standards_index
         
-        # 获取标准
-        external_standards = ProductStandard.objects.filter(
-            product_code=self.product_code, 
-            standard_type='external_control'
-        )
-        internal_standards = ProductStandard.objects.filter(
-            product_code=self.product_code, 
-            standard_type='internal_control'
-        )
+        # 获取标准（从内存索引读取，不查询数据库）
+        index = get_standards_index()
+        external_standards = index.for_product(self.product_code, 'external_control')
+        internal_standards = index.for_product(self.product_code, 'internal_control')
         
         judgment_details = {
-            'external': {'standards_count': external_standards.count(), 'unfinished_items': [], 'failed_items': []},
-            'internal': {'standards_count': internal_standards.count(), 'unfinished_items': [], 'failed_items': []}
+            'external': {'standards_count': len(external_standards), 'unfinished_items': [], 'failed_items': []},
+            'internal': {'standards_count': len(internal_standards), 'unfinished_items': [], 'failed_items': []}
         }
         
         # 外控整体判定
-        if external_standards.exists():
+        if external_standards:
             has_unfinished = False
             all_qualified = True
             
@@ -154,7 +118,7 @@ class DryFilmProduct(models.Model):
             self.judgment_status = "已完成"
         
         # 内控整体判定
-        if internal_standards.exists():
+        if internal_standards:
             has_unfinished = False
             all_qualified = True
             
@@ -195,7 +159,7 @@ class DryFilmProduct(models.Model):
         
         self.judgment_details = judgment_details
 
-class ProductStandard(models.Model):
+class ProductStandard(TrackedModelMixin, models.Model):
     TEST_ITEMS = [
         ('appearance', '外观'),
         ('solid_content', '固含'),
@@ -282,10 +246,21 @@ class DryFilmProductHistory(models.Model):
         return f"{self.dryfilm_product} - {self.modified_by} - {self.created_at}"
 
 
-class AdhesiveProduct(models.Model):
+class AdhesiveProduct(TrackedModelMixin, models.Model):
     """胶粘剂产品模型"""
+    # 理化性能和胶带性能各自包含的检测项目
+    PHYSICAL_TEST_ITEMS = [
+        'appearance', 'solid_content', 'viscosity', 'acid_value',
+        'moisture', 'residual_monomer', 'weight_avg_molecular_weight',
+        'pdi', 'color'
+    ]
+    TAPE_TEST_ITEMS = [
+        'initial_tack', 'peel_strength', 'high_temperature_holding',
+        'room_temperature_holding', 'constant_load_peel', 'tape_structure'
+    ]
+    
     # 产品信息
-    product_code = models.CharField(max_length=50, verbose_name="产品牌号", blank=True)
+    product_code = models.CharField(max_length=50, verbose_name="产品牌号", blank=True, db_index=True)
     batch_number = models.CharField(max_length=50, verbose_name="产品批号", unique=True)
     production_line = models.CharField(max_length=50, verbose_name="产线")
     physical_inspector = models.CharField(max_length=50, verbose_name="理化检测人")
@@ -329,83 +304,43 @@ class AdhesiveProduct(models.Model):
         verbose_name = "胶粘剂产品"
         verbose_name_plural = "胶粘剂产品"
         ordering = ['-physical_test_date', 'batch_number']
+        indexes = [
+            # 产品查询按 (日期倒序, 批号) 游标分页
+            models.Index(fields=['-physical_test_date', 'batch_number'], name='adhesive_date_batch_idx'),
+            # 每日汇总按 (牌号, 产线, 日期) 分组加锁读取
+            models.Index(
+                fields=['product_code', 'production_line', 'physical_test_date'], name='adhesive_rollup_bucket_idx'
+            ),
+            # 按牌号的条件请求用 max(updated_at) 生成 ETag
+            models.Index(fields=['product_code', 'updated_at'], name='adhesive_code_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.product_code} - {self.batch_number}"
     
     def save(self, *args, **kwargs):
-        # 检查是否是更新操作
-        is_update = self.pk is not None
-        
-        # 如果是更新操作，获取原始数据用于比较
-        if is_update:
-            try:
-                original_obj = AdhesiveProduct.objects.get(pk=self.pk)
-                changed_fields = []
-                modified_data = {}
-                
-                # 检查哪些字段被修改了
-                for field in self._meta.fields:
-                    field_name = field.name
-                    if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                        original_value = getattr(original_obj, field_name)
-                        new_value = getattr(self, field_name)
-                        
-                        if original_value != new_value:
-                            # 格式化字段显示名称
-                            field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                            changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                            modified_data[field_name] = {
-                                'old': original_value,
-                                'new': new_value
-                            }
-                
-                # 如果有字段被修改，创建历史记录
-                if changed_fields:
-                    # 自动生成修改描述
-                    if not self.modification_reason:
-                        self.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-                    
-                    # 创建历史记录
-                    AdhesiveProductHistory.objects.create(
-                        adhesive_product=self,
-                        modified_by=self.modified_by if self.modified_by else 'system',
-                        modification_reason=self.modification_reason,
-                        modified_data=modified_data
-                    )
-                    
-            except AdhesiveProduct.DoesNotExist:
-                # 如果是新对象，不需要创建历史记录
-                pass
+        # 与加载时记录的原值比较，有字段被修改时创建历史记录
+        self.record_history(AdhesiveProductHistory, 'adhesive_product', kwargs.get('update_fields'), self.history_empty_reason)
         
         # 自动计算判定结果
         self.calculate_judgments()
         super().save(*args, **kwargs)
     
     def calculate_judgments(self):
-        from products.models import ProductStandard
-        
-        # 获取标准
-        physical_standards = ProductStandard.objects.filter(
-            product_code=self.product_code, 
-            test_item__in=['appearance', 'solid_content', 'viscosity', 'acid_value', 
-                          'moisture', 'residual_monomer', 'weight_avg_molecular_weight', 
-                          'pdi', 'color']
-        )
+        from products.standards import get_standards_index
         
-        tape_standards = ProductStandard.objects.filter(
-            product_code=self.product_code, 
-            test_item__in=['initial_tack', 'peel_strength', 'high_temperature_holding', 
-                          'room_temperature_holding', 'constant_load_peel', 'tape_structure']
-        )
+        # 获取标准（从内存索引读取，不查询数据库）
+        index = get_standards_index()
+        physical_standards = index.for_product(self.product_code, test_items=self.PHYSICAL_TEST_ITEMS)
+        tape_standards = index.for_product(self.product_code, test_items=self.TAPE_TEST_ITEMS)
         
         judgment_details = {
-            'physical': {'standards_count': physical_standards.count(), 'unfinished_items': [], 'failed_items': []},
-            'tape': {'standards_count': tape_standards.count(), 'unfinished_items': [], 'failed_items': []}
+            'physical': {'standards_count': len(physical_standards), 'unfinished_items': [], 'failed_items': []},
+            'tape': {'standards_count': len(tape_standards), 'unfinished_items': [], 'failed_items': []}
         }
         
         # 理化性能判定
-        if physical_standards.exists():
+        if physical_standards:
             has_unfinished = False
             all_qualified = True
             
@@ -442,7 +377,7 @@ class AdhesiveProduct(models.Model):
             self.physical_judgment = "无理化标准"
         
         # 胶带性能判定
-        if tape_standards.exists():
+        if tape_standards:
             has_unfinished = False
             all_qualified = True
             
@@ -512,7 +447,7 @@ class AdhesiveProductHistory(models.Model):
         return f"{self.adhesive_product} - {self.modified_by} - {self.created_at}"
 
 
-class PilotProduct(models.Model):
+class PilotProduct(TrackedModelMixin, models.Model):
     """小试产品模型"""
     # 产品信息
     product_code = models.CharField(max_length=50, verbose_name="产品牌号", blank=True)
@@ -552,49 +487,8 @@ class PilotProduct(models.Model):
         return f"{self.product_code} - {self.batch_number}"
     
     def save(self, *args, **kwargs):
-        # 检查是否是更新操作
-        is_update = self.pk is not None
-        
-        # 如果是更新操作，获取原始数据用于比较
-        if is_update:
-            try:
-                original_obj = PilotProduct.objects.get(pk=self.pk)
-                changed_fields = []
-                modified_data = {}
-                
-                # 检查哪些字段被修改了
-                for field in self._meta.fields:
-                    field_name = field.name
-                    if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                        original_value = getattr(original_obj, field_name)
-                        new_value = getattr(self, field_name)
-                        
-                        if original_value != new_value:
-                            # 格式化字段显示名称
-                            field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                            changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                            modified_data[field_name] = {
-                                'old': original_value,
-                                'new': new_value
-                            }
-                
-                # 如果有字段被修改，创建历史记录
-                if changed_fields:
-                    # 自动生成修改描述
-                    if not self.modification_reason:
-                        self.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-                    
-                    # 创建历史记录
-                    PilotProductHistory.objects.create(
-                        pilot_product=self,
-                        modified_by=self.modified_by if self.modified_by else 'system',
-                        modification_reason=self.modification_reason,
-                        modified_data=modified_data
-                    )
-                    
-            except PilotProduct.DoesNotExist:
-                # 如果是新对象，不需要创建历史记录
-                pass
+        # 与加载时记录的原值比较，有字段被修改时创建历史记录
+        self.record_history(PilotProductHistory, 'pilot_product', kwargs.get('update_fields'), self.history_empty_reason)
         
         super().save(*args, **kwargs)
 
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core import rollup
+from core.cache import invalidate
+from core.rejudge import schedule_rejudge
+from .models import AdhesiveProduct, DryFilmProduct, ProductStandard
+from .standards import invalidate_standards_index
+
+
+@receiver([post_save, post_delete], sender=ProductStandard)
+def product_standard_changed(sender, **kwargs):
+    """产品标准保存或删除后使标准索引失效"""
+    invalidate_standards_index()
+    # 其他线程可能在事务提交前用旧数据重建了索引，提交后再失效一次
+    transaction.on_commit(invalidate_standards_index)
+
+
+@receiver(pre_save, sender=ProductStandard)
+@receiver(pre_save, sender=DryFilmProduct)
+@receiver(pre_save, sender=AdhesiveProduct)
+def remember_previous_product_code(sender, instance, **kwargs):
+    """记录修改前的牌号，牌号被修改时新旧牌号都需要重新判定并使缓存失效"""
+    instance._previous_product_code = None
+    if instance.pk:
+        instance._previous_product_code = instance.get_original_value('product_code')
+
+
+@receiver([post_save, post_delete], sender=ProductStandard)
+def schedule_product_rejudge(sender, instance, **kwargs):
+    """标准变更提交后，重新判定受影响牌号的产品记录"""
+    product_codes = {instance.product_code, getattr(instance, '_previous_product_code', None)}
+    for product_code in product_codes - {None}:
+        transaction.on_commit(lambda code=product_code: schedule_rejudge('product', code))
+
+
+@receiver([post_save, post_delete], sender=ProductStandard)
+@receiver([post_save, post_delete], sender=DryFilmProduct)
+@receiver([post_save, post_delete], sender=AdhesiveProduct)
+def invalidate_product_cache(sender, instance, **kwargs):
+    """产品或产品标准变更后，使相关牌号的SPC接口缓存失效"""
+    invalidate('product', {instance.product_code, getattr(instance, '_previous_product_code', None)})
+
+
+@receiver(pre_save, sender=DryFilmProduct)
+@receiver(pre_save, sender=AdhesiveProduct)
+def remember_rollup_bucket(sender, instance, **kwargs):
+    """记录修改前所在的每日汇总分组"""
+    instance._previous_rollup_bucket = rollup.original_bucket_of(rollup.family_for_model(sender), instance)
+
+
+@receiver([post_save, post_delete], sender=DryFilmProduct)
+@receiver([post_save, post_delete], sender=AdhesiveProduct)
+def refresh_product_rollups(sender, instance, **kwargs):
+    """在保存或删除记录的同一事务中重算修改前后所在分组的每日汇总"""
+    family = rollup.family_for_model(sender)
+    rollup.refresh_buckets(family, [
+        rollup.bucket_of(family, instance), getattr(instance, '_previous_rollup_bucket', None),
+    ])
@@ -0,0 +1,77 @@
+"""产品标准内存索引 - 判定、能力分析和报告共用，避免每次保存都查询ProductStandard"""
+
+import threading
+from collections import defaultdict
+
+# 标准变更时递增的版本号，索引版本落后时重新加载
+_version = 0
+_index = None
+_lock = threading.Lock()
+
+
+class StandardsIndex:
+    """按 (product_code, standard_type, test_item) 编译好的产品标准索引"""
+
+    def __init__(self, standards, version):
+        self.version = version
+        self._by_key = {}
+        self._by_product = defaultdict(list)
+        self._by_product_type = defaultdict(list)
+
+        # standards 已按主键排序，与原先查询集的迭代顺序保持一致
+        for standard in standards:
+            self._by_key[(standard.product_code, standard.standard_type, standard.test_item)] = standard
+            self._by_product[standard.product_code].append(standard)
+            self._by_product_type[(standard.product_code, standard.standard_type)].append(standard)
+
+    def get(self, product_code, standard_type, test_item):
+        """获取单条标准，不存在时返回None"""
+        return self._by_key.get((product_code, standard_type, test_item))
+
+    def for_product(self, product_code, standard_type=None, test_items=None):
+        """获取某牌号的标准列表，可按标准类型和检测项目过滤"""
+        if standard_type is None:
+            standards = self._by_product.get(product_code, [])
+        else:
+            standards = self._by_product_type.get((product_code, standard_type), [])
+
+        if test_items is not None:
+            standards = [standard for standard in standards if standard.test_item in test_items]
+        return list(standards)
+
+    def first_for_item(self, product_code, test_item):
+        """获取某牌号某检测项目主键最小的标准（等价于 filter(...).first()）"""
+        for standard in self._by_product.get(product_code, []):
+            if standard.test_item == test_item:
+                return standard
+        return None
+
+    def product_codes(self):
+        """已定义标准的全部牌号"""
+        return list(self._by_product.keys())
+
+
+def get_standards_index():
+    """获取当前的标准索引，标准被修改后首次调用时重新加载"""
+    global _index
+
+    index = _index
+    if index is not None and index.version == _version:
+        return index
+
+    with _lock:
+        if _index is None or _index.version != _version:
+            from products.models import ProductStandard
+
+            version = _version
+            standards = list(ProductStandard.objects.order_by('pk'))
+            _index = StandardsIndex(standards, version)
+        return _index
+
+
+def invalidate_standards_index(**kwargs):
+    """使标准索引失效，可直接作为信号接收函数使用"""
+    global _version
+
+    with _lock:
+        _version += 1
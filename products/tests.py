@@ -1,3 +1,1323 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import openpyxl
+
+from django.contrib import admin
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from core import parallel, rollup
+from core.capability import BLOCK_ELEMENTS, bootstrap_intervals, cached_capability_intervals
+from core.downsample import lttb_indices
+from core.encoding import MSGPACK_TYPE, packb
+from core.rejudge import RejudgeQueue
+from .admin import DryFilmProductAdmin
+from .judgment_engine import FAMILY_SPECS, rejudge_pk_range, rejudge_queryset
+from dashboard.models import DailyRollup
+from .models import DryFilmProduct, DryFilmProductHistory, AdhesiveProduct, PilotProduct, ProductStandard
+from .standards import get_standards_index, invalidate_standards_index
+
+
+def login_importer(client, username='importer'):
+    """登录一个具有干膜产品新增和修改权限的用户，用于调用导入接口"""
+    user = User.objects.create_user(username, password='x')
+    user.user_permissions.add(*Permission.objects.filter(
+        content_type__app_label='products', codename__in=['add_dryfilmproduct', 'change_dryfilmproduct']
+    ))
+    client.force_login(user)
+    return user
+
+
+class StandardsIndexTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        ProductStandard.objects.create(
+            product_code='TEST001', test_item='solid_content',
+            standard_type='external_control', lower_limit=45.0, upper_limit=55.0
+        )
+        ProductStandard.objects.create(
+            product_code='TEST001', test_item='solid_content',
+            standard_type='internal_control', lower_limit=48.0, upper_limit=52.0
+        )
+        self.product = DryFilmProduct(
+            product_code='TEST001',
+            batch_number='BATCH001',
+            production_line='Test Line',
+            inspector='Test Inspector',
+            test_date=timezone.now().date(),
+            sample_category='Test Category',
+            solid_content=50.0,
+        )
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def test_warm_index_judges_without_queries(self):
+        """索引预热后判定不再查询数据库"""
+        get_standards_index()
+        with self.assertNumQueries(0):
+            self.product.calculate_final_judgments()
+        self.assertEqual(self.product.external_final_judgment, '外控合格')
+        self.assertEqual(self.product.internal_final_judgment, '内控合格')
+
+    def test_standard_save_invalidates_index(self):
+        """修改标准后索引重新加载"""
+        self.product.calculate_final_judgments()
+        standard = ProductStandard.objects.get(standard_type='internal_control')
+        standard.upper_limit = 49.0
+        standard.save()
+
+        self.product.calculate_final_judgments()
+        self.assertEqual(self.product.internal_final_judgment, '内控不合格')
+
+    def test_standard_delete_invalidates_index(self):
+        """删除标准后索引重新加载"""
+        self.product.calculate_final_judgments()
+        ProductStandard.objects.filter(standard_type='external_control').delete()
+        # 查询集删除同样会触发post_delete信号
+        self.product.calculate_final_judgments()
+        self.assertEqual(self.product.external_final_judgment, '无外控标准')
+
+    def test_adhesive_uses_both_standard_types(self):
+        """胶粘剂理化判定同时使用外控和内控标准"""
+        product = AdhesiveProduct(product_code='TEST001', solid_content=50.0)
+        product.calculate_judgments()
+        self.assertEqual(product.judgment_details['physical']['standards_count'], 2)
+        self.assertEqual(product.physical_judgment, '理化合格')
+
+
+class JudgmentEngineTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        rng = random.Random(42)
+        for code in ['P1', 'P2']:
+            for standard_type in ['external_control', 'internal_control']:
+                for item in ['solid_content', 'viscosity', 'initial_tack', 'appearance']:
+                    ProductStandard.objects.create(
+                        product_code=code, test_item=item, standard_type=standard_type,
+                        lower_limit=None if item == 'appearance' else 40.0,
+                        upper_limit=None if item == 'appearance' else 60.0,
+                    )
+        today = timezone.now().date()
+        for i in range(60):
+            values = {
+                'product_code': rng.choice(['P1', 'P2', 'P3']),
+                'batch_number': f'B{i:04d}',
+                'production_line': 'L1',
+                'sample_category': '单批样',
+                'modified_by': 'test',
+                'appearance': rng.choice(['', '合格']),
+                'solid_content': rng.choice([None, 0.0, 35.0, 50.0, 65.0]),
+                'viscosity': rng.choice([None, 45.0, 70.0]),
+            }
+            DryFilmProduct.objects.create(inspector='t', test_date=today, **values)
+            AdhesiveProduct.objects.create(
+                physical_inspector='t', tape_inspector='t', tape_test_date=today,
+                physical_test_date=today, initial_tack=rng.choice([None, 50.0, 80.0]), **values
+            )
+        # 判定结果清空后由引擎重新计算
+        DryFilmProduct.objects.update(judgment_details={}, external_final_judgment='', internal_final_judgment='')
+        AdhesiveProduct.objects.update(judgment_details={}, final_judgment='')
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def assert_matches_row_method(self, product_type, method_name):
+        spec = FAMILY_SPECS[product_type]
+        result = rejudge_queryset(product_type, chunk_size=7)
+        self.assertEqual(result['processed'], 60)
+        fields = spec['judgment_fields'] + ['judgment_details']
+        for product in spec['model'].objects.all():
+            stored = {field: getattr(product, field) for field in fields}
+            getattr(product, method_name)()
+            expected = {field: getattr(product, field) for field in fields}
+            self.assertEqual(stored, expected)
+
+    def test_dryfilm_matches_row_method(self):
+        """批量判定结果与逐行判定完全一致（干膜）"""
+        self.assert_matches_row_method('dryfilm', 'calculate_final_judgments')
+
+    def test_adhesive_matches_row_method(self):
+        """批量判定结果与逐行判定完全一致（胶粘剂）"""
+        self.assert_matches_row_method('adhesive', 'calculate_judgments')
+
+    def test_unchanged_rows_are_not_written(self):
+        """判定结果没有变化的记录不会重复写入"""
+        rejudge_queryset('dryfilm')
+        result = rejudge_queryset('dryfilm')
+        self.assertEqual(result['updated'], 0)
+
+
+class IncrementalRejudgeTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        self.standard = ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content',
+            standard_type='internal_control', lower_limit=40.0, upper_limit=60.0
+        )
+        today = timezone.now().date()
+        for code in ['P1', 'P2']:
+            DryFilmProduct.objects.create(
+                product_code=code, batch_number=f'{code}-001', production_line='L1',
+                inspector='t', test_date=today, sample_category='单批样',
+                modified_by='test', solid_content=50.0
+            )
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    @override_settings(REJUDGE_ASYNC=False)
+    def test_standard_change_rejudges_only_affected_code(self):
+        """修改标准后只重新判定受影响牌号的记录"""
+        DryFilmProduct.objects.update(internal_final_judgment='')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.standard.upper_limit = 45.0
+            self.standard.save()
+
+        self.assertEqual(DryFilmProduct.objects.get(product_code='P1').internal_final_judgment, '内控不合格')
+        self.assertEqual(DryFilmProduct.objects.get(product_code='P2').internal_final_judgment, '')
+
+    def test_queue_coalesces_repeated_changes(self):
+        """合并窗口内同一牌号的多次修改只执行一次判定"""
+        calls = []
+        done = threading.Event()
+
+        def runner(key, progress):
+            calls.append(key)
+            if len(calls) == 2:
+                done.set()
+            return {'processed': 1, 'updated': 0}
+
+        queue = RejudgeQueue(runners={'product': runner}, coalesce_seconds=0.2)
+        for _ in range(5):
+            queue.enqueue('product', 'P1')
+        queue.enqueue('product', 'P2')
+
+        self.assertTrue(done.wait(timeout=5))
+        time.sleep(0.3)
+        self.assertEqual(sorted(calls), ['P1', 'P2'])
+        self.assertTrue(all(task['state'] == 'done' for task in queue.status()))
+
+    def test_enqueue_while_running_keeps_progress(self):
+        """执行中再次加入队列时原地更新进度记录，执行中的进度仍然可见"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def runner(key, progress):
+            progress(3, 10, 1, 0.0)
+            started.set()
+            release.wait(timeout=5)
+            return {'processed': 10, 'updated': 1}
+
+        queue = RejudgeQueue(runners={'product': runner}, coalesce_seconds=0.05)
+        queue.enqueue('product', 'P1')
+        self.assertTrue(started.wait(timeout=5))
+        queue.enqueue('product', 'P1')
+        [task] = queue.status()
+        self.assertEqual((task['state'], task['processed'], task['total'], task['queued']), ('running', 3, 10, True))
+        release.set()
+
+    def test_finished_status_is_pruned(self):
+        """已结束的进度记录超过数量上限或保留时间后清除"""
+        queue = RejudgeQueue(runners={'product': lambda key, progress: {'processed': 1, 'updated': 0}},
+                             max_finished=2)
+        for code in ('P1', 'P2', 'P3'):
+            queue.run_now('product', code)
+        self.assertEqual(sorted(task['key'] for task in queue.status()), ['P2', 'P3'])
+
+        queue.status_ttl = -1
+        self.assertEqual(queue.status(), [])
+
+    def test_status_requires_login(self):
+        """重新判定进度接口需要登录"""
+        self.assertEqual(self.client.get('/core/api/rejudge-status/').status_code, 302)
+        self.client.force_login(User.objects.create_user('viewer', password='x'))
+        self.assertEqual(self.client.get('/core/api/rejudge-status/').status_code, 200)
+
+
+class ParallelRejudgeTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content',
+            standard_type='internal_control', lower_limit=40.0, upper_limit=45.0
+        )
+        today = timezone.now().date()
+        for i in range(10):
+            DryFilmProduct.objects.create(
+                product_code='P1', batch_number=f'P1-{i:03d}', production_line='L1',
+                inspector='t', test_date=today, sample_category='单批样',
+                modified_by='test', solid_content=50.0
+            )
+        DryFilmProduct.objects.update(internal_final_judgment='')
+        self.checkpoint_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(parallel, 'CHECKPOINT_DIR', self.checkpoint_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.checkpoint_dir, True)
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def test_plan_pk_ranges_covers_all_rows(self):
+        """按主键切分的范围覆盖全部记录且互不重叠"""
+        pks = list(DryFilmProduct.objects.order_by('pk').values_list('pk', flat=True))
+        ranges = parallel.plan_pk_ranges(DryFilmProduct.objects.all(), 4)
+        self.assertEqual(len(ranges), 3)
+        self.assertEqual(ranges[0][0], pks[0])
+        self.assertEqual(ranges[-1][1], pks[-1])
+        covered = [pk for start, end in ranges for pk in pks if start <= pk <= end]
+        self.assertEqual(covered, pks)
+
+    def test_resume_skips_committed_chunks(self):
+        """中断后继续执行时跳过已提交的块"""
+        chunk_func = partial(rejudge_pk_range, 'dryfilm')
+        calls = []
+
+        def failing_chunk(start_pk, end_pk):
+            if calls:
+                raise RuntimeError('模拟中断')
+            calls.append((start_pk, end_pk))
+            return chunk_func(start_pk, end_pk)
+
+        with self.assertRaises(RuntimeError):
+            parallel.run_chunks('test_job', DryFilmProduct.objects.all(), failing_chunk, chunk_size=4)
+        self.assertEqual(DryFilmProduct.objects.filter(internal_final_judgment='内控不合格').count(), 4)
+
+        result = parallel.run_chunks(
+            'test_job', DryFilmProduct.objects.all(), chunk_func, chunk_size=4, resume=True
+        )
+        self.assertEqual(result['chunks'], 3)
+        self.assertEqual(result['resumed_chunks'], 1)
+        self.assertEqual(result['processed'], 6)
+        self.assertEqual(DryFilmProduct.objects.filter(internal_final_judgment='内控不合格').count(), 10)
+        self.assertFalse(os.path.exists(parallel.checkpoint_path('test_job')))
+
+
+class ChangeTrackingTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        DryFilmProduct.objects.create(
+            product_code='P1', batch_number='P1-001', production_line='L1',
+            inspector='t', test_date=timezone.now().date(), sample_category='单批样',
+            modified_by='test', solid_content=50.0, judgment_details={'internal': {}}
+        )
+        get_standards_index()
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def test_save_uses_snapshot_without_extra_select(self):
+        """保存时与加载时的原值比较，不再查询原记录"""
+        product = DryFilmProduct.objects.get(batch_number='P1-001')
+        product.solid_content = 51.0
+        # 写入历史记录、更新记录，以及重算所在分组每日汇总的5条语句（保存点、删除、聚合、写入、释放）
+        with self.assertNumQueries(7):
+            product.save()
+
+        history = DryFilmProductHistory.objects.get()
+        self.assertEqual(history.modified_data, {'solid_content': {'old': 50.0, 'new': 51.0}})
+
+        # 保存后的值成为新的原值
+        product.save()
+        self.assertEqual(DryFilmProductHistory.objects.count(), 1)
+
+    def test_update_fields_only_diffs_written_fields(self):
+        """指定 update_fields 时只比较即将写入的字段"""
+        product = DryFilmProduct.objects.get(batch_number='P1-001')
+        product.solid_content = 51.0
+        product.viscosity = 10.0
+        product.save(update_fields=['solid_content'])
+
+        self.assertEqual(list(DryFilmProductHistory.objects.get().modified_data), ['solid_content'])
+
+    def test_admin_save_creates_single_history(self):
+        """管理界面保存只生成一条历史记录，无数据变更时也记录"""
+        request = RequestFactory().post('/')
+        request.user = User(username='admin')
+        model_admin = DryFilmProductAdmin(DryFilmProduct, admin.site)
+
+        product = DryFilmProduct.objects.get(batch_number='P1-001')
+        product.solid_content = 52.0
+        model_admin.save_model(request, product, None, True)
+        product = DryFilmProduct.objects.get(batch_number='P1-001')
+        model_admin.save_model(request, product, None, True)
+
+        reasons = list(DryFilmProductHistory.objects.order_by('pk').values_list('modification_reason', 'modified_by'))
+        self.assertEqual(len(reasons), 2)
+        self.assertIn('固含: 50.0 → 52.0', reasons[0][0])
+        self.assertEqual(reasons[1], ('通过管理界面修改（无数据变更）', 'admin'))
+
+
+class IngestMeasurementsTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content',
+            standard_type='internal_control', lower_limit=40.0, upper_limit=60.0
+        )
+        self.url = '/core/api/ingest/dryfilm/'
+        self.user = login_importer(self.client)
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def post_ndjson(self, rows):
+        body = '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows)
+        return self.client.post(self.url, body, content_type='application/x-ndjson')
+
+    def make_row(self, batch_number, **values):
+        row = {
+            'product_code': 'P1', 'batch_number': batch_number, 'production_line': 'L1',
+            'inspector': 't', 'test_date': '2024-05-01', 'sample_category': '单批样',
+        }
+        row.update(values)
+        return row
+
+    def test_ndjson_creates_and_judges_rows(self):
+        """NDJSON导入新建记录并批量判定，错误行单独报告"""
+        response = self.post_ndjson([
+            self.make_row('B1', solid_content=50),
+            self.make_row('B2', solid_content=70),
+            self.make_row('B3', solid_content='abc'),
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([r['status'] for r in data['results']], ['created', 'created', 'error'])
+        self.assertIn('solid_content', data['results'][2]['errors'])
+        self.assertEqual(DryFilmProduct.objects.get(batch_number='B1').internal_final_judgment, '内控合格')
+        self.assertEqual(DryFilmProduct.objects.get(batch_number='B2').internal_final_judgment, '内控不合格')
+
+    def test_created_ids_without_returning_bulk_insert(self):
+        """数据库不返回批量插入的主键时（MySQL），新记录的 id 由一次查询补上"""
+        from django.db import connection
+
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            results = self.post_ndjson([self.make_row('B1', solid_content=50), self.make_row('B2')]).json()['results']
+        self.assertEqual(
+            [result['id'] for result in results],
+            [DryFilmProduct.objects.get(batch_number=batch).pk for batch in ('B1', 'B2')],
+        )
+
+    def test_upsert_writes_single_history(self):
+        """按批号更新已有记录，只对有变化的行写入一条历史记录"""
+        self.post_ndjson([self.make_row('B1', solid_content=50), self.make_row('B2', solid_content=50)])
+        data = self.post_ndjson([
+            self.make_row('B1', solid_content=70),
+            self.make_row('B2', solid_content=50),
+        ]).json()
+
+        self.assertEqual(data['summary']['updated'], 1)
+        self.assertEqual(data['summary']['unchanged'], 1)
+        history = DryFilmProductHistory.objects.get()
+        self.assertEqual(history.modified_data['solid_content'], {'old': 50.0, 'new': 70.0})
+        self.assertEqual(DryFilmProduct.objects.get(batch_number='B1').internal_final_judgment, '内控不合格')
+
+    def test_csv_accepts_verbose_name_headers(self):
+        """CSV可以使用中文列名"""
+        body = '产品牌号,产品批号,产线,检测人,测试日期,样品类别,固含,未知列\nP1,C1,L1,t,2024-05-01,单批样,45,x\n'
+        data = self.client.post(self.url, body, content_type='text/csv').json()
+        self.assertEqual(data['summary']['created'], 1)
+        self.assertEqual(data['ignored_columns'], ['未知列'])
+        self.assertEqual(DryFilmProduct.objects.get(batch_number='C1').solid_content, 45.0)
+
+    def test_requires_login_and_permissions(self):
+        """匿名请求返回401，没有新增/修改权限返回403，都不写入数据"""
+        self.client.logout()
+        response = self.post_ndjson([self.make_row('B1', solid_content=50)])
+        self.assertEqual(response.status_code, 401)
+
+        self.client.force_login(User.objects.create_user('viewer', password='x'))
+        response = self.post_ndjson([self.make_row('B1', solid_content=50)])
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(DryFilmProduct.objects.exists())
+
+    def test_session_post_requires_csrf_token(self):
+        """会话认证的 POST 需要 CSRF 令牌"""
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(self.url, json.dumps(self.make_row('B1')), content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+
+class ImportMeasurementsTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content',
+            standard_type='internal_control', lower_limit=40.0, upper_limit=60.0
+        )
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir, True)
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def write_workbook(self, rows):
+        path = os.path.join(self.tmpdir, 'data.xlsx')
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet('检测数据')
+        worksheet.append(['产品牌号', '产品批号', '产线', '检测人', '测试日期', '样品类别', '固含'])
+        for row in rows:
+            worksheet.append(row)
+        workbook.save(path)
+        return path
+
+    def test_command_imports_xlsx_in_chunks(self):
+        """命令分块导入xlsx，中文列名映射到字段并完成判定"""
+        test_date = datetime.date(2024, 5, 1)
+        rows = [['P1', f'X{i:03d}', 'L1', 't', test_date, '单批样', 50 + i] for i in range(25)]
+        rows.append(['P1', 'BAD', 'L1', 't', 'not a date', '单批样', 50])
+        path = self.write_workbook(rows)
+
+        out = io.StringIO()
+        call_command('import_measurements', path, product_type='dryfilm', chunk_size=10, stdout=out)
+
+        self.assertEqual(DryFilmProduct.objects.count(), 25)
+        self.assertEqual(DryFilmProduct.objects.filter(internal_final_judgment='内控不合格').count(), 14)
+        self.assertIn('错误 1 条', out.getvalue())
+
+    def test_admin_upload_imports_csv(self):
+        """管理界面上传CSV导入数据"""
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        self.assertContains(self.client.get('/admin/products/dryfilmproduct/'), '/admin/products/dryfilmproduct/import/')
+        self.assertContains(self.client.get('/admin/products/dryfilmproduct/import/'), 'name="file"')
+
+        upload = io.BytesIO('产品批号,产品牌号,产线,检测人,测试日期,样品类别\nU1,P1,L1,t,2024-05-01,单批样\n'.encode('utf-8'))
+        upload.name = 'data.csv'
+
+        response = self.client.post('/admin/products/dryfilmproduct/import/', {'file': upload})
+        self.assertRedirects(response, '/admin/products/dryfilmproduct/', fetch_redirect_response=False)
+        self.assertEqual(DryFilmProduct.objects.get(batch_number='U1').modified_by, 'admin')
+
+
+class JudgmentAuditTests(TestCase):
+
+    def setUp(self):
+        invalidate_standards_index()
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content',
+            standard_type='internal_control', lower_limit=40.0, upper_limit=60.0
+        )
+        today = timezone.now().date()
+        for i, code in enumerate(['P1', 'P1', 'P2']):
+            DryFilmProduct.objects.create(
+                product_code=code, batch_number=f'A{i}', production_line='L1',
+                inspector='t', test_date=today, sample_category='单批样',
+                modified_by='test', solid_content=50.0 + i * 10
+            )
+        # 绕过信号直接修改标准，模拟存储的判定已经过期
+        ProductStandard.objects.update(upper_limit=55.0)
+        invalidate_standards_index()
+
+    def tearDown(self):
+        invalidate_standards_index()
+
+    def test_audit_reports_only_drifted_rows(self):
+        """审计只输出判定不一致的记录并按牌号汇总，不修改数据"""
+        out = io.StringIO()
+        call_command('audit_judgments', product_type='dryfilm', chunk_size=2, stdout=out)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+
+        drifted = rows[1:rows.index([])]
+        self.assertEqual([row[2] for row in drifted], ['A1'])
+        self.assertIn('内控不合格', drifted[0][6])
+        totals = rows[rows.index([]) + 2:]
+        self.assertEqual(totals, [['干膜产品', 'P1', '2', '1'], ['干膜产品', 'P2', '1', '0']])
+        self.assertEqual(DryFilmProduct.objects.get(batch_number='A1').internal_final_judgment, '内控合格')
+
+    def test_admin_streams_audit_csv(self):
+        """管理界面流式下载审计CSV"""
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.login(username='admin', password='password')
+        response = self.client.get('/admin/products/dryfilmproduct/judgment-audit/')
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('A1', content)
+
+
+class TestItemSchemaTests(TestCase):
+    """检测项目注册表与模型定义保持一致"""
+
+    def test_registry_matches_models(self):
+        """名称与模型 verbose_name 一致，可设标准的项目与 ProductStandard.TEST_ITEMS 一致"""
+        from core.schema import FAMILIES
+        from raw_materials.models import RawMaterial, RawMaterialStandard
+
+        models = {
+            'dryfilm': DryFilmProduct, 'adhesive': AdhesiveProduct,
+            'pilot': PilotProduct, 'raw_material': RawMaterial,
+        }
+        for product_type, family in FAMILIES.items():
+            for item in family.items:
+                field = models[product_type]._meta.get_field(item.column)
+                self.assertEqual(item.label, field.verbose_name, (product_type, item.name))
+                self.assertEqual(item.is_numeric, field.get_internal_type() == 'FloatField', item.name)
+
+        test_items = dict(ProductStandard.TEST_ITEMS)
+        standard_items = {
+            item.name: item.label
+            for name in ('dryfilm', 'adhesive', 'pilot') for item in FAMILIES[name].items if item.standard
+        }
+        self.assertEqual(standard_items, test_items)
+        self.assertEqual(
+            [(item.name, item.label) for item in FAMILIES['raw_material'].items],
+            RawMaterialStandard.TEST_ITEM_CHOICES,
+        )
+
+    def test_export_and_copy_items_unchanged(self):
+        """导出和复制文本的检测项目与原有输出一致：干膜不含分散性、稳定性，胶粘剂不含胶带结构"""
+        from products.admin import ADHESIVE_EXPORT_COLUMNS, AdhesiveProductAdmin, DRYFILM_EXPORT_COLUMNS
+
+        self.assertNotIn('dispersion', DRYFILM_EXPORT_COLUMNS[0])
+        self.assertNotIn('stability', DRYFILM_EXPORT_COLUMNS[0])
+        self.assertEqual(
+            ADHESIVE_EXPORT_COLUMNS[0][8:22],
+            ['appearance', 'solid_content', 'viscosity', 'acid_value', 'moisture', 'residual_monomer',
+             'weight_avg_molecular_weight', 'pdi', 'color', 'initial_tack', 'peel_strength',
+             'high_temperature_holding', 'room_temperature_holding', 'constant_load_peel'],
+        )
+
+        product = AdhesiveProduct(pk=1, product_code='P1', batch_number='B1', peel_strength=3.5, tape_structure='单面')
+        text = AdhesiveProductAdmin(AdhesiveProduct, admin.site).copy_text(product)
+        self.assertIn('剥离: 3.5', text)
+        self.assertNotIn('胶带结构', text)
+
+    def test_field_value_lookup(self):
+        """按检测项目取值只返回数值型项目"""
+        from core.utils import get_product_field_value
+
+        product = AdhesiveProduct(product_code='P1', batch_number='B1', peel_strength=3.5, tape_structure='单面')
+        self.assertEqual(get_product_field_value(product, 'peel_strength', 'adhesive'), 3.5)
+        self.assertIsNone(get_product_field_value(product, 'tape_structure', 'adhesive'))
+        self.assertIsNone(get_product_field_value(product, 'peel_strength', 'dryfilm'))
+
+
+class SpcEndpointTests(TestCase):
+    """SPC 组合接口"""
+
+    def setUp(self):
+        cache.clear()
+        day = datetime.date(2024, 1, 1)
+        for i, value in enumerate([50.0, 52.0, None, 49.0]):
+            DryFilmProduct.objects.create(
+                product_code='P1', batch_number=f'2024010{i + 1}-A', production_line='L1',
+                inspector='tester', test_date=day + datetime.timedelta(days=i), modified_by='test',
+                solid_content=value
+            )
+        DryFilmProduct.objects.create(
+            product_code='P2', batch_number='20240101-B', production_line='L1', inspector='tester',
+            test_date=day, modified_by='test', solid_content=10.0
+        )
+
+    def test_combined_payload_matches_legacy_endpoints(self):
+        """各部分与原来的独立接口结果一致，且只执行一次数据查询（另一次是生成 ETag 的聚合查询）"""
+        params = {'product_code': 'P1', 'test_item': 'solid_content'}
+        with self.assertNumQueries(2):
+            payload = self.client.get('/api/products/dryfilm/spc/', {**params, 'parts': 'series,moving_range,search'}).json()
+
+        chart = self.client.get('/api/products/dryfilm/chart-data/', params).json()
+        moving_range = self.client.get('/api/products/dryfilm/moving-range/', params).json()
+        capability = self.client.get('/api/products/dryfilm/capability-analysis/', params).json()
+        search = self.client.get('/api/products/dryfilm/search/', {'product_code': 'P1'}).json()
+
+        self.assertEqual(payload['series'], chart)
+        self.assertEqual(payload['moving_range'], moving_range)
+        self.assertEqual(payload['search']['products'], search['products'])
+        self.assertNotIn('capability', payload)
+        self.assertEqual(self.client.get('/api/products/dryfilm/spc/', params).json()['capability'], capability)
+
+    def test_invalid_parameters(self):
+        """无效的检测项目或数据部分返回400，只查询结果时不需要检测项目"""
+        response = self.client.get('/api/products/dryfilm/spc/', {'test_item': 'product_code'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/products/dryfilm/spc/', {'test_item': 'solid_content', 'parts': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/products/dryfilm/spc/', {'parts': 'search'})
+        self.assertEqual(len(response.json()['search']['products']), 5)
+
+    def test_legacy_endpoints_use_column_fetch(self):
+        """图表接口只查询所需的列，统计结果正确，并校验检测项目"""
+        params = {'product_code': 'P1', 'test_item': 'solid_content'}
+        # ETag 聚合查询和数据查询
+        with self.assertNumQueries(2):
+            chart = self.client.get('/api/products/dryfilm/chart-data/', params).json()
+        self.assertEqual(chart['data'], [50.0, 52.0, None, 49.0])
+        self.assertAlmostEqual(chart['statistics']['average'], 151.0 / 3)
+        self.assertEqual(chart['labels'][0], '20240101')
+
+        moving_range = self.client.get('/api/products/dryfilm/moving-range/', params).json()
+        self.assertEqual(moving_range['moving_ranges'], [None, 2.0, None, None])
+        self.assertEqual(moving_range['statistics']['mr_average'], 2.0)
+
+        for endpoint in ('chart-data', 'moving-range', 'capability-analysis'):
+            response = self.client.get(f'/api/products/dryfilm/{endpoint}/', {'test_item': 'appearance'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_msgpack_packs_float_columns(self):
+        """Accept 为 MessagePack 时浮点序列写成 float64 字节，JSON 和 MessagePack 分别缓存"""
+        self.assertEqual(packb({'a': [1, -1, None, True]}), b'\x81\xa1a\x94\x01\xff\xc0\xc3')
+        self.assertEqual(packb(1.5), b'\xcb' + struct.pack('>d', 1.5))
+
+        params = {'product_code': 'P1', 'test_item': 'solid_content'}
+        url = '/api/products/dryfilm/chart-data/'
+        self.assertEqual(self.client.get(url, params)['X-Cache'], 'MISS')
+        response = self.client.get(url, params, HTTP_ACCEPT=MSGPACK_TYPE)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response['Content-Type'], MSGPACK_TYPE)
+        self.assertIn('Accept', response['Vary'])
+        column = np.array([50.0, 52.0, np.nan, 49.0], dtype='<f8').tobytes()
+        self.assertIn(b'\xc4\x20' + column, response.content)
+        self.assertEqual(self.client.get(url, params, HTTP_ACCEPT=MSGPACK_TYPE).content, response.content)
+        self.assertEqual(self.client.get(url, params).json()['data'], [50.0, 52.0, None, 49.0])
+
+
+class ProductSearchTests(TestCase):
+    """产品查询按 (日期倒序, 批号) 游标分页，支持字段投影和前缀匹配"""
+
+    def setUp(self):
+        cache.clear()
+        day = datetime.date(2024, 1, 1)
+        for i in range(7):
+            DryFilmProduct.objects.create(
+                product_code='AB-1' if i % 2 else 'XAB-2', batch_number=f'B{i}', production_line='L1',
+                inspector='tester', test_date=day + datetime.timedelta(days=i // 2), modified_by='test',
+                solid_content=50.0 + i
+            )
+
+    def test_cursor_pages_cover_all_rows_in_order(self):
+        """逐页读取的结果与完整排序一致，每页只执行一次查询"""
+        url = '/api/products/dryfilm/search/'
+        batches, cursor = [], None
+        while True:
+            params = {'limit': 3, 'fields': 'batch_number,test_date'}
+            if cursor:
+                params['cursor'] = cursor
+            # ETag 聚合查询和一页数据查询
+            with self.assertNumQueries(1):
+                # 每页只有一次取数，ETag 由版本号生成
+                page = self.client.get(url, params).json()
+            self.assertEqual(set(page['products'][0]), {'batch_number', 'test_date'})
+            batches += [product['batch_number'] for product in page['products']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        expected = list(DryFilmProduct.objects.order_by('-test_date', 'batch_number').values_list('batch_number', flat=True))
+        self.assertEqual(batches, expected)
+
+    def test_match_modes_and_invalid_parameters(self):
+        """prefix 只匹配开头，contains 保持模糊匹配；无效参数返回400"""
+        url = '/api/products/dryfilm/search/'
+        contains = self.client.get(url, {'product_code': 'AB'}).json()['products']
+        prefix = self.client.get(url, {'product_code': 'AB', 'match': 'prefix'}).json()['products']
+        self.assertEqual(len(contains), 7)
+        self.assertEqual({product['product_code'] for product in prefix}, {'AB-1'})
+        self.assertIn('internal_final_judgment', prefix[0])
+
+        for params in ({'fields': 'judgment_details'}, {'limit': 0}, {'cursor': 'bogus'}, {'match': 'regex'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class DownsampleTests(TestCase):
+    """长序列按 LTTB 降采样，超规格和失控点总是保留"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_standards_index()
+        self.addCleanup(invalidate_standards_index)
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content', standard_type='internal_control',
+            lower_limit=40.0, upper_limit=60.0
+        )
+        day = datetime.date(2020, 1, 1)
+        values = [50.0 + 3.0 * ((i * 7) % 5 - 2) for i in range(300)]
+        values[123] = 61.0  # 超出规格上限，但在 ±3σ 以内
+        values[200] = None
+        DryFilmProduct.objects.bulk_create([
+            DryFilmProduct(
+                product_code='P1', batch_number=f'B{i:04d}', production_line='L1', inspector='tester',
+                test_date=day + datetime.timedelta(days=i), modified_by='test', solid_content=value
+            )
+            for i, value in enumerate(values)
+        ])
+        self.values = values
+
+    def test_lttb_keeps_endpoints_and_peaks(self):
+        """LTTB 保留首尾两点和明显的峰值"""
+        y = np.zeros(100)
+        y[37] = 10.0
+        indices = lttb_indices(np.arange(100.0), y, 10)
+        self.assertEqual(len(indices), 10)
+        self.assertEqual((indices[0], indices[-1]), (0, 99))
+        self.assertIn(37, indices)
+
+    def test_endpoints_downsample_with_full_statistics(self):
+        """降采样只影响返回的点，统计量与完整数据一致，超规格点被保留"""
+        params = {'product_code': 'P1', 'test_item': 'solid_content'}
+        full = self.client.get('/api/products/dryfilm/chart-data/', params).json()
+        chart = self.client.get('/api/products/dryfilm/chart-data/', {**params, 'max_points': 50}).json()
+
+        self.assertEqual(chart['statistics'], full['statistics'])
+        self.assertLessEqual(len(chart['data']), 51)
+        self.assertEqual(chart['downsample']['total_points'], 300)
+        self.assertIn(123, chart['downsample']['indices'])
+        self.assertEqual(chart['data'], [self.values[i] for i in chart['downsample']['indices']])
+
+        payload = self.client.get('/api/products/dryfilm/spc/', {**params, 'max_points': 50}).json()
+        self.assertEqual(payload['series'], chart)
+        moving_range = payload['moving_range']
+        self.assertEqual(moving_range['labels'], chart['labels'])
+        full_mr = self.client.get('/api/products/dryfilm/moving-range/', params).json()
+        self.assertEqual(moving_range['statistics'], full_mr['statistics'])
+        self.assertEqual(
+            moving_range['moving_ranges'],
+            [full_mr['moving_ranges'][i] for i in moving_range['downsample']['indices']]
+        )
+
+        self.assertNotIn('downsample', self.client.get('/api/products/dryfilm/chart-data/', {**params, 'max_points': 500}).json())
+        response = self.client.get('/api/products/dryfilm/chart-data/', {**params, 'max_points': 2})
+        self.assertEqual(response.status_code, 400)
+
+
+class SubgroupChartTests(TestCase):
+    """X̄-R / X̄-S 控制图：按数量、时间窗口或批号前缀划分子组"""
+
+    def setUp(self):
+        cache.clear()
+        day = datetime.date(2024, 1, 1)
+        rng = np.random.default_rng(7)
+        values = rng.normal(50.0, 1.0, 40)
+        values[35:40] += 3.0  # 最后一个子组均值失控
+        DryFilmProduct.objects.bulk_create([
+            DryFilmProduct(
+                product_code='P1', batch_number=f'L{i // 8}-{i % 8}', production_line='L1', inspector='tester',
+                test_date=day + datetime.timedelta(days=i // 4), modified_by='test', solid_content=float(value)
+            )
+            for i, value in enumerate(values)
+        ])
+        self.values = values
+        self.url = '/api/products/dryfilm/subgroup/'
+        self.params = {'product_code': 'P1', 'test_item': 'solid_content'}
+
+    def test_count_subgroups_match_textbook_limits(self):
+        """容量相同时控制限与 X̿ ± A2·R̄、D3·R̄/D4·R̄ 一致"""
+        data = self.client.get(self.url, {**self.params, 'subgroup_size': 5}).json()
+        groups = self.values.reshape(8, 5)
+        ranges = groups.max(axis=1) - groups.min(axis=1)
+        r_bar = ranges.mean()
+
+        self.assertEqual(data['chart'], 'xbar_r')
+        self.assertEqual(data['sizes'], [5] * 8)
+        np.testing.assert_allclose(data['xbar']['values'], groups.mean(axis=1))
+        np.testing.assert_allclose(data['dispersion']['values'], ranges)
+        np.testing.assert_allclose(data['xbar']['ucl'], groups.mean() + 0.577 * r_bar, rtol=1e-3)
+        np.testing.assert_allclose(data['dispersion']['ucl'], 2.114 * r_bar, rtol=1e-3)
+        self.assertIn(7, data['xbar']['out_of_control'])
+
+    def test_time_window_and_batch_prefix(self):
+        """按周或批号前缀划分子组，子组按时间顺序排列"""
+        data = self.client.get(self.url, {**self.params, 'subgroup_by': 'time', 'window': 'week'}).json()
+        self.assertEqual(data['labels'], ['2024-01-01', '2024-01-08'])
+        self.assertEqual(data['sizes'], [28, 12])
+        self.assertEqual(data['chart'], 'xbar_s')
+
+        data = self.client.get(self.url, {**self.params, 'subgroup_by': 'batch', 'prefix_length': 2, 'chart': 'xbar_s'}).json()
+        self.assertEqual(data['labels'], [f'L{i}' for i in range(5)])
+        np.testing.assert_allclose(
+            data['dispersion']['values'], self.values.reshape(5, 8).std(axis=1, ddof=1)
+        )
+
+        response = self.client.get(self.url, {**self.params, 'subgroup_by': 'time', 'chart': 'xbar_r', 'window': 'month'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CapabilityIntervalTests(TestCase):
+    """Cp/Cpk 置信区间：解析法和 bootstrap 法"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_standards_index()
+        self.addCleanup(invalidate_standards_index)
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content', standard_type='internal_control',
+            lower_limit=45.0, upper_limit=55.0
+        )
+        day = datetime.date(2024, 1, 1)
+        self.values = np.random.default_rng(3).normal(50.5, 1.0, 60)
+        DryFilmProduct.objects.bulk_create([
+            DryFilmProduct(
+                product_code='P1', batch_number=f'B{i:03d}', production_line='L1', inspector='tester',
+                test_date=day + datetime.timedelta(days=i), modified_by='test', solid_content=float(value)
+            )
+            for i, value in enumerate(self.values)
+        ])
+        self.url = '/api/products/dryfilm/capability-analysis/'
+        self.params = {'product_code': 'P1', 'test_item': 'solid_content'}
+
+    def test_analytic_intervals(self):
+        """解析法：Cp 使用卡方区间，Cpk 使用 Bissell 近似"""
+        from scipy import stats
+
+        data = self.client.get(self.url, {**self.params, 'interval': 'analytic'}).json()
+        cp, cpk = data['statistics']['cp'], data['statistics']['cpk']
+        intervals = data['confidence_intervals']
+        n = len(self.values)
+        self.assertAlmostEqual(intervals['cp'][0], cp * np.sqrt(stats.chi2.ppf(0.025, n - 1) / (n - 1)))
+        half_width = 1.959964 * np.sqrt(1 / (9 * n) + cpk ** 2 / (2 * (n - 1)))
+        self.assertAlmostEqual(intervals['cpk'][1], cpk + half_width, places=5)
+        self.assertNotIn('confidence_intervals', self.client.get(self.url, self.params).json())
+
+    def test_bootstrap_intervals(self):
+        """bootstrap 区间包含点估计，结果可重复，超过时间预算时按已完成的重抽样计算"""
+        params = {**self.params, 'interval': 'bootstrap', 'resamples': 500, 'confidence': 0.9}
+        data = self.client.get(self.url, params).json()
+        intervals = data['confidence_intervals']
+        self.assertEqual((intervals['method'], intervals['resamples']), ('bootstrap', 500))
+        self.assertLess(intervals['cp'][0], data['statistics']['cp'])
+        self.assertGreater(intervals['cpk'][1], data['statistics']['cpk'])
+
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, params).json()['confidence_intervals'], intervals)
+
+        partial_result = bootstrap_intervals(np.tile(self.values, 100), 55.0, 45.0, resamples=5000, time_budget=0)
+        self.assertEqual(partial_result['resamples'], BLOCK_ELEMENTS // 6000)
+        self.assertEqual(self.client.get(self.url, {**self.params, 'interval': 'exact'}).status_code, 400)
+
+    def test_truncated_bootstrap_response_is_recomputed(self):
+        """接口返回的截断结果不写入响应缓存、不带 ETag，下次请求重新计算"""
+        params = {**self.params, 'interval': 'bootstrap', 'resamples': 500}
+        truncated = mock.Mock(side_effect=partial(bootstrap_intervals, time_budget=0))
+        with mock.patch('core.capability.BLOCK_ELEMENTS', 600), \
+                mock.patch('core.capability.bootstrap_intervals', truncated):
+            for _ in range(2):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertFalse(response.has_header('ETag'))
+                self.assertLess(response.json()['confidence_intervals']['resamples'], 500)
+        self.assertEqual(truncated.call_count, 2)
+
+        self.assertEqual(self.client.get(self.url, params)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url, params)['X-Cache'], 'HIT')
+
+    def test_bootstrap_without_finite_resamples(self):
+        """所有重抽样的方差都为0时区间为 None，不抛出异常"""
+        result = bootstrap_intervals([50.0, 50.0], 55.0, 45.0, resamples=1)
+        self.assertEqual((result['cp'], result['cpk'], result['resamples']), ([None, None], [None, None], 1))
+
+    def test_truncated_bootstrap_is_not_cached(self):
+        """超过时间预算而截断的 bootstrap 结果不缓存，完整的结果缓存"""
+        values = np.tile(self.values, 100)
+        truncated = mock.Mock(side_effect=partial(bootstrap_intervals, time_budget=0))
+        with mock.patch('core.capability.bootstrap_intervals', truncated):
+            for _ in range(2):
+                result = cached_capability_intervals(
+                    'truncated', ['P1'], values, 55.0, 45.0, 1.5, 1.3, method='bootstrap', resamples=5000
+                )
+                self.assertLess(result['resamples'], 5000)
+        self.assertEqual(truncated.call_count, 2)
+
+        complete = mock.Mock(side_effect=bootstrap_intervals)
+        with mock.patch('core.capability.bootstrap_intervals', complete):
+            for _ in range(2):
+                cached_capability_intervals('complete', ['P1'], self.values, 55.0, 45.0, 1.5, 1.3, method='bootstrap', resamples=200)
+        self.assertEqual(complete.call_count, 1)
+
+
+class CapabilityMatrixTests(TestCase):
+    """能力矩阵一次计算全部牌号 × 检测项目，结果与单项能力分析一致"""
+
+    def setUp(self):
+        cache.clear()
+        invalidate_standards_index()
+        self.addCleanup(invalidate_standards_index)
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content', standard_type='internal_control',
+            lower_limit=45.0, upper_limit=55.0
+        )
+        ProductStandard.objects.create(
+            product_code='P2', test_item='solid_content', standard_type='internal_control',
+            upper_limit=50.0
+        )
+        day = datetime.date(2024, 1, 1)
+        rng = np.random.default_rng(11)
+        products = []
+        for code, mean in (('P1', 50.0), ('P2', 49.0)):
+            for i, value in enumerate(rng.normal(mean, 1.5, 30)):
+                products.append(DryFilmProduct(
+                    product_code=code, batch_number=f'{code}-{i:03d}', production_line='L1', inspector='tester',
+                    test_date=day + datetime.timedelta(days=i), modified_by='test',
+                    solid_content=float(value), viscosity=float(value) * 10 if code == 'P1' else None,
+                ))
+        DryFilmProduct.objects.bulk_create(products)
+        self.url = '/api/products/dryfilm/capability-matrix/'
+
+    def test_matrix_matches_capability_analysis(self):
+        """矩阵中的统计量和 Cp/Cpk 与单项能力分析接口一致，只有单侧规格时只计算超规格率"""
+        with self.assertNumQueries(2):
+            # 标准索引加载和一次取数（依赖整个范围的 ETag 由版本号生成，不查询）
+            data = self.client.get(self.url).json()
+        rows = {(row['product_code'], row['test_item']): row for row in data['rows']}
+        self.assertEqual(set(rows), {('P1', 'solid_content'), ('P1', 'viscosity'), ('P2', 'solid_content')})
+
+        single = self.client.get('/api/products/dryfilm/capability-analysis/', {
+            'product_code': 'P1', 'test_item': 'solid_content'
+        }).json()['statistics']
+        row = rows[('P1', 'solid_content')]
+        self.assertEqual(row['n'], single['sample_size'])
+        for field, expected in (('mean', 'mean'), ('std_dev', 'std_dev'), ('cp', 'cp'), ('cpk', 'cpk')):
+            self.assertAlmostEqual(row[field], single[expected])
+
+        values = DryFilmProduct.objects.filter(product_code='P2').values_list('solid_content', flat=True)
+        self.assertIsNone(rows[('P2', 'solid_content')]['cp'])
+        self.assertAlmostEqual(
+            rows[('P2', 'solid_content')]['out_of_spec_rate'], sum(value > 50.0 for value in values) / 30
+        )
+        self.assertIsNone(rows[('P1', 'viscosity')]['out_of_spec_rate'])
+
+    def test_zero_lower_limit_matches_capability_analysis(self):
+        """规格下限为0时矩阵和单项能力分析都按双侧规格计算 Cp/Cpk"""
+        ProductStandard.objects.create(
+            product_code='P1', test_item='viscosity', standard_type='internal_control',
+            lower_limit=0.0, upper_limit=1000.0
+        )
+        invalidate_standards_index()
+        row = next(
+            row for row in self.client.get(self.url).json()['rows']
+            if (row['product_code'], row['test_item']) == ('P1', 'viscosity')
+        )
+        single = self.client.get('/api/products/dryfilm/capability-analysis/', {
+            'product_code': 'P1', 'test_item': 'viscosity'
+        }).json()['statistics']
+        self.assertEqual(row['lsl'], 0.0)
+        self.assertIsNotNone(single['cp'])
+        self.assertAlmostEqual(row['cp'], single['cp'])
+        self.assertAlmostEqual(row['cpk'], single['cpk'])
+
+    def test_sorting_and_xlsx_export(self):
+        """按 Cpk 降序排序时没有 Cpk 的行排在最后，xlsx 导出相同的行"""
+        data = self.client.get(self.url, {'sort': 'cpk', 'order': 'desc'}).json()
+        self.assertEqual(data['rows'][0]['product_code'], 'P1')
+        self.assertIsNone(data['rows'][-1]['cpk'])
+        self.assertEqual(self.client.get(self.url, {'sort': 'batch'}).status_code, 400)
+
+        response = self.client.get(self.url, {'sort': 'cpk', 'order': 'desc', 'format': 'xlsx'})
+        self.assertIn('attachment', response['Content-Disposition'])
+        worksheet = openpyxl.load_workbook(io.BytesIO(response.content)).active
+        sheet_rows = list(worksheet.iter_rows(values_only=True))
+        self.assertEqual(sheet_rows[0][:2], ('牌号', '检测项目'))
+        self.assertEqual([row[:2] for row in sheet_rows[1:]],
+                         [(row['product_code'], row['test_item']) for row in data['rows']])
+
+
+class ConditionalGetTests(TestCase):
+    """读取接口返回 ETag/Last-Modified，数据未变化时返回304"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = DryFilmProduct.objects.create(
+            product_code='P1', batch_number='20240101-A', production_line='L1', inspector='tester',
+            test_date=datetime.date(2024, 1, 1), modified_by='test', solid_content=50.0
+        )
+        self.url = '/api/products/dryfilm/chart-data/'
+        self.params = {'product_code': 'P1', 'test_item': 'solid_content'}
+
+    def test_not_modified_until_data_changes(self):
+        """未变化时只执行一次聚合查询并返回空的304；记录修改或批量重新判定后ETag变化"""
+        response = self.client.get(self.url, self.params)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        other = self.client.get(self.url, self.params, HTTP_ACCEPT=MSGPACK_TYPE)
+        self.assertNotEqual(other['ETag'], etag)
+
+        self.product.solid_content = 51.0
+        self.product.save()
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # 批量重新判定不更新 updated_at，依靠缓存版本号使 ETag 变化
+        ProductStandard.objects.bulk_create([ProductStandard(
+            product_code='P1', test_item='solid_content', standard_type='internal_control',
+            lower_limit=40.0, upper_limit=45.0
+        )])
+        invalidate_standards_index()
+        self.addCleanup(invalidate_standards_index)
+        rejudge_queryset('dryfilm')
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_whole_scope_etag_from_versions(self):
+        """依赖整个范围的请求不扫描记录，ETag 由范围版本号生成，任一牌号写入后变化"""
+        url = '/api/products/dryfilm/capability-matrix/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        DryFilmProduct.objects.create(
+            product_code='P2', batch_number='20240101-B', production_line='L1', inspector='tester',
+            test_date=datetime.date(2024, 1, 1), modified_by='test', solid_content=50.0
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.client.get(self.url, {**self.params, 'product_code': '', 'start_date': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_gzip_and_invalid_parameters(self):
+        """响应按 Accept-Encoding 压缩；参数无效时不生成ETag，仍返回400"""
+        DryFilmProduct.objects.bulk_create([
+            DryFilmProduct(
+                product_code='P1', batch_number=f'20240102-{i:02d}', production_line='L1', inspector='tester',
+                test_date=datetime.date(2024, 1, 2), modified_by='test', solid_content=50.0 + i
+            )
+            for i in range(1, 40)
+        ])
+        response = self.client.get('/api/products/dryfilm/search/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        response = self.client.get(self.url, {**self.params, 'start_date': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class SpcCacheTests(TestCase):
+    """SPC 接口结果缓存按牌号精确失效"""
+
+    def setUp(self):
+        cache.clear()
+        for code in ('P1', 'P2'):
+            DryFilmProduct.objects.create(
+                product_code=code, batch_number=f'20240101-{code}', production_line='L1', inspector='tester',
+                test_date=datetime.date(2024, 1, 1), modified_by='test', solid_content=50.0
+            )
+
+    def get(self, product_code):
+        return self.client.get('/api/products/dryfilm/chart-data/', {'product_code': product_code, 'test_item': 'solid_content'})
+
+    def test_cached_until_product_or_standard_changes(self):
+        """命中缓存后，只有相关牌号的产品或标准变更才使缓存失效"""
+        self.assertEqual(self.get('P1')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('P2')['X-Cache'], 'MISS')
+        # 命中缓存时只执行生成 ETag 的聚合查询
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get('P1')['X-Cache'], 'HIT')
+
+        product = DryFilmProduct.objects.get(product_code='P1')
+        product.solid_content = 60.0
+        product.save()
+        response = self.get('P1')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['data'], [60.0])
+        self.assertEqual(self.get('P2')['X-Cache'], 'HIT')
+
+        ProductStandard.objects.create(
+            product_code='P2', test_item='solid_content', standard_type='internal_control',
+            lower_limit=40.0, upper_limit=60.0, modified_by='test'
+        )
+        self.assertEqual(self.get('P2')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('P1')['X-Cache'], 'HIT')
+
+        stats = self.client.get('/core/api/cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 4))
+
+    def test_bulk_ingest_invalidates_cache(self):
+        """批量导入绕过模型信号，同样使相关牌号的缓存失效"""
+        self.get('P1')
+        body = json.dumps({
+            'product_code': 'P1', 'batch_number': '20240101-P1', 'production_line': 'L1',
+            'inspector': 'tester', 'test_date': '2024-01-01', 'sample_category': '单批样', 'solid_content': 55.0,
+        })
+        login_importer(self.client)
+        response = self.client.post('/core/api/ingest/dryfilm/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.json()['summary']['updated'], 1)
+        self.assertEqual(self.get('P1').json()['data'], [55.0])
+
+
+class DailyRollupTests(TestCase):
+    """每日汇总随记录保存、删除和批量导入增量维护，并与重建结果一致"""
+
+    def make_product(self, batch_number, test_date, solid_content, **values):
+        return DryFilmProduct.objects.create(
+            product_code='P1', batch_number=batch_number, production_line='L1', inspector='tester',
+            test_date=test_date, modified_by='test', solid_content=solid_content, **values
+        )
+
+    def rollup_rows(self):
+        return sorted(DailyRollup.objects.values_list(
+            'family', 'code', 'line', 'test_item', 'day', 'count', 'total', 'total_sq',
+            'min_value', 'max_value', 'pass_count', 'fail_count', 'pending_count',
+        ))
+
+    def assert_matches_rebuild(self):
+        incremental = self.rollup_rows()
+        call_command('rebuild_rollups', stdout=io.StringIO())
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_save_edit_and_delete_update_rollups(self):
+        """新增、修改日期和删除记录后，修改前后所在的分组都被重新计算"""
+        jan = datetime.date(2024, 1, 5)
+        feb = datetime.date(2024, 2, 5)
+        self.make_product('B1', jan, 50.0)
+        moved = self.make_product('B2', jan, 54.0)
+
+        item = DailyRollup.objects.get(family='dryfilm', test_item='solid_content', day=jan)
+        self.assertEqual((item.count, item.total, item.min_value, item.max_value), (2, 104.0, 50.0, 54.0))
+
+        moved.test_date = feb
+        moved.save()
+        item = DailyRollup.objects.get(family='dryfilm', test_item='solid_content', day=jan)
+        self.assertEqual((item.count, item.total), (1, 50.0))
+        self.assertEqual(DailyRollup.objects.get(test_item='solid_content', day=feb).total, 54.0)
+        self.assert_matches_rebuild()
+
+        moved.delete()
+        self.assertFalse(DailyRollup.objects.filter(day=feb).exists())
+        self.assert_matches_rebuild()
+
+    def test_bulk_ingest_and_rejudge_update_rollups(self):
+        """批量导入和批量重新判定绕过模型信号，同样更新汇总"""
+        ProductStandard.objects.create(
+            product_code='P1', test_item='solid_content', standard_type='internal_control',
+            lower_limit=40.0, upper_limit=60.0
+        )
+        invalidate_standards_index()
+        self.addCleanup(invalidate_standards_index)
+        body = '\n'.join(json.dumps({
+            'product_code': 'P1', 'batch_number': batch, 'production_line': 'L1', 'inspector': 't',
+            'test_date': '2024-03-01', 'sample_category': '单批样', 'solid_content': value,
+        }) for batch, value in [('B1', 50), ('B2', 70)])
+        login_importer(self.client)
+        self.client.post('/core/api/ingest/dryfilm/', body, content_type='application/x-ndjson')
+
+        record = DailyRollup.objects.get(test_item=rollup.RECORD_ITEM)
+        self.assertEqual((record.count, record.pass_count, record.fail_count), (2, 1, 1))
+        self.assert_matches_rebuild()
+
+        ProductStandard.objects.filter(product_code='P1').update(upper_limit=80.0)
+        invalidate_standards_index()
+        rejudge_queryset('dryfilm')
+        record = DailyRollup.objects.get(test_item=rollup.RECORD_ITEM)
+        self.assertEqual((record.pass_count, record.fail_count), (2, 0))
+        self.assert_matches_rebuild()
+
+    def test_refresh_upserts_existing_rollups(self):
+        """重算已有汇总行的分组时按唯一键更新，清空检测值后删除该检测项目的汇总行"""
+        day = datetime.date(2024, 1, 5)
+        product = self.make_product('B1', day, 50.0, viscosity=1200.0)
+        DryFilmProduct.objects.filter(pk=product.pk).update(solid_content=52.0, viscosity=None)
+
+        bucket = rollup.bucket_of('dryfilm', product)
+        rollup.refresh_buckets('dryfilm', [bucket, bucket])
+        rollup.refresh_buckets('dryfilm', [bucket])
+        item = DailyRollup.objects.get(family='dryfilm', test_item='solid_content', day=day)
+        self.assertEqual((item.count, item.total), (1, 52.0))
+        self.assertFalse(DailyRollup.objects.filter(test_item='viscosity').exists())
+        self.assert_matches_rebuild()
+
+    def test_migration_backfills_existing_records(self):
+        """升级时的数据迁移按已有记录（历史模型）回填汇总表，结果与重建一致"""
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+
+        loader = MigrationLoader(connection)
+        key = ('dashboard', '0002_backfill_daily_rollups')
+        backfill = loader.get_migration(*key).operations[0].code
+        apps = loader.project_state(key).apps
+        DryFilmProduct.objects.bulk_create([
+            DryFilmProduct(
+                product_code='P1', batch_number=f'B{i}', production_line='L1', inspector='tester',
+                test_date=datetime.date(2024, 1, 1 + i), modified_by='test', solid_content=50.0 + i
+            )
+            for i in range(3)
+        ])
+        self.assertFalse(DailyRollup.objects.exists())
+
+        backfill(apps, None)
+        self.assertEqual(DailyRollup.objects.filter(test_item=rollup.RECORD_ITEM).count(), 3)
+        self.assert_matches_rebuild()
+
+    def test_trend_endpoint_buckets_by_month(self):
+        """趋势接口按月合并每日汇总，均值和标准差与原始数据一致"""
+        for day, value in [(1, 50.0), (20, 54.0)]:
+            self.make_product(f'J{day}', datetime.date(2024, 1, day), value)
+        self.make_product('F1', datetime.date(2024, 2, 1), 60.0)
+
+        response = self.client.get('/core/api/trend/dryfilm/', {'test_item': 'solid_content', 'bucket': 'month'})
+        series = response.json()['series']
+        self.assertEqual([row['period'] for row in series], ['2024-01', '2024-02'])
+        self.assertEqual(series[0]['count'], 2)
+        self.assertAlmostEqual(series[0]['mean'], 52.0)
+        self.assertAlmostEqual(series[0]['std_dev'], 2.0)
+        self.assertEqual((series[1]['min'], series[1]['max']), (60.0, 60.0))
+
+        response = self.client.get('/core/api/trend/dryfilm/', {'test_item': 'appearance'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportTimeTests(TestCase):
+    """进程启动（加载全部应用、管理界面和 URL 配置）不导入 SciPy 和 openpyxl"""
+
+    HEAVY_MODULES = ('scipy', 'openpyxl')
+    # 设置环境变量 QC_IMPORT_TIME_BUDGET（秒）时另外检查启动导入时间：目前约0.5秒，启动时加载 SciPy 时约1.7秒；
+    # 耗时受机器负载影响，默认不检查
+    BUDGET_ENV = 'QC_IMPORT_TIME_BUDGET'
+
+    def test_startup_skips_heavy_modules(self):
+        budget = os.environ.get(self.BUDGET_ENV)
+        script = (
+            'import sys, django; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            f'print(",".join(name for name in {self.HEAVY_MODULES!r} if name in sys.modules))'
+        )
+        options = ['-X', 'importtime'] if budget else []
+        result = subprocess.run(
+            [sys.executable, *options, '-c', script],
+            capture_output=True, text=True, cwd=settings.BASE_DIR, env=os.environ.copy(), timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertEqual(result.stdout.strip(), '')
+        if not budget:
+            return
+
+        # 只累加顶层导入的累计时间（微秒），嵌套导入已包含在其中
+        total = 0
+        for line in result.stderr.splitlines():
+            parts = line.split('|')
+            if line.startswith('import time:') and parts[1].strip().isdigit() and not parts[2][1:].startswith(' '):
+                total += int(parts[1])
+        self.assertLess(total / 1e6, float(budget))
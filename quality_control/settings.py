@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
     'static_files_middleware.FaviconMiddleware',   # Custom favicon handling
     'static_files_middleware.StaticFileOptimizationMiddleware',  # Static file optimization
+    'django.middleware.gzip.GZipMiddleware',  # Compress API and page responses (static files are served above)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +95,23 @@ DATABASES = {
     }
 }
 
+# 缓存
+# 本地内存缓存只在单个进程内有效；多进程部署或需要管理命令的写入即时生效时，
+# 改用 FileBasedCache（LOCATION 指向共享目录）或其他共享缓存后端
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quality-control',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    }
+}
+
+# SPC 接口结果缓存使用的缓存别名和过期时间（秒）
+SPC_CACHE_ALIAS = 'default'
+SPC_CACHE_TIMEOUT = 300
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -181,3 +199,9 @@ REPORT_VERSIONS = {
 
 # 默认版本（向后兼容）
 REPORT_VERSION = 'QR/AJF-QA-006-1 版次A/4'
+
+# 标准变更后的增量重新判定
+# 关闭异步时在保存标准的请求中同步执行
+REJUDGE_ASYNC = True
+# 同一牌号/原料在该时间窗口（秒）内的多次修改合并为一次判定
+REJUDGE_COALESCE_SECONDS = 2.0
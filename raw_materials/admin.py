@@ -5,12 +5,32 @@ from django import forms
 from django.urls import path, reverse
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponseRedirect
+from core.audit import JudgmentAuditMixin
+from core.importing import ImportMeasurementsMixin
+from core.schema import get_family
 from core.utils import export_data
 from .models import RawMaterial, RawMaterialHistory, RawMaterialStandard, RawMaterialStandardHistory
 
 
+# 原料导出的字段和表头，检测项目取自检测项目注册表
+RAW_MATERIAL_EXPORT_COLUMNS = get_family('raw_material').export_columns(
+    [
+        ('material_name', '原料名称'), ('material_batch', '原料批号'), ('supplier', '供应商'),
+        ('distributor', '经销商'), ('inspector', '检测人'), ('test_date', '测试日期'),
+        ('sample_category', '样品类别'), ('acceptance_form', '验收单号'),
+        ('logistics_form', '物流单号'), ('coa_number', 'COA编号'),
+    ],
+    [
+        ('final_judgment', '最终判定'), ('judgment_status', '判定状态'), ('remarks', '备注'),
+        ('created_at', '创建时间'), ('updated_at', '更新时间'),
+    ],
+)
+
+
 @admin.register(RawMaterial)
-class RawMaterialAdmin(admin.ModelAdmin):
+class RawMaterialAdmin(ImportMeasurementsMixin, JudgmentAuditMixin, admin.ModelAdmin):
+    import_product_type = 'raw_material'
+    audit_product_type = 'raw_material'
     list_display = [
         'material_name', 'material_batch', 'supplier', 'inspector', 
         'test_date', 'final_judgment', 'judgment_status'
@@ -107,22 +127,7 @@ class RawMaterialAdmin(admin.ModelAdmin):
             material_info += f"COA编号: {obj.coa_number}\n"
         
         # 原料质量数据（不为空的内容）
-        data_fields = [
-            ('appearance', '外观'),
-            ('purity', '纯度'),
-            ('peak_position', '出峰位置'),
-            ('inhibitor_content', '阻聚剂含量'),
-            ('moisture_content', '水分含量'),
-            ('color', '色度'),
-            ('ethanol_content', '乙醇含量'),
-            ('acidity', '酸度')
-        ]
-        
-        data_lines = []
-        for field_name, field_label in data_fields:
-            value = getattr(obj, field_name)
-            if value is not None and value != "":
-                data_lines.append(f"{field_label}: {value}")
+        data_lines = get_family('raw_material').filled_lines(obj)
         
         if data_lines:
             material_info += "\n质量数据:\n" + "\n".join(data_lines)
@@ -186,44 +191,14 @@ class RawMaterialAdmin(admin.ModelAdmin):
 
     def export_raw_materials_csv(self, request, queryset):
         """导出原料数据到CSV格式"""
-        fields = [
-            'material_name', 'material_batch', 'supplier', 'distributor', 
-            'inspector', 'test_date', 'sample_category', 'acceptance_form',
-            'logistics_form', 'coa_number', 'appearance', 'purity', 
-            'peak_position', 'inhibitor_content', 'moisture_content', 
-            'color', 'ethanol_content', 'acidity', 'final_judgment', 
-            'judgment_status', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '原料名称', '原料批号', '供应商', '经销商', 
-            '检测人', '测试日期', '样品类别', '验收单号',
-            '物流单号', 'COA编号', '外观', '纯度', 
-            '出峰位置', '阻聚剂含量', '水分含量', 
-            '色度', '乙醇含量', '酸度', '最终判定', 
-            '判定状态', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = RAW_MATERIAL_EXPORT_COLUMNS
         return export_data(request, queryset, 'RawMaterial', fields, 'csv', field_names)
     
     export_raw_materials_csv.short_description = "导出选定原料记录 (CSV)"
 
     def export_raw_materials_excel(self, request, queryset):
         """导出原料数据到Excel格式"""
-        fields = [
-            'material_name', 'material_batch', 'supplier', 'distributor', 
-            'inspector', 'test_date', 'sample_category', 'acceptance_form',
-            'logistics_form', 'coa_number', 'appearance', 'purity', 
-            'peak_position', 'inhibitor_content', 'moisture_content', 
-            'color', 'ethanol_content', 'acidity', 'final_judgment', 
-            'judgment_status', 'remarks', 'created_at', 'updated_at'
-        ]
-        field_names = [
-            '原料名称', '原料批号', '供应商', '经销商', 
-            '检测人', '测试日期', '样品类别', '验收单号',
-            '物流单号', 'COA编号', '外观', '纯度', 
-            '出峰位置', '阻聚剂含量', '水分含量', 
-            '色度', '乙醇含量', '酸度', '最终判定', 
-            '判定状态', '备注', '创建时间', '更新时间'
-        ]
+        fields, field_names = RAW_MATERIAL_EXPORT_COLUMNS
         return export_data(request, queryset, 'RawMaterial', fields, 'excel', field_names)
     
     export_raw_materials_excel.short_description = "导出选定原料记录 (Excel)"
@@ -233,43 +208,11 @@ class RawMaterialAdmin(admin.ModelAdmin):
         if change:  # 如果是修改操作
             obj.modified_by = request.user.username
             
-            # 获取原始对象和当前表单数据的差异
-            original_obj = self.model.objects.get(pk=obj.pk)
-            changed_fields = []
-            modified_data = {}
-            
-            # 检查哪些字段被修改了
-            for field in obj._meta.fields:
-                field_name = field.name
-                if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                    original_value = getattr(original_obj, field_name)
-                    new_value = getattr(obj, field_name)
-                    
-                    if original_value != new_value:
-                        # 格式化字段显示名称
-                        field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                        changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                        modified_data[field_name] = {
-                            'old': original_value,
-                            'new': new_value
-                        }
-            
-            # 生成自动修改描述
-            if changed_fields:
-                obj.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-            else:
-                obj.modification_reason = "通过管理界面修改（无数据变更）"
-            
-            # 创建历史记录（每次修改都创建，无论是否有修改原因）
-            RawMaterialHistory.objects.create(
-                raw_material=obj,
-                modified_by=request.user.username,
-                modification_reason=obj.modification_reason,
-                modified_data=modified_data
-            )
+            # 与加载时记录的原值比较，每次修改都创建历史记录
+            obj.modification_reason = ''
+            obj.record_history(RawMaterialHistory, 'raw_material', empty_reason="通过管理界面修改（无数据变更）")
         
-        # 自动计算判定结果
-        obj.calculate_judgment()
+        # 保存时模型会自动计算判定结果
         super().save_model(request, obj, form, change)
     
     def response_add(self, request, obj, post_url_continue=None):
@@ -392,42 +335,18 @@ class RawMaterialStandardAdmin(admin.ModelAdmin):
         if change:  # 如果是修改操作
             obj.modified_by = request.user.username if hasattr(request, 'user') and hasattr(request.user, 'username') else 'system'
             
-            # 获取原始对象和当前表单数据的差异
-            original_obj = self.model.objects.get(pk=obj.pk)
-            changed_fields = []
-            modified_data = {}
-            
-            # 检查哪些字段被修改了
-            for field in obj._meta.fields:
-                field_name = field.name
-                if field_name not in ['created_at', 'updated_at', 'modified_by', 'modification_reason']:
-                    original_value = getattr(original_obj, field_name)
-                    new_value = getattr(obj, field_name)
-                    
-                    if original_value != new_value:
-                        # 格式化字段显示名称
-                        field_verbose = field.verbose_name if hasattr(field, 'verbose_name') else field_name
-                        changed_fields.append(f"{field_verbose}: {original_value} → {new_value}")
-                        modified_data[field_name] = {
-                            'old': original_value,
-                            'new': new_value
-                        }
-            
-            # 生成自动修改描述
-            if changed_fields:
-                obj.modification_reason = f"自动检测到修改：{'; '.join(changed_fields)}"
-            else:
-                obj.modification_reason = "通过管理界面修改（无数据变更）"
-            
-            # 创建历史记录（每次修改都创建，无论是否有修改原因）
-            RawMaterialStandardHistory.objects.create(
-                raw_material_standard=obj,
-                modified_by=request.user.username if hasattr(request, 'user') and hasattr(request.user, 'username') else 'system',
-                modification_reason=obj.modification_reason,
-                modified_data=modified_data
-            )
+            # 与加载时记录的原值比较，每次修改都创建历史记录
+            obj.modification_reason = ''
+            obj.record_history(RawMaterialStandardHistory, 'raw_material_standard', empty_reason="通过管理界面修改（无数据变更）")
         
         super().save_model(request, obj, form, change)
+        
+        # 标准保存后由信号安排后台重新判定该原料的记录
+        self.message_user(
+            request,
+            f'已安排重新判定原料 {obj.material_name} 的记录，可在 /core/api/rejudge-status/ 查看进度',
+            messages.INFO
+        )
     
     def get_urls(self):
         from django.urls import path
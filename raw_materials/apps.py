@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RawMaterialsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'raw_materials'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,202 @@
+"""原料图表分析 - 一次查询取出全部数值检测项目，从同一个二维数组计算各部分
+
+时间趋势、子组控制图、分布直方图和相关性矩阵都使用同一个 (样本数, 检测项目数) 的
+浮点数组，缺失值为 NaN，不再对查询集重复迭代和逐条 getattr。
+对比分析按原料或供应商分组，各分组的统计量和过程能力指数由 grouped_statistics 一次算出。
+"""
+
+import numpy as np
+
+from core.schema import get_family
+from core.subgroup import build_subgroup_payload
+from core.utils import grouped_statistics, pairwise_pearson
+from .standards import RawMaterialStandardMatrix
+
+HISTOGRAM_BINS = 10
+
+# 对比分析的分组方式 -> 分组字段
+COMPARISON_GROUPS = {
+    'material': 'material_name',
+    'supplier': 'supplier',
+}
+
+
+def _nullable(value):
+    return None if value != value else float(value)
+
+
+def build_chart_payload(queryset, test_item, subgroup_options=None):
+    """计算原料图表分析数据，参数无效时抛出 ValueError
+
+    quality_control 为 X̄-R/X̄-S 控制图，subgroup_options 为 subgroup.parse_subgroup_options
+    解析的子组划分方式，默认按时间顺序每5个检测值一个子组；有效检测值少于2个时为None，
+    没有容量不小于2的子组时也为None，原因见 quality_control_error。
+    """
+    schema = get_family('raw_material')
+    item = schema.numeric(test_item)
+    if item is None:
+        raise ValueError(f'无效的检测项目: {test_item}')
+
+    columns = schema.numeric_columns
+    rows = list(
+        queryset.order_by('test_date')
+        .values_list('test_date', 'material_batch', 'judgment_status', *columns)
+    )
+    matrix = np.array([row[3:] for row in rows], dtype=float).reshape(len(rows), len(columns))
+    present = ~np.isnan(matrix)
+    position = columns.index(item.column)
+    selected = present[:, position]
+    values = matrix[selected, position]
+
+    time_series = [
+        {
+            'date': rows[index][0].isoformat(),
+            'value': float(matrix[index, position]),
+            'batch': rows[index][1],
+            'status': rows[index][2],
+        }
+        for index in np.flatnonzero(selected).tolist()
+    ]
+
+    quality_control = None
+    quality_control_error = None
+    if values.size >= 2:
+        try:
+            quality_control = build_subgroup_payload(
+                matrix[:, position], [row[0] for row in rows], [row[1] for row in rows], **(subgroup_options or {})
+            )
+        except ValueError as e:
+            # 子组划分后没有可用的子组（例如按天划分且每天只有一个样本）时只省略控制图
+            quality_control_error = str(e)
+
+    distribution = []
+    if values.size:
+        hist, bin_edges = np.histogram(values, bins=HISTOGRAM_BINS)
+        distribution = [
+            {'bin_start': start, 'bin_end': end, 'count': count}
+            for start, end, count in zip(bin_edges[:-1].tolist(), bin_edges[1:].tolist(), hist.tolist())
+        ]
+
+    r, p, n = pairwise_pearson(matrix)
+    correlation = {}
+    for other, column in enumerate(columns):
+        if other != position and n[position, other] >= 2:
+            correlation[column] = {
+                'correlation': _nullable(r[position, other]),
+                'p_value': _nullable(p[position, other]),
+                'sample_size': int(n[position, other]),
+            }
+
+    return {
+        'time_series': time_series,
+        'quality_control': quality_control,
+        'quality_control_error': quality_control_error,
+        'distribution': distribution,
+        'correlation': correlation,
+        'correlation_matrix': {
+            'fields': columns,
+            'correlation': r,
+            'p_value': p,
+            'sample_size': n,
+        },
+    }
+
+
+def _capability_limits(matrices, test_item, material_names, suppliers):
+    """各分组适用标准的上下限，分组内原料不唯一或没有双侧标准时为 NaN"""
+    usl = np.full(len(material_names), np.nan)
+    lsl = np.full(len(material_names), np.nan)
+    types = [None] * len(material_names)
+    for index, (material_name, supplier) in enumerate(zip(material_names, suppliers)):
+        if material_name is None:
+            continue
+        for standard in matrices[material_name].resolve(test_item, supplier):
+            if standard.lower_limit is not None and standard.upper_limit is not None:
+                usl[index], lsl[index] = standard.upper_limit, standard.lower_limit
+                types[index] = standard.standard_type
+                break
+    return usl, lsl, types
+
+
+def _single_value(column, order, starts, counts):
+    """各分组内某列的取值，分组内取值不唯一时为None"""
+    ordered = column[order]
+    first = ordered[starts]
+    same = np.logical_and.reduceat(ordered == np.repeat(first, counts), starts)
+    return [value if unique else None for value, unique in zip(first.tolist(), same.tolist())]
+
+
+def build_comparison_payload(queryset, test_item, group_by='material'):
+    """按原料或供应商分组的对比分析数据，参数无效时抛出 ValueError
+
+    返回 {'comparison_data': {分组: {'material_name', 'supplier', 'data', 'stats'}},
+    'process_capability': {分组: {...}}}；分组内只有一种原料（按供应商分组时还要求只有一个供应商）
+    且该原料有双侧标准时计算 Cp/Cpk，标准按供应商专用优先、通用其次解析。
+    """
+    item = get_family('raw_material').numeric(test_item)
+    if item is None:
+        raise ValueError(f'无效的检测项目: {test_item}')
+    group_field = COMPARISON_GROUPS.get(group_by)
+    if group_field is None:
+        raise ValueError(f'无效的分组方式: {group_by}')
+
+    # 数据库只返回有检测值的行，并已按分组和日期排序
+    rows = list(
+        queryset.filter(**{f'{item.column}__isnull': False})
+        .order_by(group_field, 'test_date', 'pk')
+        .values_list(group_field, 'material_name', 'supplier', 'test_date', 'material_batch',
+                     'judgment_status', item.column)
+    )
+    if not rows:
+        return {'comparison_data': {}, 'process_capability': {}}
+
+    keys = np.array([row[0] for row in rows], dtype=str)
+    values = np.array([row[6] for row in rows], dtype=float)
+    group_keys, statistics = grouped_statistics(keys, values)
+    counts = statistics['count']
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    order = np.argsort(keys, kind='stable')
+
+    material_names = _single_value(np.array([row[1] for row in rows], dtype=object), order, starts, counts)
+    suppliers = _single_value(np.array([row[2] for row in rows], dtype=object), order, starts, counts)
+
+    # 一次查询加载所有分组涉及原料的标准
+    matrices = RawMaterialStandardMatrix.load_many(name for name in material_names if name is not None)
+    usl, lsl, standard_types = _capability_limits(matrices, test_item, material_names, suppliers)
+    mean, std = statistics['mean'], statistics['std']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cp = (usl - lsl) / (6 * std)
+        cpu = (usl - mean) / (3 * std)
+        cpl = (mean - lsl) / (3 * std)
+    cpk = np.minimum(cpu, cpl)
+
+    comparison_data = {}
+    for key, material_name, supplier in zip(group_keys.tolist(), material_names, suppliers):
+        comparison_data[key] = {'material_name': material_name, 'supplier': supplier, 'data': [], 'stats': {}}
+    for key, _, _, test_date, batch, status, value in rows:
+        comparison_data[key]['data'].append({
+            'date': test_date.isoformat(),
+            'value': value,
+            'batch': batch,
+            'status': status,
+        })
+
+    process_capability = {}
+    for index, key in enumerate(group_keys.tolist()):
+        comparison_data[key]['stats'] = {
+            name: int(column[index]) if name == 'count' else float(column[index])
+            for name, column in statistics.items()
+        }
+        if np.isfinite(cp[index]):
+            process_capability[key] = {
+                'cp': float(cp[index]),
+                'cpk': float(cpk[index]),
+                'cpu': float(cpu[index]),
+                'cpl': float(cpl[index]),
+                'usl': float(usl[index]),
+                'lsl': float(lsl[index]),
+                'mean': float(mean[index]),
+                'std': float(std[index]),
+                'standard_type': standard_types[index],
+            }
+    return {'comparison_data': comparison_data, 'process_capability': process_capability}
@@ -0,0 +1,75 @@
+"""原料批量重新判定 - 在内存中计算判定结果，只写回有变化的记录"""
+
+import time
+
+from django.db import transaction
+
+from core import rollup
+from core.cache import invalidate
+from .models import RawMaterial
+from .standards import RawMaterialStandardMatrix
+
+JUDGMENT_FIELDS = ['final_judgment', 'judgment_status', 'judgment_details']
+
+
+def rejudge_queryset(queryset=None, chunk_size=500, dry_run=False, progress=None):
+    """按主键分块重新判定原料记录
+
+    progress 为可选回调，每处理完一块调用一次 progress(processed, total, updated, elapsed)。
+    """
+    queryset = RawMaterial.objects.all() if queryset is None else queryset
+    total = queryset.count()
+    # 标准矩阵在整个运行过程中按原料名称复用
+    matrices = {}
+    processed = updated = 0
+    last_pk = None
+    start_time = time.time()
+
+    while True:
+        chunk_qs = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+        materials = list(chunk_qs[:chunk_size])
+        if not materials:
+            break
+
+        missing = {material.material_name for material in materials} - matrices.keys()
+        if missing:
+            matrices.update(RawMaterialStandardMatrix.load_many(missing))
+
+        changed = []
+        for material in materials:
+            stored = [getattr(material, field) for field in JUDGMENT_FIELDS]
+            material.calculate_judgment(matrices[material.material_name])
+            if stored != [getattr(material, field) for field in JUDGMENT_FIELDS]:
+                changed.append(material)
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                RawMaterial.objects.bulk_update(changed, JUDGMENT_FIELDS, batch_size=chunk_size)
+                invalidate('raw_material', {material.material_name for material in changed})
+                rollup.refresh_buckets('raw_material', [rollup.bucket_of('raw_material', material) for material in changed])
+
+        processed += len(materials)
+        updated += len(changed)
+        last_pk = materials[-1].pk
+
+        if progress:
+            progress(processed, total, updated, time.time() - start_time)
+
+        if len(materials) < chunk_size:
+            break
+
+    elapsed = time.time() - start_time
+    return {
+        'processed': processed,
+        'updated': updated,
+        'elapsed': elapsed,
+        'rows_per_sec': processed / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def rejudge_pk_range(start_pk, end_pk, dry_run=False):
+    """重新判定主键闭区间内的原料记录，供多进程模式的工作进程调用"""
+    queryset = RawMaterial.objects.filter(pk__gte=start_pk, pk__lte=end_pk)
+    return rejudge_queryset(queryset, chunk_size=end_pk - start_pk + 1, dry_run=dry_run)
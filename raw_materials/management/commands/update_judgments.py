@@ -1,7 +1,9 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from core.parallel import run_chunks
+from raw_materials.judgment import rejudge_pk_range, rejudge_queryset
 from raw_materials.models import RawMaterial
-import time
 
 class Command(BaseCommand):
     help = '批量更新原料记录的判定结果'
@@ -18,60 +20,83 @@ class Command(BaseCommand):
             action='store_true',
             help='试运行，不实际保存更改'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='并行工作进程数，大于1时按主键范围分块并行判定，默认为1'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='从上次中断时最后一个已提交的块继续'
+        )
 
     def handle(self, *args, **options):
         batch_size = options['batch_size']
         dry_run = options['dry_run']
+        workers = options['workers']
+        resume = options['resume']
         
-        # 获取所有需要更新的原料记录
-        materials = RawMaterial.objects.all()
-        total_count = materials.count()
-        
-        self.stdout.write(
-            self.style.SUCCESS(f'找到 {total_count} 条原料记录需要更新判定结果')
-        )
+        if workers < 1:
+            raise CommandError('--workers 必须大于等于1')
         
         if dry_run:
             self.stdout.write(
                 self.style.WARNING('试运行模式：不会实际保存更改')
             )
         
-        updated_count = 0
-        start_time = time.time()
+        def report_progress(processed, total, updated, elapsed):
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'已处理 {processed}/{total} 条记录 '
+                    f'({processed / total * 100:.1f}%), '
+                    f'判定变化 {updated} 条, '
+                    f'耗时: {elapsed:.2f}秒'
+                )
+            )
         
-        # 使用事务确保数据一致性
-        with transaction.atomic():
-            for i, material in enumerate(materials):
-                # 调用save方法会自动触发calculate_judgment()
-                if not dry_run:
-                    material.save()
-                
-                updated_count += 1
-                
-                # 每处理100条记录输出一次进度
-                if (i + 1) % 100 == 0:
-                    elapsed_time = time.time() - start_time
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'已处理 {i + 1}/{total_count} 条记录 '
-                            f'({(i + 1) / total_count * 100:.1f}%), '
-                            f'耗时: {elapsed_time:.2f}秒'
-                        )
-                    )
+        def report_chunk_progress(completed, total_chunks, processed, updated, elapsed):
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'已完成 {completed}/{total_chunks} 块, '
+                    f'处理 {processed} 条记录, '
+                    f'判定变化 {updated} 条, '
+                    f'合计速度: {rate:.0f} 条/秒'
+                )
+            )
         
-        elapsed_time = time.time() - start_time
+        if workers > 1 or resume:
+            # 按主键范围分块并行判定，每块单独提交，中断后可用 --resume 继续
+            result = run_chunks(
+                'update_judgments' + ('_dry_run' if dry_run else ''),
+                RawMaterial.objects.all(),
+                partial(rejudge_pk_range, dry_run=dry_run),
+                chunk_size=batch_size,
+                workers=workers,
+                resume=resume,
+                progress=report_chunk_progress,
+            )
+            if result['resumed_chunks']:
+                self.stdout.write(
+                    self.style.WARNING(f'从检查点继续，跳过已提交的 {result["resumed_chunks"]} 块')
+                )
+        else:
+            # 同一原料的标准矩阵只加载一次，判定结果有变化的记录才写回
+            result = rejudge_queryset(chunk_size=batch_size, dry_run=dry_run, progress=report_progress)
         
         if dry_run:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'试运行完成：将更新 {updated_count} 条记录 '
-                    f'(耗时: {elapsed_time:.2f}秒)'
+                    f'试运行完成：共处理 {result["processed"]} 条记录，将更新 {result["updated"]} 条 '
+                    f'(耗时: {result["elapsed"]:.2f}秒, 速度: {result["rows_per_sec"]:.0f} 条/秒)'
                 )
             )
         else:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f'成功更新 {updated_count} 条原料记录的判定结果 '
-                    f'(耗时: {elapsed_time:.2f}秒)'
+                    f'成功更新 {result["updated"]} 条原料记录的判定结果，共处理 {result["processed"]} 条 '
+                    f'(耗时: {result["elapsed"]:.2f}秒, 速度: {result["rows_per_sec"]:.0f} 条/秒)'
                 )
             )
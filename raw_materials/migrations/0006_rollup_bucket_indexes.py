@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('raw_materials', '0005_remove_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rawmaterial',
+            index=models.Index(fields=['material_name', 'supplier', 'test_date'], name='material_rollup_bucket_idx'),
+        ),
+    ]
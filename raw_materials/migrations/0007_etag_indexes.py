@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('raw_materials', '0006_rollup_bucket_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rawmaterial',
+            index=models.Index(fields=['material_name', 'updated_at'], name='material_name_updated_idx'),
+        ),
+    ]
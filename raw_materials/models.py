@@ -2,8 +2,11 @@ from django.db import models
 from django.utils import timezone
 import json
 
+from core.schema import get_family
+from core.tracking import TrackedModelMixin
 
-class RawMaterialStandard(models.Model):
+
+class RawMaterialStandard(TrackedModelMixin, models.Model):
     """原料标准模型"""
     STANDARD_TYPE_CHOICES = [
         ('external_control', '外控标准'),
@@ -45,7 +48,7 @@ class RawMaterialStandard(models.Model):
         return f"{self.material_name} - {self.get_test_item_display()} - {self.get_standard_type_display()}"
 
 
-class RawMaterial(models.Model):
+class RawMaterial(TrackedModelMixin, models.Model):
     """原料模型"""
     SAMPLE_CATEGORY_CHOICES = [
         ('来料', '来料'),
@@ -97,17 +100,31 @@ class RawMaterial(models.Model):
         verbose_name = '原料'
         verbose_name_plural = '原料'
         ordering = ['-test_date', 'material_batch']
+        indexes = [
+            # 每日汇总按 (原料名称, 供应商, 日期) 分组加锁读取
+            models.Index(fields=['material_name', 'supplier', 'test_date'], name='material_rollup_bucket_idx'),
+            # 按原料名称的条件请求用 max(updated_at) 生成 ETag
+            models.Index(fields=['material_name', 'updated_at'], name='material_name_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.material_name} - {self.material_batch}"
     
-    def calculate_judgment(self):
-        """自动计算原料判定结果"""
+    def calculate_judgment(self, matrix=None):
+        """自动计算原料判定结果
+        
+        matrix 为预先加载的 RawMaterialStandardMatrix，批量判定同一原料时可复用；
+        未提供时查询一次数据库加载。
+        """
+        from .standards import RawMaterialStandardMatrix
+        
         if not self.material_name:
             return
         
-        # 获取该原料的所有标准
-        standards = RawMaterialStandard.objects.filter(material_name=self.material_name)
+        # 获取该原料对当前供应商适用的标准
+        if matrix is None or matrix.material_name != self.material_name:
+            matrix = RawMaterialStandardMatrix.load(self.material_name)
+        standards = matrix.applicable(self.supplier)
         if not standards:
             self.judgment_status = '待判定'
             self.final_judgment = '无标准数据'
@@ -119,24 +136,14 @@ class RawMaterial(models.Model):
         has_judgment = False
         
         # 检查每个检测项目
-        test_fields = [
-            ('appearance', '外观'),
-            ('purity', '纯度'),
-            ('peak_position', '出峰位置'),
-            ('inhibitor_content', '阻聚剂含量'),
-            ('moisture_content', '水分含量'),
-            ('color', '色度'),
-            ('ethanol_content', '乙醇含量'),
-            ('acidity', '酸度'),
-        ]
-        
-        for field_name, field_label in test_fields:
+        for item in get_family('raw_material').items:
+            field_name, field_label = item.column, item.label
             value = getattr(self, field_name)
             if value is not None and value != "":
                 has_judgment = True
                 # 查找对应的标准
-                field_standards = standards.filter(test_item=field_name)
-                if field_standards.exists():
+                field_standards = standards.get(field_name)
+                if field_standards:
                     passed = True
                     reasons = []
                     
@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core import rollup
+from core.cache import invalidate
+from core.rejudge import schedule_rejudge
+from .models import RawMaterial, RawMaterialStandard
+from .standards import normalize_supplier
+
+
+@receiver(pre_save, sender=RawMaterialStandard)
+def remember_previous_scope(sender, instance, **kwargs):
+    """记录修改前的原料名称和供应商，修改后新旧范围都需要重新判定"""
+    instance._previous_scope = None
+    if instance.pk:
+        original = instance.get_original_values(['material_name', 'supplier'])
+        if original:
+            instance._previous_scope = (original['material_name'], normalize_supplier(original['supplier']))
+
+
+@receiver([post_save, post_delete], sender=RawMaterialStandard)
+def schedule_raw_material_rejudge(sender, instance, **kwargs):
+    """原料标准变更提交后，重新判定受影响的原料记录
+
+    供应商专用标准只影响该供应商的记录，通用标准（供应商为空）影响该原料的全部记录。
+    """
+    scopes = {(instance.material_name, normalize_supplier(instance.supplier)), getattr(instance, '_previous_scope', None)}
+    for scope in scopes - {None}:
+        transaction.on_commit(lambda key=tuple(scope): schedule_rejudge('raw_material', key))
+
+
+@receiver(pre_save, sender=RawMaterial)
+def remember_previous_material_name(sender, instance, **kwargs):
+    """记录修改前的原料名称和每日汇总分组，修改后新旧范围的缓存和汇总都需要更新"""
+    instance._previous_material_name = None
+    if instance.pk:
+        instance._previous_material_name = instance.get_original_value('material_name')
+    instance._previous_rollup_bucket = rollup.original_bucket_of('raw_material', instance)
+
+
+@receiver([post_save, post_delete], sender=RawMaterial)
+@receiver([post_save, post_delete], sender=RawMaterialStandard)
+def invalidate_raw_material_cache(sender, instance, **kwargs):
+    """原料或原料标准变更后，使相关原料的SPC接口缓存失效"""
+    previous_scope = getattr(instance, '_previous_scope', None)
+    invalidate('raw_material', {
+        instance.material_name,
+        getattr(instance, '_previous_material_name', None),
+        previous_scope[0] if previous_scope else None,
+    })
+
+
+@receiver([post_save, post_delete], sender=RawMaterial)
+def refresh_raw_material_rollups(sender, instance, **kwargs):
+    """在保存或删除记录的同一事务中重算修改前后所在分组的每日汇总"""
+    rollup.refresh_buckets('raw_material', [
+        rollup.bucket_of('raw_material', instance), getattr(instance, '_previous_rollup_bucket', None),
+    ])
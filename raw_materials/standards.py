@@ -0,0 +1,68 @@
+"""原料标准矩阵 - 一次加载某原料的全部标准，按 检测项目 × 标准类型 × 供应商 组织
+
+供应商回退顺序：优先使用与原料供应商一致（去除首尾空白后比较）的标准，没有时使用未指定供应商的通用标准；
+其他供应商的专用标准不参与判定。
+"""
+
+from collections import defaultdict
+
+from .models import RawMaterialStandard
+
+# 同一检测项目下各标准类型的判定顺序
+STANDARD_TYPE_ORDER = [code for code, _ in RawMaterialStandard.STANDARD_TYPE_CHOICES]
+
+# 未指定供应商的通用标准
+GENERIC_SUPPLIER = ''
+
+
+def normalize_supplier(supplier):
+    """供应商名称去除首尾空白；标准匹配和按供应商重新判定时都使用此规则"""
+    return (supplier or '').strip()
+
+
+class RawMaterialStandardMatrix:
+    """单个原料的标准矩阵"""
+
+    def __init__(self, material_name, standards):
+        self.material_name = material_name
+        # (test_item, standard_type) -> {supplier: standard}
+        self._cells = defaultdict(dict)
+        for standard in standards:
+            supplier = normalize_supplier(standard.supplier)
+            self._cells[(standard.test_item, standard.standard_type)][supplier] = standard
+
+    @classmethod
+    def load(cls, material_name):
+        """查询一次数据库，加载单个原料的标准矩阵"""
+        return cls.load_many([material_name])[material_name]
+
+    @classmethod
+    def load_many(cls, material_names):
+        """查询一次数据库，加载多个原料的标准矩阵"""
+        material_names = set(material_names)
+        grouped = defaultdict(list)
+        for standard in RawMaterialStandard.objects.filter(material_name__in=material_names).order_by('pk'):
+            grouped[standard.material_name].append(standard)
+        return {name: cls(name, grouped.get(name, [])) for name in material_names}
+
+    def __bool__(self):
+        return bool(self._cells)
+
+    def resolve(self, test_item, supplier):
+        """按标准类型顺序返回某检测项目对该供应商适用的标准"""
+        supplier = normalize_supplier(supplier)
+        resolved = []
+        for standard_type in STANDARD_TYPE_ORDER:
+            by_supplier = self._cells.get((test_item, standard_type))
+            if not by_supplier:
+                continue
+            standard = by_supplier.get(supplier) or by_supplier.get(GENERIC_SUPPLIER)
+            if standard is not None:
+                resolved.append(standard)
+        return resolved
+
+    def applicable(self, supplier):
+        """该供应商适用的全部标准：{test_item: [standard, ...]}"""
+        test_items = {test_item for test_item, _ in self._cells}
+        resolved = {test_item: self.resolve(test_item, supplier) for test_item in test_items}
+        return {test_item: standards for test_item, standards in resolved.items() if standards}
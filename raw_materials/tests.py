@@ -1,3 +1,261 @@
-from django.test import TestCase
+import datetime
+import json
 
-# Create your tests here.
+import numpy as np
+from scipy import stats
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core import rollup
+from dashboard.models import DailyRollup
+from .judgment import rejudge_queryset
+from .models import RawMaterial, RawMaterialStandard
+
+
+class RawMaterialJudgmentTests(TestCase):
+
+    def setUp(self):
+        RawMaterialStandard.objects.create(
+            material_name='丙烯酸', test_item='purity', standard_type='internal_control',
+            lower_limit=99.0, upper_limit=100.0
+        )
+        RawMaterialStandard.objects.create(
+            material_name='丙烯酸', test_item='purity', standard_type='internal_control',
+            supplier='供应商A', lower_limit=98.0, upper_limit=100.0
+        )
+        RawMaterialStandard.objects.create(
+            material_name='丙烯酸', test_item='moisture_content', standard_type='external_control',
+            supplier='供应商B', upper_limit=0.1
+        )
+
+    def make_material(self, supplier, batch, **values):
+        return RawMaterial(
+            material_name='丙烯酸', material_batch=batch, inspector='t',
+            sample_category='来料', test_date=timezone.now().date(),
+            supplier=supplier, modified_by='test', **values
+        )
+
+    def test_supplier_standard_takes_precedence(self):
+        """供应商专用标准优先于通用标准"""
+        material = self.make_material('供应商A', 'A001', purity=98.5)
+        material.calculate_judgment()
+        self.assertEqual(material.final_judgment, '合格')
+
+        material = self.make_material('供应商C', 'C001', purity=98.5)
+        material.calculate_judgment()
+        self.assertEqual(material.final_judgment, '不合格')
+
+    def test_other_supplier_standard_is_ignored(self):
+        """其他供应商的专用标准不参与判定"""
+        material = self.make_material('供应商A', 'A002', purity=99.5, moisture_content=0.5)
+        material.calculate_judgment()
+        self.assertEqual(material.final_judgment, '合格')
+        self.assertEqual([result['field'] for result in material.judgment_details['results']], ['purity'])
+
+    @override_settings(REJUDGE_ASYNC=False)
+    def test_supplier_standard_change_rejudges_padded_supplier(self):
+        """供应商名称带首尾空白的记录与标准匹配一致，供应商标准修改后也会重新判定"""
+        material = self.make_material(' 供应商A ', 'A003', purity=98.5)
+        material.save()
+        self.assertEqual(RawMaterial.objects.get(pk=material.pk).final_judgment, '合格')
+
+        standard = RawMaterialStandard.objects.get(supplier='供应商A')
+        with self.captureOnCommitCallbacks(execute=True):
+            standard.supplier = '供应商A  '
+            standard.lower_limit = 99.0
+            standard.save()
+        self.assertEqual(RawMaterial.objects.get(pk=material.pk).final_judgment, '不合格')
+
+    def test_judgment_uses_single_query(self):
+        """一次判定只查询一次标准"""
+        material = self.make_material('供应商B', 'B001', purity=99.5, moisture_content=0.5)
+        with self.assertNumQueries(1):
+            material.calculate_judgment()
+        self.assertEqual(material.final_judgment, '不合格')
+
+    def test_rejudge_reuses_matrix_per_material(self):
+        """批量判定同一原料时标准矩阵只加载一次"""
+        for i in range(5):
+            self.make_material('供应商A', f'A1{i}', purity=98.5).save()
+        RawMaterial.objects.update(final_judgment='')
+
+        # 计数、读取记录、加载标准矩阵、事务内批量更新，以及重算每日汇总（保存点、删除、聚合、写入、释放）
+        with self.assertNumQueries(11):
+            result = rejudge_queryset()
+        self.assertEqual(result['updated'], 5)
+
+    def test_ingest_reports_duplicate_batch_conflict(self):
+        """原料批号对应多条记录时导入报告冲突，其余行正常判定"""
+        self.make_material('供应商A', 'DUP', purity=99.5).save()
+        self.make_material('供应商B', 'DUP', purity=99.5).save()
+        body = '\n'.join(json.dumps({
+            'material_name': '丙烯酸', 'material_batch': batch, 'inspector': 't',
+            'sample_category': '来料', 'test_date': '2024-05-01', 'supplier': '供应商A', 'purity': 98.5,
+        }, ensure_ascii=False) for batch in ['DUP', 'NEW'])
+
+        user = User.objects.create_user('importer', password='x')
+        user.user_permissions.add(*Permission.objects.filter(
+            content_type__app_label='raw_materials', codename__in=['add_rawmaterial', 'change_rawmaterial']
+        ))
+        self.client.force_login(user)
+        response = self.client.post('/core/api/ingest/raw_material/', body, content_type='application/x-ndjson')
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['conflict', 'created'])
+        self.assertEqual(RawMaterial.objects.get(material_batch='NEW').final_judgment, '合格')
+
+    def test_comparison_cache_invalidated_per_material(self):
+        """原料记录变更只使该原料的对比分析缓存失效"""
+        cache.clear()
+        material = self.make_material('供应商A', 'A100', purity=99.5)
+        material.save()
+        url = '/raw-materials/api/comparison/'
+        self.assertEqual(self.client.get(url, {'material_name': '丙烯酸'})['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, {'material_name': '甲苯'})['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, {'material_name': '丙烯酸'})['X-Cache'], 'HIT')
+
+        material.purity = 99.8
+        material.save()
+        response = self.client.get(url, {'material_name': '丙烯酸'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['comparison_data']['丙烯酸']['data'][0]['value'], 99.8)
+        self.assertEqual(self.client.get(url, {'material_name': '甲苯'})['X-Cache'], 'HIT')
+
+    def test_stats_read_from_rollups(self):
+        """统计接口从每日汇总读取，结果与原料记录一致"""
+        cache.clear()
+        self.make_material('供应商A', 'A200', purity=99.5).save()
+        self.make_material('供应商B', 'B200', purity=98.0, moisture_content=0.5).save()
+
+        data = self.client.get('/raw-materials/api/stats/').json()
+        self.assertEqual(data['total_stats'], {'total': 2, 'qualified': 1, 'unqualified': 1, 'pending': 0})
+        self.assertEqual([row['supplier'] for row in data['supplier_stats']], ['供应商A', '供应商B'])
+        self.assertEqual(data['material_stats'][0]['material_name'], '丙烯酸')
+        self.assertAlmostEqual(data['quality_stats']['purity']['avg'], 98.75)
+        self.assertEqual(data['quality_stats']['moisture_content']['count'], 1)
+
+    def test_stats_snapshot_without_rollups(self):
+        """汇总表还没有原料数据时，统计快照直接聚合原料记录，结果与汇总表相同"""
+        self.make_material('供应商A', 'A300', purity=99.5).save()
+        self.make_material('供应商B', 'B300', purity=98.0, moisture_content=0.5).save()
+        expected = rollup.compute_stats_snapshot('raw_material')
+
+        DailyRollup.objects.filter(family='raw_material').delete()
+        with self.assertNumQueries(2):
+            # 汇总表查询为空，再条件聚合一次原料记录
+            self.assertEqual(rollup.compute_stats_snapshot('raw_material'), expected)
+        self.assertEqual(expected['total']['total'], 2)
+
+    def test_stats_snapshot_shared_and_invalidated(self):
+        """统计接口和仪表板共用一次查询得到的快照，原料写入后快照失效"""
+        cache.clear()
+        self.make_material('供应商A', 'A500', purity=99.5).save()
+
+        with self.assertNumQueries(1):
+            # 一次快照查询，ETag 由范围版本号生成
+            self.client.get('/raw-materials/api/stats/')
+        with self.assertNumQueries(0):
+            # 仪表板读取同一个已缓存的快照
+            snapshot = rollup.stats_snapshot('raw_material')
+        self.assertEqual(snapshot['total']['total'], 1)
+
+        self.make_material('供应商B', 'B500', purity=98.0).save()
+        data = self.client.get('/raw-materials/api/stats/').json()
+        self.assertEqual(data['total_stats']['total'], 2)
+        self.assertEqual(data['quality_stats']['purity']['count'], 2)
+
+    def test_charts_single_scan(self):
+        """图表分析一次查询取出全部检测项目，相关性与 scipy 一致"""
+        cache.clear()
+        purity = [99.1, 99.4, 98.7, 99.9, 99.2]
+        moisture = [0.05, 0.03, 0.08, 0.01, None]
+        for p, m in zip(purity, moisture):
+            self.make_material('供应商A', 'A300', purity=p, moisture_content=m).save()
+
+        url = '/raw-materials/api/charts/'
+        with self.assertNumQueries(1):
+            # 一次取数，ETag 由范围版本号生成
+            data = self.client.get(url, {'test_item': 'purity'}).json()
+        self.assertEqual(data['metadata']['total_samples'], 5)
+        self.assertEqual(sum(row['count'] for row in data['distribution']), 5)
+        self.assertEqual(data['quality_control']['sizes'], [5])
+        self.assertAlmostEqual(data['quality_control']['dispersion']['values'][0], 1.2)
+
+        r, p = stats.pearsonr(purity[:4], moisture[:4])
+        self.assertAlmostEqual(data['correlation']['moisture_content']['correlation'], r)
+        self.assertAlmostEqual(data['correlation']['moisture_content']['p_value'], p)
+        self.assertEqual(data['correlation']['moisture_content']['sample_size'], 4)
+        matrix = data['correlation_matrix']
+        i, j = matrix['fields'].index('purity'), matrix['fields'].index('moisture_content')
+        self.assertAlmostEqual(matrix['correlation'][j][i], r)
+
+        self.assertEqual(self.client.get(url, {'test_item': 'material_name'}).status_code, 400)
+
+    def test_charts_response_is_strict_json(self):
+        """整列为空的检测项目在相关性矩阵中输出为 null，响应是合法的 JSON"""
+        cache.clear()
+        for batch, (purity, moisture) in enumerate([(99.1, 0.05), (99.4, 0.03), (98.7, 0.08)]):
+            self.make_material('供应商A', f'A6{batch}', purity=purity, moisture_content=moisture).save()
+
+        response = self.client.get('/raw-materials/api/charts/', {'test_item': 'purity'})
+        self.assertEqual(response.status_code, 200)
+
+        def reject_constant(name):
+            raise ValueError(f'非法的 JSON 常量: {name}')
+
+        data = json.loads(response.content, parse_constant=reject_constant)
+        matrix = data['correlation_matrix']
+        color = matrix['fields'].index('color')
+        self.assertEqual(matrix['correlation'][color], [None] * len(matrix['fields']))
+        self.assertIsNone(matrix['p_value'][0][color])
+
+    def test_charts_without_usable_subgroups(self):
+        """按天划分子组且每天只有一个样本时省略控制图，其余图表数据照常返回"""
+        cache.clear()
+        for day, purity in enumerate([99.1, 99.4, 98.7]):
+            material = self.make_material('供应商A', f'A7{day}', purity=purity)
+            material.test_date = datetime.date(2024, 1, 1 + day)
+            material.save()
+
+        response = self.client.get('/raw-materials/api/charts/', {
+            'test_item': 'purity', 'subgroup_by': 'time', 'window': 'day',
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIsNone(data['quality_control'])
+        self.assertTrue(data['quality_control_error'])
+        self.assertEqual(len(data['time_series']), 3)
+        self.assertEqual(sum(row['count'] for row in data['distribution']), 3)
+
+    def test_comparison_grouped_statistics(self):
+        """对比分析一次算出各分组的统计量，有标准的分组都计算 Cp/Cpk"""
+        cache.clear()
+        purity_a = [99.2, 99.6, 99.4, 99.9]
+        purity_b = [98.5, 99.0]
+        for value in purity_a:
+            self.make_material('供应商A', 'A400', purity=value).save()
+        for value in purity_b:
+            self.make_material('供应商B', 'B400', purity=value).save()
+
+        url = '/raw-materials/api/comparison/'
+        data = self.client.get(url, {'test_item': 'purity'}).json()
+        summary = data['comparison_data']['丙烯酸']['stats']
+        self.assertEqual(summary['count'], 6)
+        self.assertAlmostEqual(summary['median'], float(np.median(purity_a + purity_b)))
+        self.assertAlmostEqual(summary['q1'], float(np.percentile(purity_a + purity_b, 25)))
+        self.assertIsNone(data['comparison_data']['丙烯酸']['supplier'])
+        # 未指定 material_name 也计算过程能力，多个供应商时使用通用标准
+        self.assertEqual(data['process_capability']['丙烯酸']['lsl'], 99.0)
+
+        data = self.client.get(url, {'test_item': 'purity', 'group_by': 'supplier'}).json()
+        self.assertEqual(list(data['comparison_data']), ['供应商A', '供应商B'])
+        self.assertAlmostEqual(data['comparison_data']['供应商B']['stats']['std'], float(np.std(purity_b)))
+        capability = data['process_capability']['供应商A']
+        self.assertEqual(capability['lsl'], 98.0)
+        std = float(np.std(purity_a))
+        self.assertAlmostEqual(capability['cp'], 2.0 / (6 * std))
+        self.assertAlmostEqual(capability['cpk'], (100.0 - float(np.mean(purity_a))) / (3 * std))
+
+        self.assertEqual(self.client.get(url, {'group_by': 'batch'}).status_code, 400)
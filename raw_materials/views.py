@@ -8,9 +8,13 @@ from django.db.models import Q, Count, Avg, Max, Min, StdDev
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
-import numpy as np
-from scipy import stats
 
+from core import rollup
+from core.cache import cached_api, param_keys, whole_scope
+from core.conditional import conditional_api
+from core.encoding import api_response
+from core.subgroup import parse_subgroup_options
+from .charts import build_chart_payload, build_comparison_payload
 from .models import RawMaterial, RawMaterialStandard
 
 
@@ -68,46 +72,42 @@ def raw_material_detail(request, pk):
     return render(request, 'raw_materials/detail.html', context)
 
 
+def _grouped_judgment_counts(rows, group_by, name):
+    """统计快照中按原料名称或供应商的判定统计，分组键改回原字段名"""
+    return [
+        {name: row[group_by], **{key: row[key] for key in ('total', 'qualified', 'unqualified', 'pending')}}
+        for row in rows
+    ]
+
+
 def raw_material_dashboard(request):
     """原料数据仪表板"""
-    # 统计基本信息
-    total_materials = RawMaterial.objects.count()
-    qualified_materials = RawMaterial.objects.filter(judgment_status='合格').count()
-    unqualified_materials = RawMaterial.objects.filter(judgment_status='不合格').count()
-    pending_materials = RawMaterial.objects.filter(judgment_status='待判定').count()
-    
-    # 按原料名称统计
-    material_stats = RawMaterial.objects.values('material_name').annotate(
-        total=Count('id'),
-        qualified=Count('id', filter=Q(judgment_status='合格')),
-        unqualified=Count('id', filter=Q(judgment_status='不合格')),
-        pending=Count('id', filter=Q(judgment_status='待判定'))
-    ).order_by('material_name')
-    
-    # 按供应商统计
-    supplier_stats = RawMaterial.objects.values('supplier').annotate(
-        total=Count('id'),
-        qualified=Count('id', filter=Q(judgment_status='合格')),
-        unqualified=Count('id', filter=Q(judgment_status='不合格')),
-        pending=Count('id', filter=Q(judgment_status='待判定'))
-    ).order_by('supplier')
-    
+    # 统计数据来自与统计接口共用的快照（从每日汇总表计算并缓存）
+    snapshot = rollup.stats_snapshot('raw_material')
+    total_stats = snapshot['total']
+    material_stats = _grouped_judgment_counts(snapshot['by_code'], 'code', 'material_name')
+    supplier_stats = _grouped_judgment_counts(snapshot['by_line'], 'line', 'supplier')
+
     # 最近30天的数据趋势
     thirty_days_ago = timezone.now().date() - timedelta(days=30)
-    daily_stats = RawMaterial.objects.filter(test_date__gte=thirty_days_ago).values('test_date').annotate(
-        total=Count('id'),
-        qualified=Count('id', filter=Q(judgment_status='合格')),
-        unqualified=Count('id', filter=Q(judgment_status='不合格'))
-    ).order_by('test_date')
-    
+    daily_stats = [
+        {
+            'test_date': row['period'],
+            'total': row['count'],
+            'qualified': row['pass_count'],
+            'unqualified': row['fail_count'],
+        }
+        for row in rollup.trend_series('raw_material', rollup.RECORD_ITEM, 'day', start_date=thirty_days_ago)
+    ]
+
     context = {
-        'total_materials': total_materials,
-        'qualified_materials': qualified_materials,
-        'unqualified_materials': unqualified_materials,
-        'pending_materials': pending_materials,
+        'total_materials': total_stats['total'],
+        'qualified_materials': total_stats['qualified'],
+        'unqualified_materials': total_stats['unqualified'],
+        'pending_materials': total_stats['pending'],
         'material_stats': material_stats,
         'supplier_stats': supplier_stats,
-        'daily_stats': list(daily_stats),
+        'daily_stats': daily_stats,
     }
     
     return render(request, 'raw_materials/dashboard.html', context)
@@ -140,7 +140,49 @@ def raw_material_standards(request):
     return render(request, 'raw_materials/standards.html', context)
 
 
+def _chart_queryset(request):
+    """图表分析的查询条件：原料名称和供应商模糊匹配"""
+    filters = {}
+    if request.GET.get('material_name'):
+        filters['material_name__icontains'] = request.GET['material_name']
+    if request.GET.get('supplier'):
+        filters['supplier__icontains'] = request.GET['supplier']
+    if request.GET.get('start_date'):
+        filters['test_date__gte'] = request.GET['start_date']
+    if request.GET.get('end_date'):
+        filters['test_date__lte'] = request.GET['end_date']
+    return RawMaterial.objects.filter(**filters)
+
+
+def _comparison_queryset(request):
+    """对比分析的查询条件：原料名称和供应商可以有多个值"""
+    filters = {}
+    if request.GET.getlist('material_name'):
+        filters['material_name__in'] = request.GET.getlist('material_name')
+    if request.GET.getlist('supplier'):
+        filters['supplier__in'] = request.GET.getlist('supplier')
+    if request.GET.get('start_date'):
+        filters['test_date__gte'] = request.GET['start_date']
+    if request.GET.get('end_date'):
+        filters['test_date__lte'] = request.GET['end_date']
+    return RawMaterial.objects.filter(**filters)
+
+
+def _all_materials(request, *args, **kwargs):
+    return RawMaterial.objects.all()
+
+
+def _material_detail_source(request, pk=None):
+    """单条原料只依赖该记录，列表依赖全部原料"""
+    return RawMaterial.objects.filter(pk=pk) if pk else RawMaterial.objects.all()
+
+
+def _standard_source(request, pk=None):
+    return RawMaterialStandard.objects.filter(pk=pk) if pk else RawMaterialStandard.objects.all()
+
+
 @method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(conditional_api(_material_detail_source, 'raw_material'), name='get')
 class RawMaterialAPIView(View):
     """原料API视图"""
     
@@ -288,6 +330,7 @@ class RawMaterialAPIView(View):
 
 
 @method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(conditional_api(_standard_source, 'raw_material'), name='get')
 class RawMaterialStandardAPIView(View):
     """原料标准API视图"""
     
@@ -406,266 +449,85 @@ class RawMaterialStandardAPIView(View):
 
 
 @require_http_methods(["GET"])
+@conditional_api(_all_materials, 'raw_material')
+@cached_api('raw_material', whole_scope)
 def raw_material_stats(request):
-    """原料统计API"""
-    # 总体统计
-    total_stats = {
-        'total': RawMaterial.objects.count(),
-        'qualified': RawMaterial.objects.filter(judgment_status='合格').count(),
-        'unqualified': RawMaterial.objects.filter(judgment_status='不合格').count(),
-        'pending': RawMaterial.objects.filter(judgment_status='待判定').count(),
-    }
-    
-    # 按原料名称统计
-    material_stats = RawMaterial.objects.values('material_name').annotate(
-        total=Count('id'),
-        qualified=Count('id', filter=Q(judgment_status='合格')),
-        unqualified=Count('id', filter=Q(judgment_status='不合格')),
-        pending=Count('id', filter=Q(judgment_status='待判定'))
-    ).order_by('material_name')
-    
-    # 按供应商统计
-    supplier_stats = RawMaterial.objects.values('supplier').annotate(
-        total=Count('id'),
-        qualified=Count('id', filter=Q(judgment_status='合格')),
-        unqualified=Count('id', filter=Q(judgment_status='不合格')),
-        pending=Count('id', filter=Q(judgment_status='待判定'))
-    ).order_by('supplier')
-    
-    # 质量数据统计
-    quality_stats = {}
-    for field in ['purity', 'peak_position', 'inhibitor_content', 
-                 'moisture_content', 'color', 'ethanol_content', 'acidity']:
-        stats = RawMaterial.objects.filter(**{f'{field}__isnull': False}).aggregate(
-            avg=Avg(field),
-            max=Max(field),
-            min=Min(field),
-            count=Count(field)
-        )
-        quality_stats[field] = stats
-    
+    """原料统计API（从每日汇总表的统计快照读取）"""
+    snapshot = rollup.stats_snapshot('raw_material')
     return JsonResponse({
-        'total_stats': total_stats,
-        'material_stats': list(material_stats),
-        'supplier_stats': list(supplier_stats),
-        'quality_stats': quality_stats,
+        'total_stats': snapshot['total'],
+        'material_stats': _grouped_judgment_counts(snapshot['by_code'], 'code', 'material_name'),
+        'supplier_stats': _grouped_judgment_counts(snapshot['by_line'], 'line', 'supplier'),
+        'quality_stats': snapshot['items'],
     })
 
 
 @require_http_methods(["GET"])
+@conditional_api(_chart_queryset, 'raw_material')
+@cached_api('raw_material', whole_scope)
 def raw_material_charts(request):
-    """原料图表分析API"""
+    """原料图表分析API，按 Accept 头返回 JSON 或 MessagePack
+
+    一次查询取出全部数值检测项目，时间趋势、控制图、分布和相关性都由 charts 模块
+    从同一个数组计算，correlation_matrix 为全部检测项目两两之间的相关系数矩阵。
+    控制图的子组划分参数见 core.subgroup.parse_subgroup_options。
+    """
     # 获取查询参数
     material_name = request.GET.get('material_name', '')
     supplier = request.GET.get('supplier', '')
     start_date = request.GET.get('start_date', '')
     end_date = request.GET.get('end_date', '')
     test_item = request.GET.get('test_item', 'purity')
-    
-    # 构建查询条件
-    filters = {}
-    if material_name:
-        filters['material_name__icontains'] = material_name
-    if supplier:
-        filters['supplier__icontains'] = supplier
-    if start_date:
-        filters['test_date__gte'] = start_date
-    if end_date:
-        filters['test_date__lte'] = end_date
-    
-    # 获取数据
-    materials = RawMaterial.objects.filter(**filters).order_by('test_date')
-    
-    # 时间趋势数据
-    time_series_data = []
-    for material in materials:
-        if getattr(material, test_item) is not None:
-            time_series_data.append({
-                'date': material.test_date.isoformat(),
-                'value': getattr(material, test_item),
-                'batch': material.material_batch,
-                'status': material.judgment_status
-            })
-    
-    # 质量控制图数据 (X-bar and R chart)
-    quality_control_data = []
-    if materials.exists() and test_item in ['purity', 'peak_position', 'inhibitor_content', 
-                                          'moisture_content', 'color', 'ethanol_content', 'acidity']:
-        # 按批次分组计算均值和极差
-        batch_groups = {}
-        for material in materials:
-            value = getattr(material, test_item)
-            if value is not None:
-                if material.material_batch not in batch_groups:
-                    batch_groups[material.material_batch] = []
-                batch_groups[material.material_batch].append(value)
-        
-        for batch, values in batch_groups.items():
-            if len(values) >= 3:  # 至少3个数据点才计算控制限
-                mean_val = np.mean(values)
-                range_val = max(values) - min(values)
-                quality_control_data.append({
-                    'batch': batch,
-                    'mean': mean_val,
-                    'range': range_val,
-                    'count': len(values)
-                })
-    
-    # 分布分析
-    distribution_data = []
-    values = [getattr(m, test_item) for m in materials if getattr(m, test_item) is not None]
-    if values:
-        hist, bin_edges = np.histogram(values, bins=10)
-        distribution_data = [{
-            'bin_start': float(bin_edges[i]),
-            'bin_end': float(bin_edges[i+1]),
-            'count': int(hist[i])
-        } for i in range(len(hist))]
-    
-    # 相关性分析（如果选择了数值型检测项目）
-    correlation_data = {}
-    numeric_fields = ['purity', 'peak_position', 'inhibitor_content', 
-                     'moisture_content', 'color', 'ethanol_content', 'acidity']
-    if test_item in numeric_fields:
-        for other_field in numeric_fields:
-            if other_field != test_item:
-                x_values = []
-                y_values = []
-                for material in materials:
-                    x_val = getattr(material, test_item)
-                    y_val = getattr(material, other_field)
-                    if x_val is not None and y_val is not None:
-                        x_values.append(x_val)
-                        y_values.append(y_val)
-                
-                if len(x_values) >= 2:
-                    correlation, p_value = stats.pearsonr(x_values, y_values)
-                    correlation_data[other_field] = {
-                        'correlation': float(correlation),
-                        'p_value': float(p_value),
-                        'sample_size': len(x_values)
-                    }
-    
-    return JsonResponse({
-        'time_series': time_series_data,
-        'quality_control': quality_control_data,
-        'distribution': distribution_data,
-        'correlation': correlation_data,
-        'metadata': {
-            'material_name': material_name,
-            'supplier': supplier,
-            'start_date': start_date,
-            'end_date': end_date,
-            'test_item': test_item,
-            'total_samples': len(time_series_data)
-        }
-    })
+
+    try:
+        payload = build_chart_payload(
+            _chart_queryset(request), test_item, parse_subgroup_options(request.GET)
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    payload['metadata'] = {
+        'material_name': material_name,
+        'supplier': supplier,
+        'start_date': start_date,
+        'end_date': end_date,
+        'test_item': test_item,
+        'total_samples': len(payload['time_series'])
+    }
+    return api_response(request, payload)
 
 
 @require_http_methods(["GET"])
+@conditional_api(_comparison_queryset, 'raw_material', param_keys('material_name'))
+@cached_api('raw_material', param_keys('material_name'))
 def raw_material_comparison(request):
-    """原料对比分析API"""
+    """原料对比分析API，group_by 为 material（默认）或 supplier"""
     # 获取查询参数
     material_names = request.GET.getlist('material_name')
     suppliers = request.GET.getlist('supplier')
     start_date = request.GET.get('start_date', '')
     end_date = request.GET.get('end_date', '')
     test_item = request.GET.get('test_item', 'purity')
-    
-    # 构建查询条件
-    filters = {}
-    if material_names:
-        filters['material_name__in'] = material_names
-    if suppliers:
-        filters['supplier__in'] = suppliers
-    if start_date:
-        filters['test_date__gte'] = start_date
-    if end_date:
-        filters['test_date__lte'] = end_date
-    
-    # 获取数据
-    materials = RawMaterial.objects.filter(**filters).order_by('material_name', 'test_date')
-    
-    # 按原料名称分组
-    comparison_data = {}
-    for material in materials:
-        value = getattr(material, test_item)
-        if value is not None:
-            if material.material_name not in comparison_data:
-                comparison_data[material.material_name] = {
-                    'supplier': material.supplier,
-                    'data': [],
-                    'stats': {}
-                }
-            comparison_data[material.material_name]['data'].append({
-                'date': material.test_date.isoformat(),
-                'value': value,
-                'batch': material.material_batch,
-                'status': material.judgment_status
-            })
-    
-    # 计算统计信息
-    for material_name, data_dict in comparison_data.items():
-        values = [item['value'] for item in data_dict['data']]
-        if values:
-            data_dict['stats'] = {
-                'count': len(values),
-                'mean': float(np.mean(values)),
-                'std': float(np.std(values)),
-                'min': float(min(values)),
-                'max': float(max(values)),
-                'median': float(np.median(values)),
-                'q1': float(np.percentile(values, 25)),
-                'q3': float(np.percentile(values, 75))
-            }
-    
-    # 计算过程能力指数 (Cp, Cpk)
-    process_capability = {}
-    standards = RawMaterialStandard.objects.filter(
-        material_name__in=material_names if material_names else [],
-        test_item=test_item
-    )
-    
-    for standard in standards:
-        if standard.material_name in comparison_data:
-            values = [item['value'] for item in comparison_data[standard.material_name]['data']]
-            if values and standard.lower_limit is not None and standard.upper_limit is not None:
-                usl = standard.upper_limit
-                lsl = standard.lower_limit
-                mean_val = np.mean(values)
-                std_val = np.std(values)
-                
-                if std_val > 0:
-                    cp = (usl - lsl) / (6 * std_val)
-                    cpu = (usl - mean_val) / (3 * std_val)
-                    cpl = (mean_val - lsl) / (3 * std_val)
-                    cpk = min(cpu, cpl)
-                    
-                    process_capability[standard.material_name] = {
-                        'cp': float(cp),
-                        'cpk': float(cpk),
-                        'cpu': float(cpu),
-                        'cpl': float(cpl),
-                        'usl': usl,
-                        'lsl': lsl,
-                        'mean': float(mean_val),
-                        'std': float(std_val)
-                    }
-    
-    return JsonResponse({
-        'comparison_data': comparison_data,
-        'process_capability': process_capability,
-        'metadata': {
-            'material_names': material_names,
-            'suppliers': suppliers,
-            'start_date': start_date,
-            'end_date': end_date,
-            'test_item': test_item
-        }
-    })
+    group_by = request.GET.get('group_by', 'material')
+
+    try:
+        payload = build_comparison_payload(_comparison_queryset(request), test_item, group_by)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    payload['metadata'] = {
+        'material_names': material_names,
+        'suppliers': suppliers,
+        'start_date': start_date,
+        'end_date': end_date,
+        'test_item': test_item,
+        'group_by': group_by
+    }
+    return JsonResponse(payload)
 
 
 @require_http_methods(["GET"])
+@conditional_api(_all_materials, 'raw_material')
 def raw_material_options(request):
     """获取原料名称选项API"""
     # 获取所有不重复的原料名称
@@ -677,6 +539,7 @@ def raw_material_options(request):
 
 
 @require_http_methods(["GET"])
+@conditional_api(_all_materials, 'raw_material')
 def supplier_options(request):
     """获取供应商选项API"""
     # 获取所有不重复的供应商
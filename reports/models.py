@@ -1,7 +1,9 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 import json
-from products.models import DryFilmProduct, AdhesiveProduct, ProductStandard
+from products.models import DryFilmProduct, AdhesiveProduct
+from products.standards import get_standards_index
+from core.schema import get_family
 
 class InspectionReport(models.Model):
     """检测报告模型"""
@@ -36,6 +38,7 @@ class InspectionReport(models.Model):
     # 状态管理
     status = models.CharField(max_length=20, default='draft', verbose_name="报告状态", 
                              choices=[('draft', '草稿'), ('published', '已发布')])
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
     
     class Meta:
         verbose_name = "检测报告"
@@ -103,8 +106,9 @@ class InspectionReport(models.Model):
             else:
                 return
             
-            # 获取产品标准
-            standards = ProductStandard.objects.filter(product_code=self.product_code)
+            # 获取产品标准（内存索引）
+            standards_index = get_standards_index()
+            family = get_family(self.report_type)
             
             # 遍历用户选择的检测项目
             for selected_item in self.selected_items:
@@ -120,14 +124,16 @@ class InspectionReport(models.Model):
                 else:
                     continue
                 
-                if not item_name:
+                # 只处理注册表中的检测项目
+                item = family.get(item_name)
+                if item is None:
                     continue
                 
                 # 获取检测值
-                test_value = getattr(product, item_name, None)
+                test_value = getattr(product, item.column)
                 
                 # 获取标准信息
-                standard = standards.filter(test_item=item_name).first()
+                standard = standards_index.first_for_item(self.product_code, item_name)
                 
                 result = {
                     'test_item': item_name,
@@ -175,3 +175,16 @@ class InspectionReportTests(TestCase):
         item_names = [item['name'] for item in response_data['available_items']]
         self.assertIn('solid_content', item_names)
         self.assertIn('viscosity', item_names)
+
+    def test_item_without_standard_has_blank_unit(self):
+        """没有产品标准的检测项目单位为空，不使用默认单位"""
+        self.client.login(username='testuser', password='testpass123')
+
+        response = self.client.get(
+            '/reports/get-batch-info/',
+            {'report_type': 'dryfilm', 'batch_number': 'BATCH001'}
+        )
+        units = {item['name']: item['unit'] for item in response.json()['available_items']}
+        self.assertEqual(units['solid_content'], '%')
+        self.assertEqual(units['moisture'], '')
+        self.assertEqual(units['conversion_rate'], '')
@@ -10,6 +10,8 @@ import json
 
 from .models import InspectionReport
 from products.models import DryFilmProduct, AdhesiveProduct, ProductStandard
+from core.conditional import conditional_api
+from core.schema import get_family, report_label
 
 @login_required
 def report_list(request):
@@ -91,58 +93,24 @@ def get_batch_info(request):
         else:
             return JsonResponse({'error': '无效的报告类型'})
         
-        # 获取可用的检测项目 - 从产品模型的所有字段中获取
-        if report_type == 'dryfilm':
-            # DryFilmProduct模型的所有检测项目字段
-            dryfilm_fields = [
-                'appearance', 'solid_content', 'viscosity', 'acid_value', 'moisture',
-                'residual_monomer', 'weight_avg_molecular_weight', 'pdi', 'color',
-                'polymerization_inhibitor', 'conversion_rate', 'loading_temperature',
-                'dispersion', 'stability'
-            ]
-            available_items = []
-            
-            # 首先从ProductStandard获取有标准定义的项目
-            standards = ProductStandard.objects.filter(product_code=product_info['product_code'])
-            standard_items = {standard.test_item: standard for standard in standards}
-            
-            for field_name in dryfilm_fields:
-                standard = standard_items.get(field_name)
-                available_items.append({
-                    'name': field_name,
-                    'name_chinese': TEST_ITEM_MAPPING.get(field_name, field_name),
-                    'test_condition': standard.test_condition if standard else '',
-                    'unit': standard.unit if standard else '',
-                    'lower_limit': standard.lower_limit if standard else None,
-                    'upper_limit': standard.upper_limit if standard else None,
-                    'analysis_method': standard.analysis_method if standard else ''
-                })
-                
-        elif report_type == 'adhesive':
-            # AdhesiveProduct模型的所有检测项目字段
-            adhesive_fields = [
-                'appearance', 'solid_content', 'viscosity', 'acid_value', 'moisture',
-                'residual_monomer', 'weight_avg_molecular_weight', 'pdi', 'color',
-                'initial_tack', 'peel_strength', 'high_temperature_holding',
-                'room_temperature_holding', 'constant_load_peel', 'tape_structure'
-            ]
-            available_items = []
-            
-            # 首先从ProductStandard获取有标准定义的项目
-            standards = ProductStandard.objects.filter(product_code=product_info['product_code'])
-            standard_items = {standard.test_item: standard for standard in standards}
-            
-            for field_name in adhesive_fields:
-                standard = standard_items.get(field_name)
-                available_items.append({
-                    'name': field_name,
-                    'name_chinese': TEST_ITEM_MAPPING.get(field_name, field_name),
-                    'test_condition': standard.test_condition if standard else '',
-                    'unit': standard.unit if standard else '',
-                    'lower_limit': standard.lower_limit if standard else None,
-                    'upper_limit': standard.upper_limit if standard else None,
-                    'analysis_method': standard.analysis_method if standard else ''
-                })
+        # 获取可用的检测项目 - 从检测项目注册表中获取
+        available_items = []
+
+        # 首先从ProductStandard获取有标准定义的项目
+        standards = ProductStandard.objects.filter(product_code=product_info['product_code'])
+        standard_items = {standard.test_item: standard for standard in standards}
+
+        for item in get_family(report_type).items:
+            standard = standard_items.get(item.name)
+            available_items.append({
+                'name': item.name,
+                'name_chinese': item.report_label,
+                'test_condition': standard.test_condition if standard else '',
+                'unit': standard.unit if standard else '',
+                'lower_limit': standard.lower_limit if standard else None,
+                'upper_limit': standard.upper_limit if standard else None,
+                'analysis_method': standard.analysis_method if standard else ''
+            })
         
         return JsonResponse({
             'success': True,
@@ -170,7 +138,7 @@ def report_detail(request, report_id):
             
         processed_result = result.copy()
         # 转换项目名称为中文
-        processed_result['test_item_chinese'] = TEST_ITEM_MAPPING.get(test_item, test_item)
+        processed_result['test_item_chinese'] = report_label(test_item)
         processed_results.append(processed_result)
     
     return render(request, 'reports/report_detail.html', {
@@ -178,32 +146,6 @@ def report_detail(request, report_id):
         'processed_results': processed_results  # 传递处理后的结果
     })
 
-# 检测项目中英文映射
-TEST_ITEM_MAPPING = {
-    # 产品检测项目
-    'appearance': '外观',
-    'solid_content': '固含',
-    'viscosity': '粘度',
-    'acid_value': '酸值',
-    'moisture': '水分',
-    'residual_monomer': '残单',
-    'weight_avg_molecular_weight': '重均分子量',
-    'pdi': 'PDI',
-    'color': '色度',
-    'initial_tack': '初粘力',
-    'peel_strength': '剥离力',
-    'high_temperature_holding': '高温持粘',
-    'room_temperature_holding': '常温持粘',
-    'constant_load_peel': '定荷重剥离',
-    'dispersion': '分散性',
-    'stability': '稳定性',
-    'tape_structure': '胶带结构',
-    # 新增字段映射
-    'polymerization_inhibitor': '阻聚剂',
-    'conversion_rate': '转化率',
-    'loading_temperature': '装车温度',
-}
-
 @login_required
 def generate_pdf(request, report_id):
     """生成PDF报告"""
@@ -239,7 +181,7 @@ def generate_pdf(request, report_id):
             
         processed_result = result.copy()
         # 转换项目名称为中文
-        processed_result['test_item_chinese'] = TEST_ITEM_MAPPING.get(test_item, test_item)
+        processed_result['test_item_chinese'] = report_label(test_item)
         processed_results.append(processed_result)
     
     # 获取对应报告类型的版本号
@@ -344,7 +286,11 @@ def delete_report(request, report_id):
     
     return JsonResponse({'error': '无效的请求方法'})
 
+def _report_source(request, report_id):
+    return InspectionReport.objects.filter(id=report_id)
+
 @login_required
+@conditional_api(_report_source)
 def get_report_data(request, report_id):
     """获取报告数据（API接口）"""
     report = get_object_or_404(InspectionReport, id=report_id)